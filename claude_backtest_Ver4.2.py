@@ -6,34 +6,37 @@ Ver3.0~4.0: (이전 변경 이력 생략)
 Ver4.2: 백테스트 신뢰성 개선
         ① 윈저화 순서 수정 (결측대체 → 윈저화)
         ② Purged CV 엠바고 (훈련/예측 간 21일 gap으로 데이터 누수 차단)
-        ③ RF 하이퍼파라미터 자동 튜닝 (GridSearchCV)
+        ③ RF 하이퍼파라미터 자동 튜닝 (날짜 그룹 Purged CV + Successive Halving)
         ④ 턴오버 버퍼존 옵션 (보유 종목 가산점으로 불필요한 교체 방지)
         ⑤ 역변동성 가중 옵션 (변동성 역수 비중 → MDD 축소)
+Streamlit UI — 데이터·피처·PIT·백테스트·성과 지표 엔진은 quant_engine.py
 """
 
 import streamlit as st
 import pandas as pd
 import numpy as np
-import yfinance as yf
 import plotly.graph_objects as go
 import plotly.express as px
-from plotly.subplots import make_subplots
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.impute import SimpleImputer
-from sklearn.model_selection import GridSearchCV
-from scipy.stats import spearmanr
-from xgboost import XGBRegressor
-from lightgbm import LGBMRegressor
-import requests
-from io import StringIO
 import warnings
-import concurrent.futures
 import time
-import random
 import os
-import calendar
+import json
 from datetime import datetime, timedelta
 
+import quant_engine as engine
+from quant_engine import (
+    BENCHMARKS, CHECKPOINT_DIR, FEATURE_META, FEAT_NAMES,
+    MODEL_STORE_DIR, PORTFOLIO_KEYS, PRICE_STORE_DIR, SWEEP_DEFAULTS,
+    build_daily_portfolio, build_pit_tables, build_price_panel,
+    build_snapshot_df, cached_stage, cached_ticker_stage, calc_metrics,
+    calc_panel_technical, detect_cpu_budget, enrich_snapshot, extend_price_panel,
+    fingerprint, frame_fingerprint, generate_rebalance_dates, init_tech_state, load_backtest_state,
+    load_price_history, load_tech_states, norm_series, panel_asof, portfolio_only_change,
+    prune_pipeline_cache, read_price_store, resimulate_backtest, run_backtest,
+    save_backtest_state, save_tech_states, stage_fingerprint, sweep_portfolio,
+    tech_state_source, update_price_store, update_tech_state,
+)
+
 warnings.filterwarnings("ignore")
 
 # ═══════════════════════════════════════════════════════════
@@ -116,101 +119,6 @@ st.markdown("""
 # ═══════════════════════════════════════════════════════════
 # CONSTANTS
 # ═══════════════════════════════════════════════════════════
-IS_CLOUD = any([
-    os.environ.get("STREAMLIT_SERVER_HEADLESS", "").lower() in ("1", "true"),
-    os.environ.get("STREAMLIT_SHARING_MODE", "") != "",
-    os.environ.get("HOME", "") == "/home/appuser",   # Streamlit Cloud 기본 홈
-])
-MAX_WORKERS  = 1 if IS_CLOUD else 6   # 클라우드: 동시 요청 최소화
-CLOUD_DELAY  = 0.4 if IS_CLOUD else 0.0  # 클라우드: 요청 간 딜레이(초)
-REPORT_LAG         = 45  # 분기 재무보고 지연일
-ANNUAL_REPORT_LAG  = 75  # 연간 재무보고 지연일 (60~90일 중간값)
-
-BENCHMARKS = {"SPY": "S&P 500", "QQQ": "Nasdaq 100", "TQQQ": "3x Nasdaq"}
-
-FEATURE_META = {
-    # ── 모멘텀 ──────────────────────────────────────────────
-    "Mom_1w":            {"name": "1주 수익률",        "group": "모멘텀"},
-    "Mom_1m":            {"name": "1개월 수익률",      "group": "모멘텀"},
-    "Mom_3m":            {"name": "3개월 수익률",      "group": "모멘텀"},
-    "Mom_6m":            {"name": "6개월 수익률",      "group": "모멘텀"},
-    "Mom_12m":           {"name": "12개월 수익률",     "group": "모멘텀"},
-    "Mom_12_1":          {"name": "12-1개월 모멘텀",   "group": "모멘텀"},
-    "Mom_6_1":           {"name": "6-1개월 모멘텀",    "group": "모멘텀"},
-    "Momentum_Custom":   {"name": "모멘텀대체(12-1→6-1)", "group": "모멘텀"},
-    "RS_Market_1m":      {"name": "시장대비 상대강도(1M)", "group": "모멘텀"},
-    "RS_Market_3m":      {"name": "시장대비 상대강도(3M)", "group": "모멘텀"},
-    "RS_Market_6m":      {"name": "시장대비 상대강도(6M)", "group": "모멘텀"},
-    # ── 기술지표 ─────────────────────────────────────────────
-    "RSI_14":            {"name": "RSI(14)",            "group": "기술지표"},
-    "MACD_Hist":         {"name": "MACD 히스토그램",   "group": "기술지표"},
-    "Price_SMA20":       {"name": "Price/SMA20",        "group": "기술지표"},
-    "Price_SMA50":       {"name": "Price/SMA50",        "group": "기술지표"},
-    "Price_SMA200":      {"name": "Price/SMA200",       "group": "기술지표"},
-    "SMA50_SMA200":      {"name": "SMA50/SMA200 골든",  "group": "기술지표"},
-    "ADX_14":            {"name": "ADX(14)",            "group": "기술지표"},
-    "Stoch_K":           {"name": "Stochastic %K",      "group": "기술지표"},
-    "CCI_20":            {"name": "CCI(20)",            "group": "기술지표"},
-    "MFI_14":            {"name": "MFI(14)",            "group": "기술지표"},
-    "BB_Width":          {"name": "볼린저밴드 폭",      "group": "기술지표"},
-    "BB_Pos":            {"name": "볼린저밴드 위치",    "group": "기술지표"},
-    "High52w_Dist":      {"name": "52주 고점 대비",     "group": "기술지표"},
-    "Low52w_Dist":       {"name": "52주 저점 대비",     "group": "기술지표"},
-    # ── 리스크/거래량 ─────────────────────────────────────
-    "Volatility_30d":    {"name": "30일 변동성",        "group": "리스크"},
-    "Volatility_90d":    {"name": "90일 변동성",        "group": "리스크"},
-    "ATR_Ratio":         {"name": "ATR 비율",           "group": "리스크"},
-    "Vol_Ratio":         {"name": "거래량 비율(20일)",  "group": "리스크"},
-    "Risk_Adj_Return":   {"name": "위험조정수익",       "group": "리스크"},
-    "Beta_60d":          {"name": "베타(60일)",         "group": "리스크"},
-    "Beta_120d":         {"name": "베타(120일)",        "group": "리스크"},
-    "Rolling_Sharpe_60d":{"name": "롤링 Sharpe(60일)",  "group": "리스크"},
-    "Daily_Win_Rate_60d":{"name": "일별 승률(60일)",    "group": "리스크"},
-    "Vol_Ratio_30_90":   {"name": "변동성 비율(30/90)", "group": "리스크"},
-    # ── 밸류에이션 ─────────────────────────────────────────
-    "P_E":               {"name": "P/E 비율",           "group": "밸류에이션"},
-    "P_B":               {"name": "P/B 비율",           "group": "밸류에이션"},
-    "P_S":               {"name": "P/S 비율",           "group": "밸류에이션"},
-    "EV_EBITDA":         {"name": "EV/EBITDA",          "group": "밸류에이션"},
-    "P_FCF":             {"name": "P/FCF",              "group": "밸류에이션"},
-    "FCF_Yield":         {"name": "FCF 수익률",         "group": "밸류에이션"},
-    "Div_Yield":         {"name": "배당수익률",         "group": "밸류에이션"},
-    "PEG_Ratio":         {"name": "PEG 비율",           "group": "밸류에이션"},
-    # ── 수익성 ─────────────────────────────────────────────
-    "ROE":               {"name": "ROE",                "group": "수익성"},
-    "ROA":               {"name": "ROA",                "group": "수익성"},
-    "Gross_Margin":      {"name": "매출총이익률",       "group": "수익성"},
-    "Op_Margin":         {"name": "영업이익률",         "group": "수익성"},
-    "EBITDA_Margin":     {"name": "EBITDA 마진",        "group": "수익성"},
-    # ── 성장성 ─────────────────────────────────────────────
-    "Rev_Growth":        {"name": "매출 성장률",        "group": "성장성"},
-    "NI_Growth":         {"name": "순이익 성장률",      "group": "성장성"},
-    "EPS_Growth":        {"name": "EPS 성장률",         "group": "성장성"},
-    # ── 재무안정성 ─────────────────────────────────────────
-    "Debt_Equity":       {"name": "부채비율",           "group": "재무안정성"},
-    "Current_Ratio":     {"name": "유동비율",           "group": "재무안정성"},
-    "Interest_Coverage": {"name": "이자보상배율",       "group": "재무안정성"},
-    # ── 효율성/규모 ────────────────────────────────────────
-    "Asset_Turnover":    {"name": "자산회전율",         "group": "효율성"},
-    "GP_A_Quality":      {"name": "GP/자산 품질",       "group": "효율성"},
-    "MktCap_Log":        {"name": "시가총액(log)",      "group": "규모"},
-    # ── Cross-Sectional 백분위 (Ver3.9) ────────────────────
-    "Mom_3m_Pct":        {"name": "3개월모멘텀 백분위",  "group": "CS정규화"},
-    "RS_Market_3m_Pct":  {"name": "상대강도3M 백분위",   "group": "CS정규화"},
-    "P_E_Pct":           {"name": "P/E 백분위",          "group": "CS정규화"},
-    "ROE_Pct":           {"name": "ROE 백분위",          "group": "CS정규화"},
-    "Volatility_30d_Pct":{"name": "변동성30d 백분위",    "group": "CS정규화"},
-    # ── Regime (시장 상태) ─────────────────────────────────
-    "Market_Regime":     {"name": "시장 레짐(SPY/SMA200)","group": "레짐"},
-    "VIX_Level":         {"name": "VIX 수준",            "group": "레짐"},
-    # ── Sector Relative Strength ───────────────────────────
-    "RS_Sector_1m":      {"name": "섹터대비 상대강도(1M)","group": "섹터상대"},
-    "RS_Sector_3m":      {"name": "섹터대비 상대강도(3M)","group": "섹터상대"},
-}
-
-FEAT_COLS  = list(FEATURE_META.keys())
-FEAT_NAMES = {k: v["name"] for k, v in FEATURE_META.items()}
-
 PLOT_CFG = dict(
     template="plotly_white",
     paper_bgcolor="rgba(255,255,255,1)",
@@ -218,1690 +126,30 @@ PLOT_CFG = dict(
 )
 
 # ═══════════════════════════════════════════════════════════
-# DATA LAYER
+# DATA LAYER (엔진 조회 함수 + Streamlit 캐시)
 # ═══════════════════════════════════════════════════════════
 
 @st.cache_data(ttl=86400, show_spinner=False)
 def get_sp1500_info() -> tuple:
-    """Wikipedia에서 S&P 500 / 400 / 600 종목 목록을 합산하여 S&P 1500 구성."""
-    headers = {"User-Agent": "Mozilla/5.0"}
-
-    # (url, cap_tier) 순서대로 시도
-    index_sources = [
-        ("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies",  "Large Cap"),
-        ("https://en.wikipedia.org/wiki/List_of_S%26P_400_companies",  "Mid Cap"),
-        ("https://en.wikipedia.org/wiki/List_of_S%26P_600_companies",  "Small Cap"),
-    ]
-
-    frames = []
-    for url, cap_tier in index_sources:
-        try:
-            resp = requests.get(url, headers=headers, timeout=15)
-            tables = pd.read_html(StringIO(resp.text))
-            # Wikipedia 표 구조: 첫 번째 표에 Symbol / GICS Sector / Security 컬럼
-            raw = tables[0]
-            # 컬럼명이 다를 수 있으므로 유연하게 매핑
-            col_map = {}
-            for c in raw.columns:
-                lc = str(c).lower()
-                if "symbol" in lc or "ticker" in lc:
-                    col_map[c] = "ticker"
-                elif "gics sector" in lc or "sector" in lc:
-                    col_map[c] = "sector"
-                elif "security" in lc or "company" in lc or "name" in lc:
-                    col_map[c] = "name"
-            raw = raw.rename(columns=col_map)
-            needed = [c for c in ["ticker", "name", "sector"] if c in raw.columns]
-            raw = raw[needed].copy()
-            raw["ticker"] = raw["ticker"].astype(str).str.replace(".", "-", regex=False).str.strip()
-            raw["cap_tier"] = cap_tier
-            frames.append(raw)
-        except Exception as e:
-            st.warning(f"{cap_tier} ({url}) 조회 실패: {e}")
-
-    if not frames:
-        st.warning("S&P 1500 목록 조회 실패. 내장 리스트 사용.")
-        return _fallback_sp500(), _fallback_sectors()
-
-    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset="ticker")
-    if "sector" not in df.columns:
-        df["sector"] = "Unknown"
-    df["sector"] = df["sector"].fillna("Unknown")
-    sectors = sorted(df["sector"].dropna().unique().tolist())
-    return df[["ticker", "name", "sector", "cap_tier"]], sectors
-
-
-def _fallback_sp500() -> pd.DataFrame:
-    data = [
-        ("AAPL","Apple","Information Technology"),("MSFT","Microsoft","Information Technology"),
-        ("NVDA","Nvidia","Information Technology"),("GOOGL","Alphabet","Communication Services"),
-        ("META","Meta","Communication Services"),("AMZN","Amazon","Consumer Discretionary"),
-        ("TSLA","Tesla","Consumer Discretionary"),("AMD","AMD","Information Technology"),
-        ("INTC","Intel","Information Technology"),("QCOM","Qualcomm","Information Technology"),
-        ("CRM","Salesforce","Information Technology"),("ORCL","Oracle","Information Technology"),
-        ("ADBE","Adobe","Information Technology"),("TXN","TI","Information Technology"),
-        ("AVGO","Broadcom","Information Technology"),("MU","Micron","Information Technology"),
-        ("CSCO","Cisco","Information Technology"),("HPQ","HP","Information Technology"),
-        ("JNJ","J&J","Health Care"),("PFE","Pfizer","Health Care"),
-        ("UNH","UnitedHealth","Health Care"),("ABT","Abbott","Health Care"),
-        ("MRK","Merck","Health Care"),("LLY","Eli Lilly","Health Care"),
-        ("BMY","BMS","Health Care"),("AMGN","Amgen","Health Care"),
-        ("MDT","Medtronic","Health Care"),("TMO","Thermo Fisher","Health Care"),
-        ("ABBV","AbbVie","Health Care"),("CVS","CVS Health","Health Care"),
-        ("GILD","Gilead","Health Care"),("REGN","Regeneron","Health Care"),
-        ("JPM","JPMorgan","Financials"),("BAC","Bank of America","Financials"),
-        ("WFC","Wells Fargo","Financials"),("GS","Goldman","Financials"),
-        ("MS","Morgan Stanley","Financials"),("C","Citigroup","Financials"),
-        ("AXP","AmEx","Financials"),("BLK","BlackRock","Financials"),
-        ("SCHW","Schwab","Financials"),("COF","Capital One","Financials"),
-        ("HD","Home Depot","Consumer Discretionary"),("MCD","McDonald's","Consumer Discretionary"),
-        ("NKE","Nike","Consumer Discretionary"),("SBUX","Starbucks","Consumer Discretionary"),
-        ("LOW","Lowe's","Consumer Discretionary"),("TJX","TJX","Consumer Discretionary"),
-        ("PG","P&G","Consumer Staples"),("KO","Coca-Cola","Consumer Staples"),
-        ("PEP","PepsiCo","Consumer Staples"),("WMT","Walmart","Consumer Staples"),
-        ("COST","Costco","Consumer Staples"),("PM","Philip Morris","Consumer Staples"),
-        ("MO","Altria","Consumer Staples"),("CL","Colgate","Consumer Staples"),
-        ("XOM","ExxonMobil","Energy"),("CVX","Chevron","Energy"),
-        ("COP","ConocoPhillips","Energy"),("SLB","Schlumberger","Energy"),
-        ("EOG","EOG Resources","Energy"),("MPC","Marathon","Energy"),
-        ("HON","Honeywell","Industrials"),("UPS","UPS","Industrials"),
-        ("CAT","Caterpillar","Industrials"),("DE","Deere","Industrials"),
-        ("GE","GE","Industrials"),("LMT","Lockheed","Industrials"),
-        ("NEE","NextEra","Utilities"),("DUK","Duke","Utilities"),
-        ("SO","Southern","Utilities"),("D","Dominion","Utilities"),
-        ("AMT","American Tower","Real Estate"),("PLD","Prologis","Real Estate"),
-        ("CCI","Crown Castle","Real Estate"),("EQIX","Equinix","Real Estate"),
-        ("LIN","Linde","Materials"),("APD","Air Products","Materials"),
-        ("SHW","Sherwin","Materials"),("FCX","Freeport","Materials"),
-        ("NFLX","Netflix","Communication Services"),("DIS","Disney","Communication Services"),
-        ("CMCSA","Comcast","Communication Services"),("VZ","Verizon","Communication Services"),
-        ("T","AT&T","Communication Services"),
-    ]
-    return pd.DataFrame(data, columns=["ticker","name","sector"])
-
-
-def _fallback_sectors() -> list:
-    return sorted(["Information Technology","Health Care","Financials",
-                   "Consumer Discretionary","Consumer Staples","Energy",
-                   "Industrials","Materials","Real Estate","Utilities",
-                   "Communication Services"])
-
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def download_price_data(tickers: tuple, start: str, end: str) -> dict:
-    """yfinance에서 OHLCV 데이터 일괄 다운로드."""
-    result = {}
-    batch = 10 if IS_CLOUD else 20   # 클라우드: 배치 크기 줄여 안정성 확보
-    tlist = list(tickers)
-    for i in range(0, len(tlist), batch):
-        chunk = tlist[i: i + batch]
-        for attempt in range(3):   # 최대 3회 재시도
-            try:
-                raw = yf.download(chunk, start=start, end=end,
-                                  auto_adjust=True, progress=False,
-                                  threads=(not IS_CLOUD))  # 클라우드: 단일 스레드
-                if raw.empty:
-                    break
-                if isinstance(raw.columns, pd.MultiIndex):
-                    for t in chunk:
-                        try:
-                            sub = raw.xs(t, axis=1, level=1).dropna(how="all")
-                            if len(sub) >= 60:
-                                result[t] = sub
-                        except Exception:
-                            pass
-                else:
-                    if len(chunk) == 1 and len(raw) >= 60:
-                        result[chunk[0]] = raw
-                break  # 성공 시 재시도 루프 탈출
-            except Exception:
-                if attempt < 2:
-                    time.sleep(1.5 ** attempt)  # 0s, 1.5s 후 재시도
-        if CLOUD_DELAY and i + batch < len(tlist):
-            time.sleep(CLOUD_DELAY)   # 배치 간 딜레이
-    return result
-
-
-@st.cache_data(ttl=7200, show_spinner=False)
-def get_fundamental_yf(tickers: tuple) -> dict:
-    """yfinance .info에서 펀더멘털 데이터 취득."""
-    out = {}
-    for t in tickers:
-        info = {}
-        for attempt in range(3):   # 최대 3회 재시도
-            try:
-                info = yf.Ticker(t).info or {}
-                break
-            except Exception:
-                if attempt < 2:
-                    time.sleep(1.0 + attempt)  # 1s, 2s 후 재시도
-        try:
-            mkt  = info.get("marketCap", 0) or 0
-            out[t] = {
-                "pe":         info.get("trailingPE", np.nan),
-                "fwd_pe":     info.get("forwardPE", np.nan),
-                "pb":         info.get("priceToBook", np.nan),
-                "ps":         info.get("priceToSalesTrailing12Months", np.nan),
-                "ev_ebitda":  info.get("enterpriseToEbitda", np.nan),
-                "peg":        info.get("pegRatio", np.nan),
-                "div_yield":  (info.get("dividendYield") or 0),
-                "roe":        info.get("returnOnEquity", np.nan),
-                "roa":        info.get("returnOnAssets", np.nan),
-                "gross_mg":   info.get("grossMargins", np.nan),
-                "op_mg":      info.get("operatingMargins", np.nan),
-                "net_mg":     info.get("profitMargins", np.nan),
-                "rev_growth": info.get("revenueGrowth", np.nan),
-                "ni_growth":  info.get("earningsGrowth", np.nan),
-                "eps_growth": info.get("earningsQuarterlyGrowth", np.nan),
-                "debt_eq":    info.get("debtToEquity", np.nan),
-                "curr_ratio": info.get("currentRatio", np.nan),
-                "fcf":        info.get("freeCashflow", np.nan),
-                "revenue":    info.get("totalRevenue", np.nan),
-                "net_income": info.get("netIncomeToCommon", np.nan),
-                "total_debt": info.get("totalDebt", np.nan),
-                "total_cash": info.get("totalCash", np.nan),
-                "total_assets": info.get("totalAssets", np.nan),
-                "ebitda":     info.get("ebitda", np.nan),
-                "shares":     info.get("sharesOutstanding", np.nan),
-                "mkt_cap":    mkt,
-                "ev":         info.get("enterpriseValue", np.nan),
-                "interest_exp": info.get("interestExpense", np.nan),
-                "gross_profit": info.get("grossProfit", np.nan),
-                "ebit":       info.get("ebit", np.nan),
-            }
-        except Exception:
-            out[t] = {}
-        if CLOUD_DELAY:
-            time.sleep(CLOUD_DELAY)   # 종목 간 딜레이 (rate limit 방지)
-    return out
-
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def get_benchmark_prices(start: str, end: str) -> dict:
-    bm = {}
-    for tk in BENCHMARKS:
-        try:
-            df = yf.download(tk, start=start, end=end,
-                             auto_adjust=True, progress=False)
-            if not df.empty:
-                bm[tk] = df["Close"].squeeze()
-        except Exception:
-            pass
-    return bm
-
-
-@st.cache_data(ttl=86400, show_spinner=False)
-def get_sp500_changes() -> pd.DataFrame:
-    """Wikipedia S&P 500 변경 이력 파싱 (편입/퇴출 날짜·티커).
-    반환: DataFrame[date, added_ticker, removed_ticker]
-    """
-    url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        resp = requests.get(url, headers=headers, timeout=20)
-        tables = pd.read_html(StringIO(resp.text))
-        if len(tables) < 2:
-            return pd.DataFrame()
-        raw = tables[1]  # 두 번째 표 = 변경 이력
-    except Exception:
-        return pd.DataFrame()
-
-    # 컬럼 평탄화 (MultiIndex 가능)
-    if isinstance(raw.columns, pd.MultiIndex):
-        raw.columns = ["_".join(str(c) for c in col).strip() for col in raw.columns]
-
-    # 날짜·티커 컬럼 탐색
-    date_col = added_col = removed_col = None
-    for c in raw.columns:
-        lc = c.lower()
-        if "date" in lc and date_col is None:
-            date_col = c
-        elif "added" in lc and "ticker" in lc and added_col is None:
-            added_col = c
-        elif "added" in lc and "symbol" in lc and added_col is None:
-            added_col = c
-        elif "removed" in lc and "ticker" in lc and removed_col is None:
-            removed_col = c
-        elif "removed" in lc and "symbol" in lc and removed_col is None:
-            removed_col = c
-
-    if date_col is None:
-        return pd.DataFrame()
-
-    rows = []
-    for _, r in raw.iterrows():
-        try:
-            d = pd.to_datetime(r[date_col], format="mixed")
-        except Exception:
-            continue
-        at = str(r.get(added_col, "")).strip() if added_col else ""
-        rt = str(r.get(removed_col, "")).strip() if removed_col else ""
-        at = at.replace(".", "-") if at and at != "nan" else ""
-        rt = rt.replace(".", "-") if rt and rt != "nan" else ""
-        rows.append({"date": d, "added_ticker": at, "removed_ticker": rt})
-
-    if not rows:
-        return pd.DataFrame()
-    return pd.DataFrame(rows).sort_values("date").reset_index(drop=True)
-
-
-def reconstruct_sp500_at_date(
-    current_members: list,
-    changes_df: pd.DataFrame,
-    target_date: pd.Timestamp,
-) -> list:
-    """현재 S&P 500 구성 + 변경 이력 → target_date 시점의 실제 구성 복원.
-    알고리즘: 현재 목록에서 출발, target_date 이후의 변경을 역산 적용.
-    """
-    if changes_df.empty:
-        return current_members
-
-    members = set(current_members)
-    # target_date 이후 변경만 (최신→과거 순)
-    future = changes_df[changes_df["date"] > target_date].sort_values("date", ascending=False)
-
-    for _, row in future.iterrows():
-        added   = row["added_ticker"]
-        removed = row["removed_ticker"]
-        # 이후에 편입된 종목 → 해당 시점엔 없었으므로 제거
-        if added and added in members:
-            members.discard(added)
-        # 이후에 퇴출된 종목 → 해당 시점엔 있었으므로 추가
-        if removed:
-            members.add(removed)
-
-    return sorted(members)
-
-
-@st.cache_data(ttl=86400, show_spinner=False)
-def get_riskfree_rate(start: str, end: str) -> float:
-    """백테스트 기간의 평균 무위험수익률 조회 (미국 3개월 T-bill ^IRX).
-    ^IRX는 연율화된 수익률을 % 단위로 제공 (예: 5.0 → 5.0%).
-    조회 실패 시 기간에 따른 합리적 기본값 반환.
-    """
-    try:
-        df = yf.download("^IRX", start=start, end=end,
-                         auto_adjust=True, progress=False)
-        if not df.empty:
-            avg_pct = float(df["Close"].squeeze().mean())
-            return avg_pct / 100  # 소수로 변환 (0.05 = 5%)
-    except Exception:
-        pass
-
-    # 조회 실패 시: 기간 중간 연도 기준 합리적 기본값
-    try:
-        mid_year = int(start[:4])
-    except Exception:
-        mid_year = 2022
-
-    # 연도별 대략적인 미국 기준금리
-    fallback = {
-        2018: 0.022, 2019: 0.021, 2020: 0.005,
-        2021: 0.003, 2022: 0.030, 2023: 0.051,
-        2024: 0.052, 2025: 0.045,
-    }
-    return fallback.get(mid_year, 0.03)
-
-
-@st.cache_data(ttl=86400, show_spinner=False)
-def get_pit_financials(tickers: tuple) -> dict:
-    """분기별 재무제표(손익계산서 + 대차대조표) 수집 — PIT 근사용.
-    반환: {ticker: {"income": pd.DataFrame, "balance": pd.DataFrame}}
-    columns = 보고 분기 날짜, rows = 재무 항목
-    주의: yfinance 분기 데이터는 최근 4~5분기만 제공하는 경우 있음.
-    """
-    out = {}
-    workers = 1 if IS_CLOUD else 4
-
-    def _safe(df):
-        return df if (df is not None and not df.empty) else pd.DataFrame()
-
-    def _fetch(t):
-        for attempt in range(3):
-            try:
-                tk = yf.Ticker(t)
-                return t, {
-                    "income":          _safe(tk.quarterly_financials),
-                    "balance":         _safe(tk.quarterly_balance_sheet),
-                    "cashflow":        _safe(tk.quarterly_cashflow),
-                    "annual_income":   _safe(tk.financials),
-                    "annual_balance":  _safe(tk.balance_sheet),
-                    "annual_cashflow": _safe(tk.cashflow),
-                }
-            except Exception:
-                if attempt < 2:
-                    time.sleep(1.0 + attempt)
-        return t, {k: pd.DataFrame() for k in
-                   ["income", "balance", "cashflow",
-                    "annual_income", "annual_balance", "annual_cashflow"]}
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
-        futs = {ex.submit(_fetch, t): t for t in tickers}
-        for fut in concurrent.futures.as_completed(futs):
-            t, data = fut.result()
-            out[t] = data
-            if CLOUD_DELAY:
-                time.sleep(CLOUD_DELAY)
-    return out
-
-
-# ═══════════════════════════════════════════════════════════
-# TECHNICAL INDICATOR CALCULATORS
-# ═══════════════════════════════════════════════════════════
-
-def _rsi(close: pd.Series, n=14) -> pd.Series:
-    d = close.diff()
-    g = d.clip(lower=0).ewm(alpha=1/n, adjust=False).mean()   # Wilder's EMA
-    l = (-d.clip(upper=0)).ewm(alpha=1/n, adjust=False).mean()
-    return 100 - 100 / (1 + g / l.replace(0, np.nan))
-
-
-def _macd(close: pd.Series):
-    e12 = close.ewm(span=12, adjust=False).mean()
-    e26 = close.ewm(span=26, adjust=False).mean()
-    line = e12 - e26
-    sig  = line.ewm(span=9, adjust=False).mean()
-    return line - sig  # histogram
-
-
-def _adx(high, low, close, n=14) -> pd.Series:
-    tr  = pd.concat([high-low,
-                     (high-close.shift()).abs(),
-                     (low -close.shift()).abs()], axis=1).max(axis=1)
-    dm_p = np.where((high-high.shift()) > (low.shift()-low),
-                    np.maximum(high-high.shift(), 0), 0)
-    dm_m = np.where((low.shift()-low) > (high-high.shift()),
-                    np.maximum(low.shift()-low, 0), 0)
-    atr   = tr.ewm(span=n, adjust=False).mean()
-    di_p  = 100 * pd.Series(dm_p, index=high.index).ewm(span=n, adjust=False).mean() / atr
-    di_m  = 100 * pd.Series(dm_m, index=high.index).ewm(span=n, adjust=False).mean() / atr
-    dx    = 100 * (di_p - di_m).abs() / (di_p + di_m).replace(0, np.nan)
-    return dx.ewm(span=n, adjust=False).mean()
-
-
-def _stoch_k(high, low, close, n=14) -> pd.Series:
-    ll = low.rolling(n).min()
-    hh = high.rolling(n).max()
-    return 100 * (close - ll) / (hh - ll).replace(0, np.nan)
-
-
-def _cci(high, low, close, n=20) -> pd.Series:
-    tp  = (high + low + close) / 3
-    sma = tp.rolling(n).mean()
-    mad = tp.rolling(n).apply(lambda x: np.mean(np.abs(x - np.mean(x))), raw=True)
-    return (tp - sma) / (0.015 * mad.replace(0, np.nan))
-
-
-def _mfi(high, low, close, volume, n=14) -> pd.Series:
-    tp   = (high + low + close) / 3
-    rmf  = tp * volume
-    pos  = rmf.where(tp > tp.shift(1), 0.0)
-    neg  = rmf.where(tp < tp.shift(1), 0.0)
-    mfr  = pos.rolling(n).sum() / neg.rolling(n).sum().replace(0, np.nan)
-    return 100 - 100 / (1 + mfr)
-
-
-def calc_all_technical(ohlcv: pd.DataFrame, spy_close: pd.Series = None) -> pd.DataFrame:
-    """단일 종목의 전체 기술지표 DataFrame 사전 계산 (전체 기간).
-    spy_close: SPY 종가 시리즈 (상대강도·베타 계산용, 없으면 해당 피처 NaN).
-    """
-    c, h, l, v = (ohlcv["Close"], ohlcv["High"],
-                  ohlcv["Low"],   ohlcv["Volume"])
-    logr = np.log(c / c.shift(1))
-
-    sma20  = c.rolling(20).mean()
-    sma50  = c.rolling(50).mean()
-    sma200 = c.rolling(200).mean()
-    std20  = c.rolling(20).std()
-    bb_up  = sma20 + 2 * std20
-    bb_lo  = sma20 - 2 * std20
-
-    tr  = pd.concat([h-l, (h-c.shift()).abs(), (l-c.shift()).abs()], axis=1).max(axis=1)
-    atr = tr.rolling(14).mean()
-
-    macd_h = _macd(c)
-
-    df = pd.DataFrame(index=c.index)
-
-    # Momentum
-    df["Mom_1w"]  = c.pct_change(5)
-    df["Mom_1m"]  = c.pct_change(21)
-    df["Mom_3m"]  = c.pct_change(63)
-    df["Mom_6m"]  = c.pct_change(126)
-    df["Mom_12m"] = c.pct_change(252)
-    df["Mom_12_1"]       = c.shift(21) / c.shift(252) - 1
-    df["Mom_6_1"]        = c.shift(21) / c.shift(126) - 1
-    df["Momentum_Custom"] = df["Mom_12_1"].fillna(df["Mom_6_1"])
-
-    # ── 상대강도 (종목 수익률 - SPY 수익률) ───────────────
-    if spy_close is not None:
-        spy_a = spy_close.reindex(c.index, method="ffill")
-        spy_1m = spy_a.pct_change(21)
-        spy_3m = spy_a.pct_change(63)
-        spy_6m = spy_a.pct_change(126)
-        df["RS_Market_1m"] = df["Mom_1m"] - spy_1m
-        df["RS_Market_3m"] = df["Mom_3m"] - spy_3m
-        df["RS_Market_6m"] = df["Mom_6m"] - spy_6m
-    else:
-        df["RS_Market_1m"] = np.nan
-        df["RS_Market_3m"] = np.nan
-        df["RS_Market_6m"] = np.nan
-
-    # Trend (WilliamsR_14만 제거 — Stoch_K와 수학적 동치)
-    df["RSI_14"]    = _rsi(c)
-    df["MACD_Hist"] = macd_h / c
-    df["Price_SMA20"]  = c / sma20  - 1
-    df["Price_SMA50"]  = c / sma50  - 1
-    df["Price_SMA200"] = c / sma200 - 1
-    df["SMA50_SMA200"] = sma50 / sma200 - 1
-    df["ADX_14"]       = _adx(h, l, c)
-    df["Stoch_K"]      = _stoch_k(h, l, c)
-    df["CCI_20"]       = _cci(h, l, c)
-    df["MFI_14"]       = _mfi(h, l, c, v)
-    df["BB_Width"]     = (bb_up - bb_lo) / sma20
-    df["BB_Pos"]       = (c - bb_lo) / (bb_up - bb_lo).replace(0, np.nan)
-    df["High52w_Dist"] = c / c.rolling(252).max() - 1
-    df["Low52w_Dist"]  = c / c.rolling(252).min() - 1
-
-    # Risk / Volume
-    df["Volatility_30d"]   = logr.rolling(30).std()  * np.sqrt(252)
-    df["Volatility_90d"]   = logr.rolling(90).std()  * np.sqrt(252)
-    df["ATR_Ratio"]        = atr / c
-    vol_sma20 = v.rolling(20).mean()
-    df["Vol_Ratio"]        = v / vol_sma20.replace(0, np.nan)
-    df["Risk_Adj_Return"]  = logr.rolling(21).mean() / logr.rolling(21).std().replace(0, np.nan)
-
-    # ── 베타 (종목-시장 공분산/시장분산) ──────────────────
-    if spy_close is not None:
-        spy_logr = np.log(spy_a / spy_a.shift(1))
-        for win, name in [(60, "Beta_60d"), (120, "Beta_120d")]:
-            cov = logr.rolling(win).cov(spy_logr)
-            var = spy_logr.rolling(win).var()
-            df[name] = cov / var.replace(0, np.nan)
-    else:
-        df["Beta_60d"]  = np.nan
-        df["Beta_120d"] = np.nan
-
-    # ── 롤링 Sharpe (60일) ───────────────────────────────
-    df["Rolling_Sharpe_60d"] = (logr.rolling(60).mean() / logr.rolling(60).std().replace(0, np.nan)) * np.sqrt(252)
-
-    # ── 일별 승률 (최근 60일 중 양수 수익률 비율) ─────────
-    df["Daily_Win_Rate_60d"] = logr.apply(lambda x: 1 if x > 0 else 0).rolling(60).mean()
-
-    # ── 변동성 비율 (30d / 90d) — 확대/수축 추세 ─────────
-    df["Vol_Ratio_30_90"] = df["Volatility_30d"] / df["Volatility_90d"].replace(0, np.nan)
-
-    return df
-
-
-# ═══════════════════════════════════════════════════════════
-# PIT (POINT-IN-TIME) FINANCIALS
-# ═══════════════════════════════════════════════════════════
-
-def _to_ts(c):
-    try:
-        return pd.Timestamp(c)
-    except Exception:
-        return pd.NaT
-
-
-def _safe_get(df, col, row):
-    """안전한 셀 읽기."""
-    try:
-        v = df.loc[row, col]
-        return float(v) if (v is not None and pd.notna(v)) else np.nan
-    except Exception:
-        return np.nan
-
-
-def _safe_get_multi(df, col, row_names):
-    """여러 행 이름을 순서대로 시도하여 값 추출."""
-    for rn in row_names:
-        v = _safe_get(df, col, rn)
-        if not np.isnan(v):
-            return v
-    return np.nan
-
-
-def _avail_cols(df, cutoff):
-    """cutoff 이전에 공시된 컬럼(분기/연도) 목록 (최신순)."""
-    return sorted(
-        [c for c in df.columns if _to_ts(c) is not pd.NaT and _to_ts(c) <= cutoff],
-        key=_to_ts, reverse=True
-    )
-
-
-def _ttm_sum(df, cols, row_name):
-    """최근 4분기(또는 가용 분기) 합산. 부족하면 연율화."""
-    use = cols[:4]
-    vals = [_safe_get(df, c, row_name) for c in use]
-    valid = [v for v in vals if not np.isnan(v)]
-    if not valid:
-        return np.nan
-    return sum(valid) if len(valid) == 4 else sum(valid) * 4 / len(valid)
-
-
-def _prev_ttm_sum(df, cols, row_name):
-    """4~7분기 전 합산 (전년 동기 TTM, 성장률 계산용)."""
-    use = cols[4:8]
-    if not use:
-        return np.nan
-    vals = [_safe_get(df, c, row_name) for c in use]
-    valid = [v for v in vals if not np.isnan(v)]
-    if not valid:
-        return np.nan
-    return sum(valid) * 4 / len(valid)
-
-
-def _get_pit_values(pit_data: dict, date: pd.Timestamp) -> dict:
-    """특정 날짜 기준 사용 가능한 TTM 재무 값 추출 (Ver3.6 확장).
-    우선순위: 분기 TTM → 연간 폴백.
-    분기: REPORT_LAG(45일), 연간: ANNUAL_REPORT_LAG(75일).
-    """
-    income   = pit_data.get("income",   pd.DataFrame())
-    balance  = pit_data.get("balance",  pd.DataFrame())
-    cashflow = pit_data.get("cashflow", pd.DataFrame())
-
-    cutoff = date - pd.Timedelta(days=REPORT_LAG)
-
-    # ── 분기 손익계산서 ──────────────────────────────────
-    avail_inc = _avail_cols(income, cutoff) if not income.empty else []
-
-    ttm_rev = ttm_gross = ttm_op = ttm_net = np.nan
-    ttm_ebit = ttm_ebitda = ttm_interest = ttm_eps = np.nan
-    prev_rev = prev_net = prev_eps = np.nan
-
-    if avail_inc:
-        ttm_rev      = _ttm_sum(income, avail_inc, "Total Revenue")
-        ttm_gross    = _ttm_sum(income, avail_inc, "Gross Profit")
-        ttm_op       = _ttm_sum(income, avail_inc, "Operating Income")
-        ttm_net      = _ttm_sum(income, avail_inc, "Net Income")
-        ttm_ebit     = _ttm_sum(income, avail_inc, "EBIT")
-        ttm_ebitda   = _ttm_sum(income, avail_inc, "EBITDA")
-        ttm_interest = _ttm_sum(income, avail_inc, "Interest Expense")
-        if np.isnan(ttm_interest):
-            ttm_interest = _ttm_sum(income, avail_inc, "Interest Expense Non Operating")
-        ttm_eps      = _ttm_sum(income, avail_inc, "Basic EPS")
-        # 전년 동기
-        prev_rev = _prev_ttm_sum(income, avail_inc, "Total Revenue")
-        prev_net = _prev_ttm_sum(income, avail_inc, "Net Income")
-        prev_eps = _prev_ttm_sum(income, avail_inc, "Basic EPS")
-
-    # ── 분기 대차대조표 ──────────────────────────────────
-    ta = eq = cur_a = cur_l = total_debt = cash = shares_out = np.nan
-    if not balance.empty:
-        avail_bal = _avail_cols(balance, cutoff)
-        if avail_bal:
-            bc = avail_bal[0]
-            ta = _safe_get(balance, bc, "Total Assets")
-            eq = _safe_get_multi(balance, bc, [
-                "Stockholders Equity",
-                "Total Equity Gross Minority Interest",
-                "Common Stock Equity"])
-            cur_a = _safe_get(balance, bc, "Current Assets")
-            cur_l = _safe_get(balance, bc, "Current Liabilities")
-            total_debt = _safe_get_multi(balance, bc, [
-                "Total Debt", "Long Term Debt And Capital Lease Obligation"])
-            cash = _safe_get_multi(balance, bc, [
-                "Cash And Cash Equivalents",
-                "Cash Cash Equivalents And Short Term Investments"])
-            shares_out = _safe_get_multi(balance, bc, [
-                "Ordinary Shares Number", "Share Issued"])
-
-    # ── 분기 현금흐름표 ──────────────────────────────────
-    ttm_ocf = ttm_capex = ttm_fcf = np.nan
-    if not cashflow.empty:
-        avail_cf = _avail_cols(cashflow, cutoff)
-        if avail_cf:
-            ttm_ocf   = _ttm_sum(cashflow, avail_cf, "Operating Cash Flow")
-            ttm_capex = _ttm_sum(cashflow, avail_cf, "Capital Expenditure")
-            ttm_fcf   = _ttm_sum(cashflow, avail_cf, "Free Cash Flow")
-            if np.isnan(ttm_fcf) and not np.isnan(ttm_ocf) and not np.isnan(ttm_capex):
-                ttm_fcf = ttm_ocf + ttm_capex  # CapEx는 보통 음수
-
-    # ── 연간 폴백: NaN이 많으면 연간 데이터로 보완 ────────
-    annual_inc = pit_data.get("annual_income",   pd.DataFrame())
-    annual_bal = pit_data.get("annual_balance",  pd.DataFrame())
-    annual_cf  = pit_data.get("annual_cashflow", pd.DataFrame())
-    cutoff_a   = date - pd.Timedelta(days=ANNUAL_REPORT_LAG)
-
-    # 손익 폴백
-    if np.isnan(ttm_rev) and not annual_inc.empty:
-        a_inc = _avail_cols(annual_inc, cutoff_a)
-        if a_inc:
-            ac = a_inc[0]  # 최신 연간
-            ttm_rev      = _safe_get(annual_inc, ac, "Total Revenue")
-            ttm_gross    = _safe_get(annual_inc, ac, "Gross Profit")
-            ttm_op       = _safe_get(annual_inc, ac, "Operating Income")
-            ttm_net      = _safe_get(annual_inc, ac, "Net Income")
-            ttm_ebit     = _safe_get(annual_inc, ac, "EBIT")
-            ttm_ebitda   = _safe_get(annual_inc, ac, "EBITDA")
-            ttm_interest = _safe_get(annual_inc, ac, "Interest Expense")
-            if np.isnan(ttm_interest):
-                ttm_interest = _safe_get(annual_inc, ac, "Interest Expense Non Operating")
-            ttm_eps = _safe_get(annual_inc, ac, "Basic EPS")
-            # 전년 비교 (연간 2번째)
-            if len(a_inc) >= 2:
-                ac2 = a_inc[1]
-                prev_rev = _safe_get(annual_inc, ac2, "Total Revenue")
-                prev_net = _safe_get(annual_inc, ac2, "Net Income")
-                prev_eps = _safe_get(annual_inc, ac2, "Basic EPS")
-
-    # 대차대조표 폴백
-    if np.isnan(ta) and not annual_bal.empty:
-        a_bal = _avail_cols(annual_bal, cutoff_a)
-        if a_bal:
-            abc = a_bal[0]
-            ta = _safe_get(annual_bal, abc, "Total Assets")
-            eq = _safe_get_multi(annual_bal, abc, [
-                "Stockholders Equity",
-                "Total Equity Gross Minority Interest",
-                "Common Stock Equity"])
-            cur_a = _safe_get(annual_bal, abc, "Current Assets")
-            cur_l = _safe_get(annual_bal, abc, "Current Liabilities")
-            total_debt = _safe_get_multi(annual_bal, abc, [
-                "Total Debt", "Long Term Debt And Capital Lease Obligation"])
-            cash = _safe_get_multi(annual_bal, abc, [
-                "Cash And Cash Equivalents",
-                "Cash Cash Equivalents And Short Term Investments"])
-            if np.isnan(shares_out):
-                shares_out = _safe_get_multi(annual_bal, abc, [
-                    "Ordinary Shares Number", "Share Issued"])
-
-    # 현금흐름 폴백
-    if np.isnan(ttm_ocf) and not annual_cf.empty:
-        a_cf = _avail_cols(annual_cf, cutoff_a)
-        if a_cf:
-            acf = a_cf[0]
-            ttm_ocf   = _safe_get(annual_cf, acf, "Operating Cash Flow")
-            ttm_capex = _safe_get(annual_cf, acf, "Capital Expenditure")
-            ttm_fcf   = _safe_get(annual_cf, acf, "Free Cash Flow")
-            if np.isnan(ttm_fcf) and not np.isnan(ttm_ocf) and not np.isnan(ttm_capex):
-                ttm_fcf = ttm_ocf + ttm_capex
-
-    return {
-        "ttm_rev": ttm_rev, "ttm_gross": ttm_gross, "ttm_op": ttm_op,
-        "ttm_net": ttm_net, "ttm_ebit": ttm_ebit, "ttm_ebitda": ttm_ebitda,
-        "ttm_interest": ttm_interest, "ttm_eps": ttm_eps,
-        "ttm_ocf": ttm_ocf, "ttm_capex": ttm_capex, "ttm_fcf": ttm_fcf,
-        "total_assets": ta, "equity": eq,
-        "current_assets": cur_a, "current_liabilities": cur_l,
-        "total_debt": total_debt, "cash": cash,
-        "shares_outstanding": shares_out,
-        "prev_rev": prev_rev, "prev_net": prev_net, "prev_eps": prev_eps,
-    }
-
-
-def _compute_pit_metrics(pit_values: dict, hist_price: float, shares: float) -> dict:
-    """PIT 재무 값 + 역사적 주가 → 22개 지표 계산 (Ver3.6 확장).
-    hist_price: 해당 리밸런싱 시점의 실제 주가
-    shares: 발행주식수 (PIT balance sheet 우선, 없으면 .info 값)
-    """
-    if not pit_values or np.isnan(hist_price):
-        return {}
-
-    # PIT shares 우선 사용
-    pit_shares = pit_values.get("shares_outstanding", np.nan)
-    s = pit_shares if not np.isnan(pit_shares) else shares
-    if not s or np.isnan(s):
-        return {}
-
-    def sdiv(a, b):
-        try:
-            if np.isnan(a) or np.isnan(b) or b == 0:
-                return np.nan
-            return float(a) / float(b)
-        except Exception:
-            return np.nan
-
-    r   = pit_values.get("ttm_rev",   np.nan)
-    gp  = pit_values.get("ttm_gross", np.nan)
-    op  = pit_values.get("ttm_op",    np.nan)
-    ni  = pit_values.get("ttm_net",   np.nan)
-    ebit  = pit_values.get("ttm_ebit",    np.nan)
-    ebitda = pit_values.get("ttm_ebitda",  np.nan)
-    iexp  = pit_values.get("ttm_interest", np.nan)
-    eps   = pit_values.get("ttm_eps",      np.nan)
-    fcf   = pit_values.get("ttm_fcf",      np.nan)
-    ta    = pit_values.get("total_assets",  np.nan)
-    eq    = pit_values.get("equity",        np.nan)
-    ca    = pit_values.get("current_assets", np.nan)
-    cl    = pit_values.get("current_liabilities", np.nan)
-    debt  = pit_values.get("total_debt",    np.nan)
-    cash  = pit_values.get("cash",          np.nan)
-    pr    = pit_values.get("prev_rev",      np.nan)
-    pn    = pit_values.get("prev_net",      np.nan)
-    pe_   = pit_values.get("prev_eps",      np.nan)
-
-    mktcap = hist_price * s
-    ev = mktcap + (debt if not np.isnan(debt) else 0) - (cash if not np.isnan(cash) else 0)
-
-    rev_g = sdiv(r - pr, abs(pr)) if not np.isnan(pr) else np.nan
-    ni_g  = sdiv(ni - pn, abs(pn)) if not np.isnan(pn) else np.nan
-    eps_g = sdiv(eps - pe_, abs(pe_)) if not np.isnan(pe_) else np.nan
-
-    pe_val = sdiv(mktcap, ni)
-    peg = sdiv(pe_val, eps_g * 100) if (not np.isnan(eps_g) and eps_g > 0) else np.nan
-
-    return {
-        "P_E":               pe_val,
-        "P_B":               sdiv(mktcap, eq),
-        "P_S":               sdiv(mktcap, r),
-        "EV_EBITDA":         sdiv(ev, ebitda),
-        "P_FCF":             sdiv(mktcap, fcf) if (not np.isnan(fcf) and fcf > 0) else np.nan,
-        "FCF_Yield":         sdiv(fcf, mktcap),
-        "PEG_Ratio":         peg,
-        "ROE":               sdiv(ni, eq),
-        "ROA":               sdiv(ni, ta),
-        "Gross_Margin":      sdiv(gp, r),
-        "Op_Margin":         sdiv(op, r),
-        "EBITDA_Margin":     sdiv(ebitda, r),
-        "Rev_Growth":        rev_g,
-        "NI_Growth":         ni_g,
-        "EPS_Growth":        eps_g,
-        "Debt_Equity":       sdiv(debt, eq),
-        "Current_Ratio":     sdiv(ca, cl),
-        "Interest_Coverage": sdiv(ebit, abs(iexp)) if not np.isnan(iexp) else np.nan,
-        "Asset_Turnover":    sdiv(r, ta),
-        "GP_A_Quality":      sdiv(gp, ta),
-        "MktCap_Log":        np.log(max(mktcap, 1)),
-    }
-
-
-# ═══════════════════════════════════════════════════════════
-# FEATURE ENGINEERING
-# ═══════════════════════════════════════════════════════════
-
-def _fund_features(fund: dict, price: float, pit_overrides: dict = None,
-                   backtest_mode: bool = False) -> dict:
-    """yfinance info dict → 펀더멘털 피처.
-    backtest_mode=True: .info 미사용, PIT 전용 (Look-Ahead 제거)
-    backtest_mode=False: .info 기본값 + PIT 덮어쓰기 (실시간 추천용)
-    """
-    if backtest_mode:
-        # ── 백테스트: .info 완전 차단, PIT만 사용 ──────────
-        _ALL_FUND_KEYS = [
-            "P_E", "P_B", "P_S", "EV_EBITDA", "P_FCF", "FCF_Yield",
-            "Div_Yield", "PEG_Ratio", "ROE", "ROA", "Gross_Margin",
-            "Op_Margin", "EBITDA_Margin", "Rev_Growth", "NI_Growth",
-            "EPS_Growth", "Debt_Equity", "Current_Ratio", "Interest_Coverage",
-            "Asset_Turnover", "GP_A_Quality", "MktCap_Log",
-        ]
-        result = {k: np.nan for k in _ALL_FUND_KEYS}
-        if pit_overrides:
-            for k, v in pit_overrides.items():
-                if k in result and not (isinstance(v, float) and np.isnan(v)):
-                    result[k] = v
-        return result
-
-    # ── 실시간: 기존 .info 기반 + PIT 덮어쓰기 ───────────
-    mkt  = fund.get("mkt_cap", np.nan) or np.nan
-    fcf  = fund.get("fcf",     np.nan) or np.nan
-    rev  = fund.get("revenue", np.nan) or np.nan
-    ta   = fund.get("total_assets", 1) or 1
-    eq   = max(fund.get("total_assets", 1) - (fund.get("total_debt", 0) or 0), 1)
-    ebit_val = fund.get("ebit", np.nan)
-    ebitda   = fund.get("ebitda", np.nan)
-    gp       = fund.get("gross_profit", np.nan)
-    iexp     = fund.get("interest_exp", np.nan)
-
-    p_fcf = mkt / fcf if (fcf and fcf > 0 and mkt and mkt > 0) else np.nan
-    fcf_yield = fcf / mkt if (mkt and mkt > 0 and fcf) else np.nan
-    ebitda_m = (ebitda / rev) if (rev and rev != 0 and ebitda is not None and not np.isnan(ebitda)) else np.nan
-    interest_cov = np.nan
-    if ebit_val is not None and not np.isnan(ebit_val) and iexp and iexp != 0:
-        interest_cov = ebit_val / abs(iexp)
-    gpa = gp / ta if (gp is not None and not np.isnan(gp)) else np.nan
-    at  = rev / ta if (rev is not None and not np.isnan(rev)) else np.nan
-
-    result = {
-        "P_E":               fund.get("pe", np.nan),
-        "P_B":               fund.get("pb", np.nan),
-        "P_S":               fund.get("ps", np.nan),
-        "EV_EBITDA":         fund.get("ev_ebitda", np.nan),
-        "P_FCF":             p_fcf,
-        "FCF_Yield":         fcf_yield,
-        "Div_Yield":         fund.get("div_yield", 0),
-        "PEG_Ratio":         fund.get("peg", np.nan),
-        "ROE":               fund.get("roe", np.nan),
-        "ROA":               fund.get("roa", np.nan),
-        "Gross_Margin":      fund.get("gross_mg", np.nan),
-        "Op_Margin":         fund.get("op_mg", np.nan),
-        "EBITDA_Margin":     ebitda_m,
-        "Rev_Growth":        fund.get("rev_growth", np.nan),
-        "NI_Growth":         fund.get("ni_growth", np.nan),
-        "EPS_Growth":        fund.get("eps_growth", np.nan),
-        "Debt_Equity":       fund.get("debt_eq", np.nan),
-        "Current_Ratio":     fund.get("curr_ratio", np.nan),
-        "Interest_Coverage": interest_cov,
-        "Asset_Turnover":    at,
-        "GP_A_Quality":      gpa,
-        "MktCap_Log":        np.log(fund.get("mkt_cap", 0) or 1),
-    }
-    if pit_overrides:
-        for k, v in pit_overrides.items():
-            if k in result and not (isinstance(v, float) and np.isnan(v)):
-                result[k] = v
-    return result
-
-
-def snapshot_at_date(
-    ticker: str,
-    tech_df: pd.DataFrame,
-    fund: dict,
-    date: pd.Timestamp,
-    pit_data: dict = None,
-    hist_price: float = np.nan,
-    backtest_mode: bool = False,
-) -> dict | None:
-    """특정 날짜 기준 단일 종목 전체 피처 추출.
-    backtest_mode=True: PIT 전용, .info 미사용
-    """
-    mask = tech_df.index <= date
-    if mask.sum() == 0:
-        return None
-    row = tech_df[mask].iloc[-1]
-
-    features = {"ticker": ticker}
-    for col in FEAT_COLS:
-        if col in row.index:
-            features[col] = row[col]
-        else:
-            features[col] = np.nan
-
-    # PIT 재무 지표 계산 (Ver3.6: 22개 지표)
-    pit_overrides = {}
-    if pit_data and not (isinstance(hist_price, float) and np.isnan(hist_price)):
-        pit_vals = _get_pit_values(pit_data, date)
-        if pit_vals:
-            # PIT shares 우선, 없으면 .info shares
-            shares = fund.get("shares", np.nan)
-            pit_overrides = _compute_pit_metrics(pit_vals, hist_price, shares or np.nan)
-
-    fund_feat = _fund_features(fund, hist_price, pit_overrides=pit_overrides,
-                               backtest_mode=backtest_mode)
-    for k, v in fund_feat.items():
-        features[k] = v
-
-    return features
-
-
-def build_snapshot_df(
-    tickers: list,
-    tech_map: dict,
-    fund_map: dict,
-    date: pd.Timestamp,
-    min_history: int = 252,
-    pit_map: dict = None,
-    price_data: dict = None,
-    backtest_mode: bool = False,
-) -> pd.DataFrame:
-    """모든 종목에 대해 특정 날짜의 피처 DataFrame 구성.
-    pit_map: {ticker: {"income": df, "balance": df, "cashflow": df, ...}}
-    price_data: {ticker: OHLCV DataFrame} — 역사적 주가 조회용
-    """
-    rows = []
-    for t in tickers:
-        td = tech_map.get(t)
-        if td is None or len(td) < min_history:
-            continue
-
-        # 해당 날짜의 실제 주가 조회
-        hist_price = np.nan
-        if price_data is not None and t in price_data:
-            ohlcv = price_data[t]
-            mask_p = ohlcv.index <= date
-            if mask_p.any():
-                hist_price = float(ohlcv.loc[mask_p, "Close"].iloc[-1])
-
-        pit_data = pit_map.get(t) if pit_map else None
-        feat = snapshot_at_date(
-            t, td, fund_map.get(t, {}), date,
-            pit_data=pit_data, hist_price=hist_price,
-            backtest_mode=backtest_mode,
-        )
-        if feat:
-            rows.append(feat)
-    if not rows:
-        return pd.DataFrame()
-    df = pd.DataFrame(rows).set_index("ticker")
-    return df
-
-
-# ═══════════════════════════════════════════════════════════
-# SNAPSHOT ENRICHMENT (Ver3.9)
-# ═══════════════════════════════════════════════════════════
-
-def enrich_snapshot(
-    snap: pd.DataFrame,
-    date: pd.Timestamp,
-    spy_close: pd.Series = None,
-    vix_close: pd.Series = None,
-    sector_map: dict = None,
-) -> pd.DataFrame:
-    """스냅샷에 Cross-Sectional 백분위 + Regime + Sector RS 추가.
-    snap: build_snapshot_df 결과 (index=ticker, columns=features)
-    spy_close: SPY 종가 시리즈
-    vix_close: VIX 종가 시리즈
-    sector_map: {ticker: sector_name}
-    """
-    if snap.empty:
-        return snap
-
-    # ── Cross-Sectional 백분위 (해당 시점 전체 종목 대비 순위%) ──
-    cs_pairs = [
-        ("Mom_3m",        "Mom_3m_Pct"),
-        ("RS_Market_3m",  "RS_Market_3m_Pct"),
-        ("P_E",           "P_E_Pct"),
-        ("ROE",           "ROE_Pct"),
-        ("Volatility_30d","Volatility_30d_Pct"),
-    ]
-    for src, dst in cs_pairs:
-        if src in snap.columns:
-            snap[dst] = snap[src].rank(pct=True)
-        else:
-            snap[dst] = np.nan
-
-    # ── Regime Feature (시장 전체 — 모든 종목에 동일 값) ────────
-    # Market_Regime: SPY / SPY_SMA200 - 1
-    if spy_close is not None:
-        spy_s = spy_close[spy_close.index <= date]
-        if len(spy_s) >= 200:
-            sma200 = spy_s.rolling(200).mean().iloc[-1]
-            snap["Market_Regime"] = spy_s.iloc[-1] / sma200 - 1 if sma200 > 0 else 0
-        else:
-            snap["Market_Regime"] = np.nan
-    else:
-        snap["Market_Regime"] = np.nan
-
-    # VIX_Level
-    if vix_close is not None:
-        vix_s = vix_close[vix_close.index <= date]
-        if len(vix_s) > 0:
-            snap["VIX_Level"] = float(vix_s.iloc[-1])
-        else:
-            snap["VIX_Level"] = np.nan
-    else:
-        snap["VIX_Level"] = np.nan
-
-    # ── Sector Relative Strength (종목 수익률 - 섹터 평균 수익률) ──
-    if sector_map:
-        snap["_sector"] = snap.index.map(lambda t: sector_map.get(t, "Unknown"))
-        for ret_col, dst_col in [("Mom_1m", "RS_Sector_1m"), ("Mom_3m", "RS_Sector_3m")]:
-            if ret_col in snap.columns:
-                sector_avg = snap.groupby("_sector")[ret_col].transform("mean")
-                snap[dst_col] = snap[ret_col] - sector_avg
-            else:
-                snap[dst_col] = np.nan
-        snap.drop(columns=["_sector"], inplace=True)
-    else:
-        snap["RS_Sector_1m"] = np.nan
-        snap["RS_Sector_3m"] = np.nan
-
-    return snap
-
-
-# ═══════════════════════════════════════════════════════════
-# FORWARD RETURN
-# ═══════════════════════════════════════════════════════════
-
-def forward_return(tech_df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> float:
-    """start → end 기간의 실제 수익률."""
-    try:
-        close = tech_df["Close"] if "Close" in tech_df.columns else None
-        # tech_df here is original OHLCV, not indicator df
-    except Exception:
-        return np.nan
-    return np.nan  # placeholder — actual call uses price_data dict
-
-
-def fwd_ret_from_price(price_data: dict, ticker: str,
-                       start: pd.Timestamp, end: pd.Timestamp,
-                       use_next_open: bool = False) -> float:
-    """start → end 수익률. use_next_open=True이면 T+1 시가 기준."""
-    try:
-        ohlcv = price_data[ticker]
-        if use_next_open:
-            s = ohlcv.loc[ohlcv.index > start, "Open"].iloc[0]
-            e = ohlcv.loc[ohlcv.index > end,   "Open"].iloc[0]
-        else:
-            s = ohlcv.loc[ohlcv.index >= start, "Close"].iloc[0]
-            e = ohlcv.loc[ohlcv.index >= end,   "Close"].iloc[0]
-        return e / s - 1
-    except Exception:
-        return np.nan
-
-
-def _delisted_return(price_data: dict, ticker: str,
-                     start: pd.Timestamp, end: pd.Timestamp,
-                     use_next_open: bool = False) -> float:
-    """보유 기간 중 상폐/거래중단 종목의 수익률 산출.
-    마지막 거래 가격 기준으로 수익률 계산. 데이터 전무 시 -100%.
-    """
-    ohlcv = price_data.get(ticker)
-    if ohlcv is None:
-        return -1.0
-
-    # 진입가 결정
-    if use_next_open:
-        after_start = ohlcv.loc[ohlcv.index > start]
-        if len(after_start) == 0:
-            return -1.0
-        entry = float(after_start["Open"].iloc[0])
-    else:
-        on_or_after = ohlcv.loc[ohlcv.index >= start]
-        if len(on_or_after) == 0:
-            return -1.0
-        entry = float(on_or_after["Close"].iloc[0])
-
-    if entry <= 0:
-        return -1.0
-
-    # 보유 기간 내 마지막 가용 종가
-    sub = ohlcv.loc[(ohlcv.index >= start) & (ohlcv.index <= end), "Close"]
-    if len(sub) == 0:
-        return -1.0
-
-    last_price = float(sub.iloc[-1])
-    return last_price / entry - 1
-
-
-# ═══════════════════════════════════════════════════════════
-# BACKTEST ENGINE
-# ═══════════════════════════════════════════════════════════
-
-def add_months(dt: datetime, n: int) -> datetime:
-    month = dt.month - 1 + n
-    year  = dt.year + month // 12
-    month = month % 12 + 1
-    day   = min(dt.day, calendar.monthrange(year, month)[1])
-    return dt.replace(year=year, month=month, day=day)
-
-
-def generate_rebalance_dates(start: datetime, end: datetime, months: int) -> list:
-    dates = []
-    cur = start
-    while cur <= end:
-        dates.append(pd.Timestamp(cur))
-        cur = add_months(cur, months)
-    return dates
-
-
-def run_backtest(
-    price_data:   dict,
-    fund_map:     dict,
-    tech_map:     dict,
-    rebal_dates:  list,
-    n_stocks:     int,
-    tc_pct:       float,
-    rolling_win:  int,
-    progress,
-    pit_map:      dict = None,
-    min_dollar_vol: float = 0,
-    use_next_open:  bool = False,
-    sp500_changes: pd.DataFrame = None,
-    current_sp500: list = None,
-    use_ensemble:   bool = True,
-    spy_close:      pd.Series = None,
-    vix_close:      pd.Series = None,
-    sector_map:     dict = None,
-    use_mom_filter:      bool = True,
-    use_turnover_buffer: bool = False,
-    turnover_buffer_pct: float = 0.05,
-    use_inv_vol_weight:  bool = False,
-) -> dict:
-    """메인 백테스트 엔진.
-    Ver3.9: enrich_snapshot으로 CS정규화 + Regime + Sector RS 추가.
-    """
-    n_dates = len(rebal_dates)
-    feature_cols = FEAT_COLS
-
-    # 결측 플래그 대상: 펀더멘털 그룹
-    _FUND_GROUPS = {"밸류에이션", "수익성", "성장성", "재무안정성", "효율성", "규모"}
-
-    # ── Step 1: 모든 리밸런싱 날짜의 스냅샷 + 실제 수익률 계산 ──
-    progress(0.05, "📊 지표 스냅샷 계산 중...")
-    snapshots: dict = {}  # date → pd.DataFrame (includes forward_return)
-
-    for i, date in enumerate(rebal_dates[:-1]):
-        next_date = rebal_dates[i + 1]
-
-        # ── 생존자 편향 보정: 해당 날짜의 역사적 유니버스 ──
-        if sp500_changes is not None and current_sp500 is not None:
-            hist_members = reconstruct_sp500_at_date(current_sp500, sp500_changes, date)
-            tickers = [t for t in hist_members if t in price_data]
-        else:
-            tickers = list(price_data.keys())
-
-        # ── 유동성 필터: 20일 평균 거래대금 기준 ──────────
-        if min_dollar_vol > 0:
-            liquid = []
-            for t in tickers:
-                ohlcv = price_data.get(t)
-                if ohlcv is None:
-                    continue
-                mask = ohlcv.index <= date
-                if mask.sum() >= 20:
-                    recent = ohlcv[mask].tail(20)
-                    adv = (recent["Close"] * recent["Volume"]).mean()
-                    if adv >= min_dollar_vol:
-                        liquid.append(t)
-            tickers = liquid
-
-        snap = build_snapshot_df(tickers, tech_map, fund_map, date,
-                                      pit_map=pit_map, price_data=price_data,
-                                      backtest_mode=True)
-        if snap.empty:
-            snapshots[date] = snap
-            continue
-
-        # Ver3.9: CS정규화 + Regime + Sector RS 추가
-        snap = enrich_snapshot(snap, date,
-                               spy_close=spy_close, vix_close=vix_close,
-                               sector_map=sector_map)
-
-        # 실제 forward return 추가 (체결가 가정 반영)
-        fwd = {t: fwd_ret_from_price(price_data, t, date, next_date, use_next_open)
-               for t in snap.index}
-        snap["_fwd_return"] = pd.Series(fwd)
-        snapshots[date] = snap
-        progress(0.05 + 0.25 * (i / max(n_dates - 2, 1)),
-                 f"스냅샷 계산 중 ({i+1}/{n_dates-1})...")
-
-    # ── Step 2: 롤링 모델 학습 + 포트폴리오 시뮬레이션 ──
-    progress(0.30, "🤖 AI 모델 학습 및 백테스트 실행 중...")
-
-    portfolio_dates  = [rebal_dates[0]]
-    portfolio_values = [1.0]
-    current_value    = 1.0
-
-    ic_records     = []
-    feat_imp_rows  = []
-    feat_imp_rf_rows   = []   # 모델별 중요도 (Ver3.8)
-    feat_imp_xgb_rows  = []
-    feat_imp_lgbm_rows = []
-    rebal_history  = []
-    prev_selected  = set()   # 직전 기간 보유 종목 (turnover 계산용)
-
-    imputer = SimpleImputer(strategy="median")
-
-    # 마지막 학습 정보 (tab_realtime 전달용)
-    last_win_bounds  = {}
-    last_miss_src    = []
-    last_all_cols    = []
-    last_avail_cols  = []
-
-    for i in range(rolling_win, n_dates - 1):
-        date      = rebal_dates[i]
-        next_date = rebal_dates[i + 1]
-
-        # ── 훈련 데이터 수집 (Ver4.2: 엠바고 적용) ─────────
-        # 예측 날짜와 21일 이내 겹치는 스냅샷 제외 → 데이터 누수 방지
-        EMBARGO_DAYS = 21
-        X_list, y_list = [], []
-        for j in range(i - rolling_win, i):
-            snap_date = rebal_dates[j]
-            # 엠바고: 훈련 스냅샷의 forward return 종료일이 예측일과 겹치면 제외
-            if (date - snap_date).days < EMBARGO_DAYS:
-                continue
-            snap = snapshots.get(snap_date)
-            if snap is None or snap.empty or "_fwd_return" not in snap.columns:
-                continue
-            cols = [c for c in feature_cols if c in snap.columns]
-            sub  = snap[cols + ["_fwd_return"]].dropna(subset=["_fwd_return"])
-            if len(sub) >= 5:
-                X_list.append(sub[cols])
-                y_list.append(sub["_fwd_return"])
-
-        if not X_list:
-            continue
-
-        X_train = pd.concat(X_list)
-        y_train = pd.concat(y_list)
-        avail_cols = X_train.columns.tolist()
-
-        # ── 결측 플래그 (펀더멘털 피처) ───────────────────
-        miss_src = [c for c in avail_cols
-                    if FEATURE_META.get(c, {}).get("group", "") in _FUND_GROUPS]
-        for mc in miss_src:
-            X_train[f"{mc}_miss"] = X_train[mc].isna().astype(int)
-        all_train_cols = X_train.columns.tolist()
-
-        # ── Ver4.2: 결측 대체 먼저 → 윈저화 (순서 수정) ──
-        # keep_empty_features=True로 all-NaN 컬럼도 유지 (컬럼 수 불일치 방지)
-        imputer_step = SimpleImputer(strategy="median", keep_empty_features=True)
-        X_imp_df = pd.DataFrame(
-            imputer_step.fit_transform(X_train),
-            columns=all_train_cols, index=X_train.index,
-        )
-        win_bounds = {}
-        for col in avail_cols:
-            lo, hi = X_imp_df[col].quantile(0.01), X_imp_df[col].quantile(0.99)
-            if lo < hi:
-                win_bounds[col] = (lo, hi)
-                X_imp_df[col] = X_imp_df[col].clip(lo, hi)
-        X_imp = X_imp_df.values
-
-        # ── Ver4.2: RF 하이퍼파라미터 자동 튜닝 ──────────
-        param_grid = {"max_depth": [3, 5, 7], "min_samples_leaf": [5, 10, 20]}
-        base_rf = RandomForestRegressor(
-            n_estimators=100, random_state=42, n_jobs=1,
-        )
-        gcv = GridSearchCV(base_rf, param_grid, cv=3, scoring="neg_mean_squared_error",
-                           n_jobs=1, refit=True)
-        gcv.fit(X_imp, y_train)
-        model_rf = gcv.best_estimator_
-
-        # XGBoost + LightGBM (앙상블 모드 시)
-        model_xgb = None
-        model_lgbm = None
-        if use_ensemble:
-            model_xgb = XGBRegressor(
-                n_estimators=100, max_depth=4, learning_rate=0.1,
-                subsample=0.8, colsample_bytree=0.8,
-                random_state=42, n_jobs=1, verbosity=0,
-            )
-            model_xgb.fit(X_imp, y_train)
-
-            model_lgbm = LGBMRegressor(
-                n_estimators=100, max_depth=4, learning_rate=0.1,
-                subsample=0.8, colsample_bytree=0.8,
-                random_state=42, n_jobs=1, verbose=-1,
-            )
-            model_lgbm.fit(X_imp, y_train)
-
-        # 중요도: 모델별 개별 저장 (raw) + 앙상블 평균 (정규화 후)
-        # LightGBM은 split 기반으로 RF/XGBoost 대비 스케일이 수백배 다름
-        # → 각 모델을 합계 1로 정규화한 뒤 평균해야 공정한 앙상블 중요도
-        imp_rf_raw = {}
-        imp_xgb_raw = {}
-        imp_lgbm_raw = {}
-        for idx_c, col_name in enumerate(all_train_cols):
-            if col_name in avail_cols:
-                imp_rf_raw[col_name] = model_rf.feature_importances_[idx_c]
-                if use_ensemble:
-                    imp_xgb_raw[col_name]  = model_xgb.feature_importances_[idx_c]
-                    imp_lgbm_raw[col_name] = model_lgbm.feature_importances_[idx_c]
-
-        # 정규화 (합계 1)
-        def _norm(d):
-            s = sum(d.values())
-            return {k: v / s for k, v in d.items()} if s > 0 else d
-
-        imp_rf_n = _norm(imp_rf_raw)
-        imp_dict = dict(imp_rf_n)  # RF 단독일 때 기본값
-
-        if use_ensemble:
-            imp_xgb_n  = _norm(imp_xgb_raw)
-            imp_lgbm_n = _norm(imp_lgbm_raw)
-            imp_dict = {k: (imp_rf_n.get(k, 0) + imp_xgb_n.get(k, 0) + imp_lgbm_n.get(k, 0)) / 3
-                        for k in imp_rf_n}
-
-        feat_imp_rows.append({"date": date, **imp_dict})
-        feat_imp_rf_rows.append({"date": date, **imp_rf_raw})
-        if use_ensemble:
-            feat_imp_xgb_rows.append({"date": date, **imp_xgb_raw})
-            feat_imp_lgbm_rows.append({"date": date, **imp_lgbm_raw})
-
-        # ── 예측 ─────────────────────────────────────────
-        cur_snap = snapshots.get(date)
-        if cur_snap is None or cur_snap.empty:
-            continue
-
-        X_pred = cur_snap[[c for c in avail_cols if c in cur_snap.columns]].reindex(columns=avail_cols)
-
-        # 결측 플래그 추가
-        for mc in miss_src:
-            X_pred[f"{mc}_miss"] = X_pred[mc].isna().astype(int) if mc in X_pred.columns else 0
-        X_pred = X_pred.reindex(columns=all_train_cols)
-
-        # Ver4.2: 결측 대체 먼저 → 윈저화 (학습과 동일 순서)
-        X_pred_imp_df = pd.DataFrame(
-            imputer_step.transform(X_pred),
-            columns=all_train_cols, index=cur_snap.index,
-        )
-        for col in avail_cols:
-            if col in win_bounds and col in X_pred_imp_df.columns:
-                lo, hi = win_bounds[col]
-                X_pred_imp_df[col] = X_pred_imp_df[col].clip(lo, hi)
-        X_pred_imp = X_pred_imp_df.values
-
-        # 앙상블 예측: Rank Average (각 모델 예측 → 순위 변환 → 순위 평균)
-        pred_rf_s = pd.Series(model_rf.predict(X_pred_imp), index=cur_snap.index)
-        if use_ensemble:
-            pred_xgb_s  = pd.Series(model_xgb.predict(X_pred_imp),  index=cur_snap.index)
-            pred_lgbm_s = pd.Series(model_lgbm.predict(X_pred_imp), index=cur_snap.index)
-            # rank: ascending=False → 예측 수익률 높을수록 1등 (낮은 rank = 좋은 종목)
-            rank_rf   = pred_rf_s.rank(ascending=False)
-            rank_xgb  = pred_xgb_s.rank(ascending=False)
-            rank_lgbm = pred_lgbm_s.rank(ascending=False)
-            avg_rank  = (rank_rf + rank_xgb + rank_lgbm) / 3
-            # rank average → 낮을수록 좋으므로 nsmallest로 선정하기 위해 부호 반전
-            pred_series = -avg_rank  # 높을수록 좋은 종목
-        else:
-            pred_series = pred_rf_s
-
-        # ── IC 계산 (앙상블: raw 예측 평균 기준 + 모델별) ──
-        actual = cur_snap["_fwd_return"].dropna()
-        common = pred_rf_s.index.intersection(actual.index)
-        ic_val = np.nan
-        ic_rec = {"date": date}
-        if len(common) >= 10:
-            ic_rf, _ = spearmanr(pred_rf_s[common], actual[common])
-            ic_rec["IC_RF"] = ic_rf
-            if use_ensemble:
-                ic_xgb, _ = spearmanr(pred_xgb_s[common], actual[common])
-                ic_lgbm, _ = spearmanr(pred_lgbm_s[common], actual[common])
-                ic_rec["IC_XGB"]  = ic_xgb
-                ic_rec["IC_LGBM"] = ic_lgbm
-                # 앙상블 IC: 3모델 raw 예측 평균 기준
-                raw_avg = (pred_rf_s[common] + pred_xgb_s[common] + pred_lgbm_s[common]) / 3
-                ic_val, _ = spearmanr(raw_avg, actual[common])
-            else:
-                ic_val = ic_rf
-            ic_rec["IC"] = ic_val
-            ic_records.append(ic_rec)
-
-        # ── 종목 선정 (모멘텀 필터 + 턴오버 버퍼) ──────────
-        if use_mom_filter and "Mom_1m" in cur_snap.columns:
-            mom_ok = cur_snap["Mom_1m"] > 0
-            candidates = pred_series[pred_series.index.isin(cur_snap[mom_ok].index)]
-        else:
-            candidates = pred_series
-        # Ver4.2: 턴오버 버퍼 — 보유 종목에 가산점 부여
-        if use_turnover_buffer and prev_selected:
-            candidates_adj = candidates.copy()
-            for t in prev_selected:
-                if t in candidates_adj.index:
-                    candidates_adj[t] *= (1 + turnover_buffer_pct)
-            if len(candidates_adj) >= n_stocks:
-                selected = candidates_adj.nlargest(n_stocks)
-            else:
-                selected = pred_series.nlargest(n_stocks)
-        elif len(candidates) >= n_stocks:
-            selected = candidates.nlargest(n_stocks)
-        else:
-            selected = pred_series.nlargest(n_stocks)
-
-        # ── Ver4.2: 포트폴리오 가중치 결정 ────────────────
-        n_sel = len(selected)
-        if n_sel == 0:
-            continue
-        if use_inv_vol_weight and "Volatility_30d" in cur_snap.columns:
-            vols = {}
-            for t in selected.index:
-                v = cur_snap.loc[t, "Volatility_30d"] if t in cur_snap.index else np.nan
-                vols[t] = v if (not np.isnan(v) and v > 0) else 0.30
-            inv_vols = {t: 1 / v for t, v in vols.items()}
-            total_inv = sum(inv_vols.values())
-            weights_dict = {t: iv / total_inv for t, iv in inv_vols.items()}
-        else:
-            w = 1 / n_sel
-            weights_dict = {t: w for t in selected.index}
-
-        # ── 포트폴리오 수익률 (가중 적용) ─────────────────
-        port_ret = 0.0
-        sel_returns = {}
-        for t in selected.index:
-            r = fwd_ret_from_price(price_data, t, date, next_date, use_next_open)
-            if np.isnan(r):
-                r = _delisted_return(price_data, t, date, next_date, use_next_open)
-            sel_returns[t] = r
-            port_ret += weights_dict[t] * r
-
-        # ── 유니버스 평균·Bottom N 수익률 (선정 품질 지표용) ──
-        all_fwd = cur_snap["_fwd_return"].dropna()
-        univ_avg_ret = float(all_fwd.mean()) if len(all_fwd) > 0 else np.nan
-        # Bottom N: 예측 점수 최하위 N개
-        bottom_n = pred_series.nsmallest(n_stocks)
-        bottom_ret = 0.0
-        n_bot = len(bottom_n)
-        for t in bottom_n.index:
-            r = fwd_ret_from_price(price_data, t, date, next_date, use_next_open)
-            if np.isnan(r):
-                r = _delisted_return(price_data, t, date, next_date, use_next_open)
-            bottom_ret += r
-        if n_bot > 0:
-            bottom_ret /= n_bot
-        # 적중률: TOP N 중 유니버스 평균 초과 종목 비율
-        if not np.isnan(univ_avg_ret) and sel_returns:
-            precision = sum(1 for r in sel_returns.values()
-                           if not np.isnan(r) and r > univ_avg_ret) / len(sel_returns)
-        else:
-            precision = np.nan
-
-        # ── Turnover 계산 + 거래비용 적용 ─────────────────
-        # turnover = 신규 편입 종목 수 / 전체 보유 종목 수
-        # 첫 리밸런싱은 전체 신규 매수이므로 turnover = 1.0
-        new_selected = set(selected.index)
-        if not prev_selected:
-            turnover = 1.0
-        else:
-            newly_bought = len(new_selected - prev_selected)
-            turnover = newly_bought / max(len(new_selected), 1)
-        prev_selected = new_selected
-
-        # 실제 거래비용 = 설정 TC × turnover (교체된 비중에만 비용 발생)
-        tc_actual = (tc_pct / 100) * turnover
-        current_value *= (1 + port_ret - tc_actual)
-        portfolio_dates.append(next_date)
-        portfolio_values.append(current_value)
-
-        # ── 리밸런싱 히스토리 ─────────────────────────────
-        ticker_rows = []
-        for t in selected.index:
-            if use_ensemble:
-                row_d = {"ticker": t,
-                         "비중": f"{weights_dict.get(t, 0):.1%}",
-                         "평균순위": avg_rank.get(t, np.nan),
-                         "RF순위": rank_rf.get(t, np.nan),
-                         "XGB순위": rank_xgb.get(t, np.nan),
-                         "LGBM순위": rank_lgbm.get(t, np.nan),
-                         "실제수익률": actual.get(t, np.nan)}
-            else:
-                row_d = {"ticker": t,
-                         "비중": f"{weights_dict.get(t, 0):.1%}",
-                         "예측수익률": pred_series[t],
-                         "실제수익률": actual.get(t, np.nan)}
-            for fc in feature_cols:
-                row_d[FEAT_NAMES.get(fc, fc)] = cur_snap.loc[t, fc] if fc in cur_snap.columns else np.nan
-            ticker_rows.append(row_d)
-
-        top10 = sorted(imp_dict.items(), key=lambda x: x[1], reverse=True)[:10]
-        rebal_history.append({
-            "rebalance_date":  date,
-            "next_date":       next_date,
-            "holding_period":  f"{date.strftime('%Y-%m-%d')} ~ {next_date.strftime('%Y-%m-%d')}",
-            "learn_start":     rebal_dates[i - rolling_win].strftime("%Y-%m-%d"),
-            "selected":        list(selected.index),
-            "ticker_df":       pd.DataFrame(ticker_rows),
-            "top10_features":  top10,
-            "port_return":     port_ret,
-            "ic":              ic_val,
-            "turnover":        turnover,
-            "tc_actual":       tc_actual,
-            "univ_avg_ret":    univ_avg_ret,
-            "bottom_ret":      bottom_ret,
-            "precision":       precision,
-        })
-
-        # 마지막 학습 정보 갱신
-        last_win_bounds = win_bounds
-        last_miss_src   = miss_src
-        last_all_cols   = all_train_cols
-        last_avail_cols = avail_cols
-
-        pct = 0.30 + 0.65 * (i - rolling_win) / max(n_dates - rolling_win - 1, 1)
-        progress(min(pct, 0.95), f"백테스트 진행 중 ({date.strftime('%Y-%m')})...")
-
-    progress(0.98, "결과 정리 중...")
-
-    # ── feat_imp_history DataFrame ────────────────────────
-    def _to_fimp_df(rows):
-        if rows:
-            d = pd.DataFrame(rows).set_index("date")
-            d.index = pd.to_datetime(d.index)
-            return d
-        return pd.DataFrame()
-
-    fimp_df      = _to_fimp_df(feat_imp_rows)
-    fimp_rf_df   = _to_fimp_df(feat_imp_rf_rows)
-    fimp_xgb_df  = _to_fimp_df(feat_imp_xgb_rows)
-    fimp_lgbm_df = _to_fimp_df(feat_imp_lgbm_rows)
-
-    ic_df = pd.DataFrame(ic_records) if ic_records else pd.DataFrame()
-
-    # 마지막 학습된 모델·imputer·피처 컬럼·전처리 정보 저장
-    # → 실시간 추천 탭에서 동일 전처리 + 앙상블 예측 적용
-    return {
-        "port_dates":       portfolio_dates,
-        "port_values":      portfolio_values,
-        "ic_df":            ic_df,
-        "fimp_df":          fimp_df,
-        "fimp_rf_df":       fimp_rf_df,
-        "fimp_xgb_df":      fimp_xgb_df,
-        "fimp_lgbm_df":     fimp_lgbm_df,
-        "rebal_hist":       rebal_history,
-        "last_model_rf":    model_rf   if "model_rf"   in dir() else None,
-        "last_model_xgb":   model_xgb  if "model_xgb"  in dir() else None,
-        "last_model_lgbm":  model_lgbm if "model_lgbm" in dir() else None,
-        "last_imputer":     imputer_step if "imputer_step" in dir() else None,
-        "last_avail_cols":  last_avail_cols,
-        "last_all_cols":    last_all_cols,
-        "last_win_bounds":  last_win_bounds,
-        "last_miss_src":    last_miss_src,
-        "use_ensemble":     use_ensemble,
-        "rebal_m":          rolling_win,   # tab_ic 연간 턴오버 계산용
-    }
-
-
-# ═══════════════════════════════════════════════════════════
-# PERFORMANCE METRICS
-# ═══════════════════════════════════════════════════════════
-
-def build_daily_portfolio(results: dict, price_data: dict) -> pd.Series:
-    """리밸런싱 히스토리 + 일별 가격으로 AI 포트폴리오 일단위 시계열 구성."""
-    hist       = results.get("rebal_hist", [])
-    port_dates = [pd.Timestamp(d) for d in results["port_dates"]]
-    port_vals  = results["port_values"]
-
-    # 히스토리나 가격 데이터 없으면 기간 단위 그대로 반환
-    if not hist or not price_data:
-        return pd.Series(port_vals, index=pd.DatetimeIndex(port_dates))
-
-    records: dict = {}
-    cur_val = 1.0
-
-    # ① warm-up 구간 (학습 기간): 첫 운용 시작일 전까지 1.0으로 평탄
-    init_date   = port_dates[0]
-    first_trade = hist[0]["rebalance_date"]
-    for d in pd.bdate_range(init_date, first_trade):
-        records[d] = 1.0
-
-    # ② 리밸런싱별 일단위 포트폴리오 계산
-    for h in hist:
-        s_dt    = h["rebalance_date"]
-        e_dt    = h["next_date"]
-        tickers = h["selected"]
-
-        price_dict = {}
-        for t in tickers:
-            if t not in price_data:
-                continue
-            ohlcv = price_data[t]
-            mask  = (ohlcv.index >= s_dt) & (ohlcv.index <= e_dt)
-            sub   = ohlcv.loc[mask, "Close"].dropna()
-            if len(sub) >= 2:
-                price_dict[t] = sub / float(sub.iloc[0])  # 기간 시작 기준 정규화
-
-        if not price_dict:
-            records[e_dt] = cur_val * (1 + h["port_return"])
-            cur_val = records[e_dt]
-            continue
-
-        # 동일 가중 지수 × 현재 포트폴리오 가치
-        pf_df  = pd.DataFrame(price_dict).dropna(how="all")
-        eq_idx = pf_df.mean(axis=1)
-        for dt, v in eq_idx.items():
-            if dt >= s_dt:
-                records[dt] = float(v) * cur_val
-
-        cur_val = float(eq_idx.iloc[-1]) * cur_val
-
-    if not records:
-        return pd.Series(port_vals, index=pd.DatetimeIndex(port_dates))
-
-    return pd.Series(records).sort_index()
-
-
-def calc_metrics(series: pd.Series, label: str, rf: float = 0.03) -> dict:
-    """성과 지표 계산. rf: 연간 무위험수익률 (소수, 예: 0.05 = 5%).
-    Sharpe/Sortino: 데이터 빈도 자동 감지 후 올바른 연율화 계수 적용.
-    """
-    if len(series) < 2:
-        return {"지표": label}
-    r  = series.pct_change().dropna()
-    yr = (series.index[-1] - series.index[0]).days / 365.25
-    total = series.iloc[-1] / series.iloc[0] - 1
-    cagr  = (series.iloc[-1] / series.iloc[0]) ** (1 / max(yr, 0.01)) - 1
-
-    # 데이터 빈도 자동 감지: 평균 간격(일)으로 판단
-    if len(r) >= 2:
-        avg_gap = (series.index[-1] - series.index[0]).days / len(r)
-        if avg_gap > 15:      # 월간 (간격 ~21일)
-            ann_factor = 12
-        elif avg_gap > 3:     # 주간 (간격 ~5일)
-            ann_factor = 52
-        else:                 # 일간 (간격 ~1일)
-            ann_factor = 252
-    else:
-        ann_factor = 252
-
-    vol = r.std() * np.sqrt(ann_factor)
-
-    # Sharpe: 초과수익 평균 / 표준편차 → 연율화
-    period_rf = rf / ann_factor
-    excess    = r - period_rf
-    sharpe    = excess.mean() / excess.std() * np.sqrt(ann_factor) if excess.std() > 0 else 0
-
-    # Sortino: 초과수익 평균 / 하방 편차 → 연율화
-    neg_excess = excess[excess < 0]
-    sortino    = excess.mean() / neg_excess.std() * np.sqrt(ann_factor) if len(neg_excess) > 1 else 0
-
-    dd = (series / series.cummax() - 1)
-    mdd    = dd.min()
-    calmar = cagr / abs(mdd) if mdd != 0 else 0
-    monthly = series.resample("ME").last().pct_change().dropna()
-    win_rate = (monthly > 0).mean() if len(monthly) > 0 else 0
-    return {
-        "전략":     label,
-        "총수익률": f"{total:.1%}",
-        "CAGR":     f"{cagr:.1%}",
-        "연변동성": f"{vol:.1%}",
-        "Sharpe":   f"{sharpe:.2f}",
-        "Sortino":  f"{sortino:.2f}",
-        "Max DD":   f"{mdd:.1%}",
-        "Calmar":   f"{calmar:.2f}",
-        "월승률":   f"{win_rate:.1%}",
-    }
+    return engine.get_sp1500_info(warn=st.warning)
 
 
-def norm_series(s: pd.Series, ref: pd.Timestamp) -> pd.Series:
-    s = s.dropna()
-    idx = s.index[s.index >= ref]
-    if not len(idx):
-        return s
-    return s[idx] / s[idx[0]]
+download_price_data  = st.cache_data(ttl=3600, show_spinner=False)(engine.download_price_data)
+get_fundamental_yf   = st.cache_data(ttl=7200, show_spinner=False)(engine.get_fundamental_yf)
+get_benchmark_prices = st.cache_data(ttl=3600, show_spinner=False)(engine.get_benchmark_prices)
+get_sp500_changes    = st.cache_data(ttl=86400, show_spinner=False)(engine.get_sp500_changes)
+get_riskfree_rate    = st.cache_data(ttl=86400, show_spinner=False)(engine.get_riskfree_rate)
+get_pit_financials   = st.cache_data(ttl=86400, show_spinner=False)(engine.get_pit_financials)
 
 
 # ═══════════════════════════════════════════════════════════
 # TAB 0 ── 요약 대시보드
 # ═══════════════════════════════════════════════════════════
 
-def tab_summary(results: dict, benchmarks: dict, price_data: dict,
+def tab_summary(results: dict, benchmarks: dict, panel: dict,
                 fund_map: dict = None, tech_map: dict = None, n_stocks: int = 5,
                 rf: float = 0.03,
-                pit_map: dict = None, spy_close: pd.Series = None,
+                pit_table: pd.DataFrame = None, spy_close: pd.Series = None,
                 vix_close: pd.Series = None, sector_map: dict = None):
     """전체 탭의 핵심 항목을 한 화면에 요약."""
     pd_ = results["port_dates"]
@@ -1983,7 +231,7 @@ def tab_summary(results: dict, benchmarks: dict, price_data: dict,
 
     with col_chart:
         st.markdown('<div class="section-hdr">📈 누적 수익률</div>', unsafe_allow_html=True)
-        port_daily = build_daily_portfolio(results, price_data)
+        port_daily = build_daily_portfolio(results, panel)
         port_daily_active = port_daily[port_daily.index >= trade_start]
         if len(port_daily_active) >= 2:
             port_daily_active = port_daily_active / port_daily_active.iloc[0]
@@ -2190,15 +438,14 @@ def tab_summary(results: dict, benchmarks: dict, price_data: dict,
         _use_inv_vol = _cfg.get("use_inv_vol_weight", False)
 
         if (model_rf is not None and last_imputer is not None
-                and last_all_cols and price_data and tech_map is not None
-                and fund_map is not None):
-            all_max = [ohlcv.index.max() for ohlcv in price_data.values() if len(ohlcv) > 0]
-            latest_date = max(all_max) if all_max else pd.Timestamp.today()
+                and last_all_cols and panel is not None and panel["tickers"]
+                and tech_map is not None and fund_map is not None):
+            latest_date = panel["dates"][-1] if len(panel["dates"]) else pd.Timestamp.today()
             st.caption(f"기준일: {latest_date.strftime('%Y-%m-%d')}")
 
             cur_snap = build_snapshot_df(
-                list(price_data.keys()), tech_map, fund_map, latest_date,
-                pit_map=pit_map, price_data=price_data,
+                panel["tickers"], tech_map, fund_map, latest_date,
+                pit_table=pit_table, panel=panel,
             )
             if not cur_snap.empty:
                 cur_snap = enrich_snapshot(
@@ -2303,7 +550,7 @@ def tab_summary(results: dict, benchmarks: dict, price_data: dict,
 # TAB 1 ── 성과 비교
 # ═══════════════════════════════════════════════════════════
 
-def tab_performance(results: dict, benchmarks: dict, price_data: dict, rf: float = 0.03):
+def tab_performance(results: dict, benchmarks: dict, panel: dict, rf: float = 0.03):
     pd_ = results["port_dates"]
     pv_ = results["port_values"]
 
@@ -2327,7 +574,7 @@ def tab_performance(results: dict, benchmarks: dict, price_data: dict, rf: float
     metrics_all = [calc_metrics(port_active, "🤖 AI 전략", rf=rf)]
 
     # 차트용: 일단위 시리즈 (운용 시작 시점부터)
-    port_daily = build_daily_portfolio(results, price_data)
+    port_daily = build_daily_portfolio(results, panel)
     port_daily_active = port_daily[port_daily.index >= trade_start]
     if len(port_daily_active) >= 2:
         port_daily_active = port_daily_active / port_daily_active.iloc[0]
@@ -2570,6 +817,28 @@ def tab_ic(results: dict):
         if model_stats:
             st.dataframe(pd.DataFrame(model_stats), use_container_width=True, hide_index=True)
 
+        # 웜스타트 vs 전체 재학습 (같은 윈도우에서 둘 다 학습한 기간만 비교)
+        if "IC_full" in ic_df.columns:
+            st.markdown('<div class="section-hdr">🔁 웜스타트 vs 전체 재학습 IC</div>',
+                        unsafe_allow_html=True)
+            both = ic_df.dropna(subset=["IC_full"])
+            warm_rows = []
+            for key, name in [("IC", "앙상블"), ("IC_XGB", "XGBoost"), ("IC_LGBM", "LightGBM")]:
+                w_, f_ = both[key], both[f"{key}_full"]
+                warm_rows.append({
+                    "모델": name,
+                    "웜스타트 평균 IC": f"{w_.mean():.4f}",
+                    "전체 재학습 평균 IC": f"{f_.mean():.4f}",
+                    "차이": f"{w_.mean() - f_.mean():+.4f}",
+                    "IC 상관": f"{w_.corr(f_):.3f}" if len(both) > 2 else "N/A",
+                })
+            ts = results.get("train_stats") or {}
+            st.caption(
+                f"비교 기간 {len(both)}회 · 부스팅 학습 시간: 웜스타트 "
+                f"{ts.get('boost_warm_sec', 0):.1f}초 vs 전체 재학습 {ts.get('boost_full_sec', 0):.1f}초"
+            )
+            st.dataframe(pd.DataFrame(warm_rows), use_container_width=True, hide_index=True)
+
         st.markdown("<br>", unsafe_allow_html=True)
 
     # IC 막대 + 누적 IC (앙상블 기준)
@@ -3097,10 +1366,76 @@ def tab_tracking(results: dict, price_data: dict):
 # TAB 7 ── 실시간 AI 추천
 # ═══════════════════════════════════════════════════════════
 
-def tab_realtime(price_data: dict, fund_map: dict, tech_map: dict,
-                 results: dict, n_stocks: int, pit_map: dict = None,
+TECH_STATE_FILE = os.path.join(PRICE_STORE_DIR, "_tech_state.json")
+
+
+def _base_tech_states(price_data: dict, tech_map: dict, spy_close: pd.Series) -> dict:
+    """데이터 종료일 기준 종목별 스트리밍 상태 (세션 → 디스크 → 신규 구성 순).
+    마지막 날짜가 tech_map과 다르거나 구성 이력 지문(종목 OHLCV·SPY)이 바뀐 상태는
+    다시 구성 후 디스크에 저장 (같은 종료일의 수정주가 재조정·SPY 이력 변경 포함).
+    """
+    states = st.session_state.get("tech_state")
+    if states is None:
+        states = load_tech_states(TECH_STATE_FILE)
+    fresh = {}
+    for t, td in tech_map.items():
+        s_ = states.get(t)
+        if (s_ is None or len(td) == 0 or s_.get("has_spy") != (spy_close is not None)
+                or s_.get("last_date") != td.index[-1].isoformat()
+                or (t in price_data
+                    and s_.get("source") != tech_state_source(price_data[t], spy_close))):
+            if t not in price_data:
+                continue
+            s_ = init_tech_state(price_data[t], spy_close=spy_close)
+            fresh[t] = s_
+        states[t] = s_
+    if fresh:
+        try:
+            save_tech_states(states, TECH_STATE_FILE)
+        except OSError:
+            pass
+    st.session_state.tech_state = states
+    return states
+
+
+def roll_forward_realtime(price_data: dict, panel: dict, tech_map: dict,
+                          spy_close: pd.Series, target: pd.Timestamp):
+    """데이터 종료일 이후 ~ target의 새 봉만 받아 지표 행을 증분 추가.
+    반환: (tech_map, panel, spy_close, 추가된 봉 수) — 원본은 변경하지 않음.
+    """
+    last = panel["dates"][-1]
+    start = (last + timedelta(days=1)).strftime("%Y-%m-%d")
+    end   = (target + timedelta(days=1)).strftime("%Y-%m-%d")
+    tickers = panel["tickers"]
+    update_price_store(tickers, start, end)
+    new = {t: df.loc[df.index > last] for t, df in read_price_store(tickers, start, end).items()}
+    new = {t: df for t, df in new.items() if len(df) > 0 and t in tech_map}
+    if not new:
+        return tech_map, panel, spy_close, 0
+
+    if spy_close is not None:
+        spy_new = load_price_history("SPY", start, end)
+        if not spy_new.empty:
+            spy_close = pd.concat([spy_close, spy_new["Close"].loc[lambda x: x.index > spy_close.index[-1]]])
+
+    base = _base_tech_states(price_data, {t: tech_map[t] for t in new}, spy_close)
+    ext_map = dict(tech_map)
+    for t, bars in new.items():
+        if t not in base:
+            continue
+        state = json.loads(json.dumps(base[t]))   # 기준 상태는 보존
+        rows = [update_tech_state(state, d, bar,
+                                  spy_close.asof(d) if spy_close is not None else np.nan)
+                for d, bar in bars.iterrows()]
+        ext_map[t] = pd.concat([tech_map[t], pd.DataFrame(rows, index=bars.index)])
+    n_new = max(len(b) for b in new.values())
+    return ext_map, extend_price_panel(panel, new), spy_close, n_new
+
+
+def tab_realtime(panel: dict, fund_map: dict, tech_map: dict,
+                 results: dict, n_stocks: int, pit_table: pd.DataFrame = None,
                  spy_close: pd.Series = None, vix_close: pd.Series = None,
-                 sector_map: dict = None):
+                 sector_map: dict = None, price_data: dict = None):
     st.markdown('<div class="section-hdr">🔴 AI 추천 종목</div>', unsafe_allow_html=True)
 
     fimp = results.get("fimp_df", pd.DataFrame())
@@ -3109,10 +1444,9 @@ def tab_realtime(price_data: dict, fund_map: dict, tech_map: dict,
         return
 
     # ── 날짜 선택 UI ──────────────────────────────────────
-    all_dates_max = [ohlcv.index.max().date() for ohlcv in price_data.values() if len(ohlcv) > 0]
-    all_dates_min = [ohlcv.index.min().date() for ohlcv in price_data.values() if len(ohlcv) > 0]
-    max_avail = max(all_dates_max) if all_dates_max else datetime.today().date()
-    min_avail = min(all_dates_min) if all_dates_min else datetime.today().date() - timedelta(days=365)
+    p_dates   = panel["dates"]
+    max_avail = p_dates[-1].date() if len(p_dates) else datetime.today().date()
+    min_avail = p_dates[0].date() if len(p_dates) else datetime.today().date() - timedelta(days=365)
     # 백테스트 종료일 다음날을 기본값으로 설정
     _saved_cfg = st.session_state.get("cfg") or {}
     _bt_end = _saved_cfg.get("end")
@@ -3140,9 +1474,24 @@ def tab_realtime(price_data: dict, fund_map: dict, tech_map: dict,
 
     today = pd.Timestamp(sel_date)
 
+    # 데이터 종료일 이후 날짜: 새 봉만 받아 스트리밍 상태로 지표 증분 갱신
+    if price_data and len(p_dates) and today > p_dates[-1]:
+        ext = st.session_state.get("realtime_ext")
+        if ext is None or ext["target"] != today or ext["base_end"] != p_dates[-1]:
+            with st.spinner("데이터 종료일 이후 가격 반영 중..."):
+                tm, pn, sp, n_new = roll_forward_realtime(price_data, panel, tech_map,
+                                                          spy_close, today)
+            ext = {"target": today, "base_end": p_dates[-1], "tech_map": tm,
+                   "panel": pn, "spy_close": sp, "n_new": n_new}
+            st.session_state.realtime_ext = ext
+        tech_map, panel, spy_close = ext["tech_map"], ext["panel"], ext["spy_close"]
+        if ext["n_new"]:
+            st.caption(f"📡 백테스트 데이터 이후 {ext['n_new']}거래일을 증분 반영했습니다 "
+                       f"(기준 {panel['dates'][-1].strftime('%Y-%m-%d')}).")
+
     with st.spinner("최신 지표 계산 중..."):
-        cur_snap = build_snapshot_df(list(price_data.keys()), tech_map, fund_map, today,
-                                     pit_map=pit_map, price_data=price_data)
+        cur_snap = build_snapshot_df(panel["tickers"], tech_map, fund_map, today,
+                                     pit_table=pit_table, panel=panel)
         if not cur_snap.empty:
             cur_snap = enrich_snapshot(cur_snap, today,
                                       spy_close=spy_close, vix_close=vix_close,
@@ -3261,13 +1610,16 @@ def tab_realtime(price_data: dict, fund_map: dict, tech_map: dict,
     # ── 전체 종목 상세 테이블 ──────────────────────────────
     st.markdown(f"**{today.strftime('%Y-%m-%d')} 기준 전체 분석 종목 AI 점수 순위 ({len(all_recs)}개)**")
     rec_rows = []
+    adv_now = dict(zip(all_recs.index, panel_asof(panel, "ADV", today, all_recs.index)))
     for rank, (t, score) in enumerate(all_recs.items(), 1):
         stars = consensus.get(t, 0)
         star_str = "★" * stars if stars > 0 else ""
+        adv = adv_now.get(t, np.nan)
         row = {"순위": rank, "티커": t, "AI 점수": round(score, 3),
                "추천": "O" if t in top_recs.index else "",
                "비중": f"{rec_weights[t]:.1%}" if t in rec_weights else "",
-               "합의도": star_str if consensus else ""}
+               "합의도": star_str if consensus else "",
+               "거래대금(20일)": f"${adv / 1e6:,.1f}M" if not np.isnan(adv) else "N/A"}
         for col, fmt in [
             ("Mom_1m",  "pct"), ("Mom_3m",  "pct"), ("Mom_6m",  "pct"),
             ("RSI_14",  "f1"),  ("P_E",     "f1"),  ("P_B",     "f2"),
@@ -3351,6 +1703,92 @@ def tab_realtime(price_data: dict, fund_map: dict, tech_map: dict,
         st.plotly_chart(fig3, use_container_width=True)
 
 
+# ═══════════════════════════════════════════════════════════
+# TAB 8 ── 파라미터 스윕
+# ═══════════════════════════════════════════════════════════
+
+def tab_sweep(results: dict, cfg: dict, rf: float = 0.03):
+    """포트폴리오 설정 그리드를 캐시된 예측 점수로 일괄 평가 (모델 재학습 없음)."""
+    preds = results.get("preds")
+    if not preds or not preds.get("rows"):
+        st.info("스윕할 예측 결과가 없습니다. 백테스트를 다시 실행해 주세요.")
+        return
+
+    st.markdown('<div class="section-hdr">🧪 포트폴리오 파라미터 스윕</div>',
+                unsafe_allow_html=True)
+    st.caption("모델 예측 점수·forward 수익률은 그대로 두고 종목 수·거래비용·버퍼·가중 방식 "
+               "조합만 바꿔 평가합니다. 수백 개 조합도 백테스트 1회보다 빠르게 계산됩니다.")
+
+    cur_n  = int(cfg.get("n_stocks", 5))
+    cur_tc = float(cfg.get("tc_pct", 0.3))
+    sc1, sc2, sc3 = st.columns(3)
+    n_list = sc1.multiselect("투자 종목 수", list(range(1, 31)),
+                             default=sorted({3, 5, 10, 15, cur_n}), key="sweep_n")
+    tc_list = sc2.multiselect("거래비용 (%)", [0.0, 0.1, 0.2, 0.3, 0.5, 1.0],
+                              default=sorted({0.1, 0.3, cur_tc}), key="sweep_tc")
+    bp_list = sc3.multiselect("버퍼 가산점", [0.02, 0.05, 0.10, 0.20],
+                              default=[0.05], key="sweep_bp")
+    sc4, sc5, sc6 = st.columns(3)
+    _onoff = {"OFF": False, "ON": True}
+    buf_list = sc4.multiselect("턴오버 버퍼", list(_onoff), default=["OFF", "ON"], key="sweep_buf")
+    iv_list  = sc5.multiselect("역변동성 가중", list(_onoff), default=["OFF", "ON"], key="sweep_iv")
+    mf_list  = sc6.multiselect("모멘텀 필터", list(_onoff), default=["OFF", "ON"], key="sweep_mf")
+
+    grid = {
+        "n_stocks":            n_list,
+        "tc_pct":              tc_list,
+        "use_turnover_buffer": [_onoff[x] for x in buf_list],
+        "turnover_buffer_pct": bp_list,
+        "use_inv_vol_weight":  [_onoff[x] for x in iv_list],
+        "use_mom_filter":      [_onoff[x] for x in mf_list],
+    }
+    grid = {k: v for k, v in grid.items() if v}
+    n_comb = int(np.prod([len(v) for v in grid.values()])) if grid else 1
+
+    if st.button(f"🧪 스윕 실행 ({n_comb}개 조합)", key="sweep_run"):
+        t0 = time.time()
+        st.session_state.sweep_df = sweep_portfolio(preds, grid, base=cfg, rf=rf)
+        st.session_state.sweep_sec = time.time() - t0
+
+    sw = st.session_state.get("sweep_df")
+    if sw is None or sw.empty or "Sharpe" not in sw.columns:
+        return
+
+    st.caption(f"{len(sw)}개 조합 · {st.session_state.get('sweep_sec', 0):.2f}초")
+    sort_by = st.selectbox("정렬 기준", ["Sharpe", "CAGR", "Calmar", "Max DD", "평균턴오버"],
+                           key="sweep_sort")
+    disp = sw.sort_values(sort_by, ascending=(sort_by == "평균턴오버")).reset_index(drop=True)
+    # 현재 설정과 같은 조합 표시
+    is_cur = np.ones(len(disp), dtype=bool)
+    for k in PORTFOLIO_KEYS:
+        is_cur &= (disp[k] == cfg.get(k, SWEEP_DEFAULTS[k])).to_numpy()
+    disp.insert(0, "현재", np.where(is_cur, "◀", ""))
+    for k in ["use_turnover_buffer", "use_inv_vol_weight", "use_mom_filter"]:
+        disp[k] = disp[k].map({True: "ON", False: "OFF"})
+    disp = disp.rename(columns={
+        "n_stocks": "종목수", "tc_pct": "거래비용(%)", "use_turnover_buffer": "버퍼",
+        "turnover_buffer_pct": "버퍼가산", "use_inv_vol_weight": "역변동성",
+        "use_mom_filter": "모멘텀필터",
+    })
+    pct_cols = ["총수익률", "CAGR", "연변동성", "Max DD", "평균턴오버", "적중률"]
+    st.dataframe(
+        disp.style.format({**{c: "{:.1%}" for c in pct_cols},
+                           "Sharpe": "{:.2f}", "Sortino": "{:.2f}", "Calmar": "{:.2f}",
+                           "버퍼가산": "{:.0%}", "거래비용(%)": "{:.2f}"}),
+        use_container_width=True, hide_index=True, height=420,
+    )
+
+    # Sharpe vs 턴오버 산점도
+    fig = px.scatter(
+        disp, x="평균턴오버", y="Sharpe", color="CAGR",
+        hover_data=["종목수", "거래비용(%)", "버퍼", "버퍼가산", "역변동성", "모멘텀필터"],
+        color_continuous_scale="RdYlGn",
+    )
+    fig.update_layout(**PLOT_CFG, height=380, margin=dict(l=50, r=30, t=30, b=50))
+    fig.update_xaxes(tickformat=".0%")
+    st.plotly_chart(fig, use_container_width=True)
+
+
 # ═══════════════════════════════════════════════════════════
 # TOP BAR (모바일 대응 상단 설정 바)
 # ═══════════════════════════════════════════════════════════
@@ -3421,7 +1859,7 @@ def render_topbar(sp1500_df: pd.DataFrame, all_sectors: list) -> dict:
         # ── 고급 설정 ─────────────────────────────────────
         st.markdown("---")
         st.markdown("**🔬 고급 설정**")
-        ac1, ac2 = st.columns(2)
+        ac1, ac2, ac3 = st.columns(3)
         with ac1:
             min_dollar_vol = st.number_input(
                 "최소 일평균 거래대금 ($)",
@@ -3438,6 +1876,16 @@ def render_topbar(sp1500_df: pd.DataFrame, all_sectors: list) -> dict:
                 help="당일 종가: 리밸런싱일 종가에 매매 / T+1 시가: 다음 영업일 시가에 매매 (더 현실적)",
             )
         use_next_open = (exec_price == "T+1 시가")
+        with ac3:
+            n_cpu = detect_cpu_budget()
+            cpu_budget = st.number_input(
+                "연산 코어 예산",
+                min_value=1, max_value=n_cpu,
+                value=n_cpu, step=1,
+                help=f"모델 학습에 쓸 코어 수 (자동 감지: {n_cpu}코어, cgroup 할당량 반영). "
+                     "윈도우 병렬 × 모델 병렬(RF/XGB/LGBM 동시 학습) × 트리 n_jobs로 "
+                     "예산을 넘지 않게 자동 분배합니다.",
+            )
 
         ck1, ck2, ck3 = st.columns(3)
         with ck1:
@@ -3481,6 +1929,28 @@ def render_topbar(sp1500_df: pd.DataFrame, all_sectors: list) -> dict:
                      "추천 탭에서 종목별 투자 비중(%)을 함께 표시합니다.",
             )
 
+        rt1, rt2, rt3 = st.columns(3)
+        with rt1:
+            retrain_every = st.slider(
+                "재학습 주기 (기간 수)", 1, 12, 1, 1,
+                help="k기간마다 모델을 새로 학습하고, 사이 기간은 직전 모델로 예측만 합니다. "
+                     "1 = 매 리밸런싱 재학습 (기존 방식).",
+            )
+        with rt2:
+            retune_every = st.slider(
+                "하이퍼파라미터 재튜닝 주기 (기간 수)", 1, 24, 1, 1,
+                help="RF 하이퍼파라미터 탐색(Purged CV + Successive Halving)을 이 주기마다만 다시 수행합니다. "
+                     "사이 재학습은 직전 최적 파라미터를 그대로 사용합니다.",
+            )
+        with rt3:
+            warm_rounds = st.slider(
+                "부스팅 웜스타트 추가 라운드 (0 = 끔)", 0, 100, 0, 10,
+                disabled=not use_ensemble,
+                help="앙상블 모드에서 XGBoost·LightGBM을 직전 윈도우 부스터에 이어 "
+                     "지정한 라운드만 추가 학습합니다. 6회 학습마다 처음부터 재학습하며, "
+                     "IC 분석 탭에서 전체 재학습 기준선과 IC를 비교합니다.",
+            )
+
         # ── 날짜 설정 ────────────────────────────────────
         st.markdown("---")
         MIN_TEST    = 5
@@ -3502,6 +1972,13 @@ def render_topbar(sp1500_df: pd.DataFrame, all_sectors: list) -> dict:
                 f"리밸런싱 1회 = {rebal_m}개월)"
             )
 
+        extend_run = st.checkbox(
+            "이전 결과 이어서 계산 (종료일 연장)",
+            value=True,
+            help="같은 설정으로 종료일만 늘어난 경우, 직전 결과의 스냅샷·모델을 재사용하고 "
+                 "새 리밸런싱 날짜만 계산합니다. 결과는 전체 재실행과 동일합니다.",
+        )
+
         # ── 실행 버튼 ────────────────────────────────────
         run_btn = st.button("🚀 백테스트 실행", type="primary", use_container_width=True)
 
@@ -3524,6 +2001,11 @@ def render_topbar(sp1500_df: pd.DataFrame, all_sectors: list) -> dict:
         "use_mom_filter":        use_mom_filter,
         "use_turnover_buffer":   use_turnover_buffer,
         "use_inv_vol_weight":    use_inv_vol_weight,
+        "cpu_budget":            int(cpu_budget),
+        "retrain_every":         retrain_every,
+        "retune_every":          retune_every,
+        "warm_rounds":           warm_rounds if use_ensemble else 0,
+        "extend":                extend_run,
     }
 
 
@@ -3547,9 +2029,10 @@ def main():
     cfg = render_topbar(sp1500_df, all_sectors)
 
     # ── 세션 상태 초기화 ──────────────────────────────────
-    for k in ["results", "benchmarks", "price_data", "fund_map", "tech_map",
-              "cfg", "rf_rate", "pit_map", "sp500_changes",
-              "spy_close", "vix_close", "sector_map"]:
+    for k in ["results", "benchmarks", "price_data", "price_panel", "fund_map", "tech_map",
+              "tech_state", "realtime_ext",
+              "cfg", "rf_rate", "pit_map", "pit_table", "sp500_changes",
+              "spy_close", "vix_close", "sector_map", "sweep_df", "pipeline_cache"]:
         if k not in st.session_state:
             st.session_state[k] = None
 
@@ -3587,95 +2070,134 @@ def main():
             _prog_slot.progress(val, msg)
             _status_slot.info(msg)
 
+        # ── 파이프라인 캐시: 설정이 바뀐 단계와 그 하위 단계만 재계산 (PIPELINE_DAG) ──
+        cache = st.session_state.pipeline_cache
+        if cache is None:
+            cache = st.session_state.pipeline_cache = {}
+        fps: dict = {}    # 단계 → 지문
+        ran: list = []    # 재계산된 단계 (상태 메시지용)
+
+        def _stage(name, fn, disk=True):
+            fps[name] = stage_fingerprint(name, cfg, fps)
+            out, did = cached_stage(cache, name, fps[name], fn, disk=disk)
+            if did:
+                ran.append(name)
+            return out
+
+        def _ticker_stage(name, ticker_fps, fn, disk=True):
+            out, n_new, fps[name] = cached_ticker_stage(cache, name, ticker_fps, fn, disk=disk)
+            if n_new:
+                ran.append(f"{name}({n_new}종목)")
+            return out
+
         # 0. 생존자 편향 보정: S&P 500 변경 이력 로드 + 과거 퇴출 종목 추가
-        sp500_changes = None
-        current_sp500 = None
-        extra_hist_tickers = []
-        if cfg.get("use_surv_fix", False):
-            update_prog(0.01, "📜 S&P 500 변경 이력 로드 중 (생존자 편향 보정)...")
-            sp500_changes = get_sp500_changes()
-            current_sp500 = sp1500_df[sp1500_df["cap_tier"] == "Large Cap"]["ticker"].tolist()
-            if not sp500_changes.empty:
-                # 백테스트 기간 중 퇴출된 종목 → 가격 데이터도 다운로드 필요
-                # 단, 사용자가 선택한 섹터에 해당하는 종목만 추가
-                bt_start = pd.Timestamp(cfg["start"])
-                removed_in_period = sp500_changes[
-                    (sp500_changes["date"] >= bt_start) &
-                    (sp500_changes["removed_ticker"] != "")
-                ]["removed_ticker"].unique().tolist()
-                # 섹터 필터: sp1500_df에 있으면 섹터 확인, 없으면 포함 (과거 종목이라 목록에 없을 수 있음)
-                sel_sectors = set(cfg.get("sectors", []))
-                filtered_removed = []
-                for t in removed_in_period:
-                    match = sp1500_df[sp1500_df["ticker"] == t]
-                    if not match.empty:
-                        if match.iloc[0].get("sector", "") in sel_sectors:
-                            filtered_removed.append(t)
-                    # sp1500_df에 없는 퇴출 종목은 섹터 확인 불가 → 제외 (안전 우선)
-                extra_hist_tickers = [t for t in filtered_removed if t not in universe]
-                st.session_state.sp500_changes = sp500_changes
-
-        # 1. 가격 데이터
-        all_tickers = list(set(universe + extra_hist_tickers))
+        def _universe():
+            sp500_changes = None
+            current_sp500 = None
+            extra_hist_tickers = []
+            if cfg.get("use_surv_fix", False):
+                update_prog(0.01, "📜 S&P 500 변경 이력 로드 중 (생존자 편향 보정)...")
+                sp500_changes = get_sp500_changes()
+                current_sp500 = sp1500_df[sp1500_df["cap_tier"] == "Large Cap"]["ticker"].tolist()
+                if not sp500_changes.empty:
+                    # 백테스트 기간 중 퇴출된 종목 → 가격 데이터도 다운로드 필요
+                    # 단, 사용자가 선택한 섹터에 해당하는 종목만 추가
+                    bt_start = pd.Timestamp(cfg["start"])
+                    removed_in_period = sp500_changes[
+                        (sp500_changes["date"] >= bt_start) &
+                        (sp500_changes["removed_ticker"] != "")
+                    ]["removed_ticker"].unique().tolist()
+                    # 섹터 필터: sp1500_df에 있으면 섹터 확인, 없으면 포함 (과거 종목이라 목록에 없을 수 있음)
+                    sel_sectors = set(cfg.get("sectors", []))
+                    filtered_removed = []
+                    for t in removed_in_period:
+                        match = sp1500_df[sp1500_df["ticker"] == t]
+                        if not match.empty:
+                            if match.iloc[0].get("sector", "") in sel_sectors:
+                                filtered_removed.append(t)
+                        # sp1500_df에 없는 퇴출 종목은 섹터 확인 불가 → 제외 (안전 우선)
+                    extra_hist_tickers = [t for t in filtered_removed if t not in universe]
+
+            # 섹터 맵 구성 (Sector RS 계산용)
+            sector_map = {}
+            for _, row in sp1500_df.iterrows():
+                sector_map[row["ticker"]] = row.get("sector", "Unknown")
+            return sp500_changes, current_sp500, extra_hist_tickers, sector_map
+
+        sp500_changes, current_sp500, extra_hist_tickers, sector_map = _stage(
+            "universe", _universe, disk=False)
+        if sp500_changes is not None:
+            st.session_state.sp500_changes = sp500_changes
+
+        # 1. 가격 데이터 (종목별 캐시 — 디스크는 가격 저장소)
+        all_tickers = sorted(set(universe + extra_hist_tickers))
         update_prog(0.03, f"📡 {len(all_tickers)}개 종목 가격 데이터 다운로드 중...")
         data_start = cfg["start"] - timedelta(days=400)  # 지표 warm-up
-        price_data = download_price_data(
-            tuple(all_tickers),
-            data_start.strftime("%Y-%m-%d"),
-            cfg["end"].strftime("%Y-%m-%d"),
+        ds, de = data_start.strftime("%Y-%m-%d"), cfg["end"].strftime("%Y-%m-%d")
+        price_data = _ticker_stage(
+            "prices", {t: fingerprint("prices", t, ds, de) for t in all_tickers},
+            lambda miss: download_price_data(tuple(miss), ds, de), disk=False,
         )
         if not price_data:
             st.error("가격 데이터를 불러올 수 없습니다.")
             return
+        # 하위 단계는 가격 내용 기준 지문 (저장소 갱신으로 값이 바뀌면 재계산)
+        price_fps = {t: frame_fingerprint(df) for t, df in price_data.items()}
+        fps["prices"] = fingerprint("prices", sorted(price_fps.items()))
 
         available = list(price_data.keys())
         n_extra = len([t for t in extra_hist_tickers if t in price_data])
         update_prog(0.12, f"✅ {len(available)}개 종목 ({n_extra}개 역사적 퇴출 종목 포함). 펀더멘털 로드 중...")
 
-        # 2. 펀더멘털 데이터 (.info — EV/EBITDA, FCF, 배당 등 유지)
-        fund_map = get_fundamental_yf(tuple(available))
+        # 2. 펀더멘털 데이터 (.info — EV/EBITDA, FCF, 배당 등 유지) — 종목별, 일 단위 갱신
+        today = datetime.today().strftime("%Y-%m-%d")
+        fund_map = _ticker_stage(
+            "fundamentals", {t: fingerprint("fundamentals", t, today) for t in available},
+            lambda miss: get_fundamental_yf(tuple(miss)),
+        )
         fund_ok  = sum(1 for v in fund_map.values() if v)
         update_prog(0.18, f"✅ 펀더멘털 완료: {fund_ok}/{len(available)}개. PIT 분기 재무제표 수집 중...")
 
         # 2-b. PIT 분기 재무제표 수집 (P/E·P/B·P/S·ROE·ROA·마진·성장률 개선)
         # 종목 수에 따라 시간이 걸릴 수 있음 (종목당 ~0.5초)
         update_prog(0.20, f"📋 분기 재무제표 수집 중... ({len(available)}개 · 시간이 걸릴 수 있습니다)")
-        pit_map = get_pit_financials(tuple(available))
+        pit_map = _ticker_stage(
+            "pit", {t: fingerprint("pit", t, today) for t in available},
+            lambda miss: get_pit_financials(tuple(miss)),
+        )
         pit_ok  = sum(1 for v in pit_map.values() if not v["income"].empty)
+        pit_table = _stage("pit_table", lambda: build_pit_tables(pit_map))
         update_prog(0.28, f"✅ PIT 재무제표 완료: {pit_ok}/{len(available)}개. 기술지표 계산 중...")
 
         # 3. SPY + VIX 다운로드 + 기술지표 사전 계산
         update_prog(0.28, "📡 SPY·VIX 다운로드 + 기술지표 계산 중...")
-        spy_close = None
-        vix_close = None
-        try:
-            spy_df = yf.download("SPY", start=data_start.strftime("%Y-%m-%d"),
-                                 end=cfg["end"].strftime("%Y-%m-%d"),
-                                 auto_adjust=True, progress=False)
-            if not spy_df.empty:
-                spy_close = spy_df["Close"].squeeze()
-        except Exception:
-            pass
-        try:
-            vix_df = yf.download("^VIX", start=data_start.strftime("%Y-%m-%d"),
-                                 end=cfg["end"].strftime("%Y-%m-%d"),
-                                 auto_adjust=True, progress=False)
-            if not vix_df.empty:
-                vix_close = vix_df["Close"].squeeze()
-        except Exception:
-            pass
-
-        # 섹터 맵 구성 (Sector RS 계산용)
-        sector_map = {}
-        for _, row in sp1500_df.iterrows():
-            sector_map[row["ticker"]] = row.get("sector", "Unknown")
 
-        tech_map = {}
-        for t, ohlcv in price_data.items():
+        def _market():
+            spy_close = None
+            vix_close = None
             try:
-                tech_map[t] = calc_all_technical(ohlcv, spy_close=spy_close)
+                spy_df = load_price_history("SPY", ds, de)
+                if not spy_df.empty:
+                    spy_close = spy_df["Close"].squeeze()
             except Exception:
                 pass
+            try:
+                vix_df = load_price_history("^VIX", ds, de)
+                if not vix_df.empty:
+                    vix_close = vix_df["Close"].squeeze()
+            except Exception:
+                pass
+            return spy_close, vix_close
+
+        spy_close, vix_close = _stage("market", _market, disk=False)
+        fps["market"] = fingerprint("market", frame_fingerprint(spy_close), frame_fingerprint(vix_close))
+
+        # 기술지표: 종목별 (가격 내용 + SPY 지문) — 유니버스 변경 시 새 종목만 계산
+        spy_fp = frame_fingerprint(spy_close)
+        tech_map = _ticker_stage(
+            "technicals", {t: fingerprint("technicals", price_fps[t], spy_fp) for t in available},
+            lambda miss: calc_panel_technical({t: price_data[t] for t in miss}, spy_close=spy_close),
+        )
         update_prog(0.30, f"📈 기술지표 계산 완료 ({len(tech_map)}종목). 백테스트 시작...")
 
         # 4. 리밸런싱 날짜 생성
@@ -3695,8 +2217,15 @@ def main():
             )
             return
 
-        # 5. 백테스트
-        results = run_backtest(
+        # 5. 백테스트 (가격 패널 1회 구성 → 엔진·탭 공용)
+        # 확장 모드: 직전 결과(세션 → 디스크)에서 이어서 계산 — 설정이 다르면 엔진이 전체 실행
+        def _extend_src():
+            if not cfg.get("extend"):
+                return None
+            return st.session_state.results or load_backtest_state()
+
+        price_panel = _stage("panel", lambda: build_price_panel(price_data), disk=False)
+        results = _stage("backtest", lambda: run_backtest(
             price_data=price_data,
             fund_map=fund_map,
             tech_map=tech_map,
@@ -3717,7 +2246,21 @@ def main():
             use_mom_filter=cfg.get("use_mom_filter", True),
             use_turnover_buffer=cfg.get("use_turnover_buffer", False),
             use_inv_vol_weight=cfg.get("use_inv_vol_weight", False),
-        )
+            panel=price_panel,
+            pit_table=pit_table,
+            cpu_budget=cfg.get("cpu_budget"),
+            model_store=MODEL_STORE_DIR,
+            retrain_every=cfg.get("retrain_every", 1),
+            retune_every=cfg.get("retune_every", 1),
+            warm_rounds=cfg.get("warm_rounds", 0),
+            extend_from=_extend_src(),
+            checkpoint=CHECKPOINT_DIR,
+        ))
+        # 캐시된 백테스트 결과 → 현재 포트폴리오 설정으로 재시뮬레이션 (예측 점수 재사용)
+        if "backtest" not in ran:
+            results = resimulate_backtest(results, cfg)
+        save_backtest_state(fps["backtest"])   # 결과는 단계 항목에 1회만 저장, 여기엔 지문만
+        prune_pipeline_cache()
 
         # 6. 벤치마크 데이터
         benchmarks = get_benchmark_prices(
@@ -3735,14 +2278,19 @@ def main():
         st.session_state.results    = results
         st.session_state.rf_rate    = rf_rate
         st.session_state.pit_map    = pit_map
+        st.session_state.pit_table  = pit_table
         st.session_state.benchmarks = benchmarks
         st.session_state.price_data = price_data
+        st.session_state.price_panel = price_panel
         st.session_state.fund_map   = fund_map
         st.session_state.tech_map   = tech_map
+        st.session_state.tech_state   = None
+        st.session_state.realtime_ext = None
         st.session_state.spy_close   = spy_close
         st.session_state.vix_close   = vix_close
         st.session_state.sector_map  = sector_map
         st.session_state.cfg         = cfg
+        st.session_state.sweep_df    = None
 
         _prog_slot.progress(1.0, "✅ 완료!")
         time.sleep(0.4)
@@ -3751,7 +2299,8 @@ def main():
             f"✅ 백테스트 완료! "
             f"{len(rebal_dates)}회 리밸런싱 | "
             f"{len(results['rebal_hist'])}회 학습 | "
-            f"{len(available)}개 종목 분석"
+            f"{len(available)}개 종목 분석 | "
+            f"재계산 단계: {', '.join(ran) if ran else '없음 (전체 캐시)'}"
         )
 
     # ── 결과 표시 ─────────────────────────────────────────
@@ -3759,13 +2308,63 @@ def main():
         results    = st.session_state.results
         benchmarks = st.session_state.benchmarks or {}
         price_data = st.session_state.price_data or {}
+        price_panel = st.session_state.price_panel
+        if price_panel is None:
+            price_panel = build_price_panel(price_data)
+            st.session_state.price_panel = price_panel
         fund_map   = st.session_state.fund_map   or {}
         tech_map   = st.session_state.tech_map   or {}
         saved_cfg  = st.session_state.cfg        or cfg
         rf_rate    = st.session_state.get("rf_rate", 0.03)
+        pit_table  = st.session_state.get("pit_table")
+        if pit_table is None and st.session_state.get("pit_map"):
+            pit_table = build_pit_tables(st.session_state.pit_map)
+            st.session_state.pit_table = pit_table
+
+        # 포트폴리오 설정만 변경 → 캐시된 예측 점수로 재시뮬레이션 (재학습 없음)
+        if (not cfg["run"] and results.get("preds") is not None
+                and portfolio_only_change(saved_cfg, cfg)):
+            t0 = time.time()
+            results   = resimulate_backtest(results, cfg)
+            saved_cfg = {**saved_cfg, **{k: cfg[k] for k in PORTFOLIO_KEYS if k in cfg}}
+            st.session_state.results = results
+            st.session_state.cfg     = saved_cfg
+            _status_slot.info(
+                f"⚡ 포트폴리오 설정 변경 → 캐시된 예측 점수로 재계산 ({time.time() - t0:.2f}초)"
+            )
 
         # 무위험수익률 표시
         st.caption(f"무위험수익률 (T-bill 3M 기간평균): **{rf_rate:.2%}**")
+        ts = results.get("train_stats")
+        if ts:
+            st.caption(
+                f"🤖 모델 학습: 튜닝 {ts['n_tune']}회 · 재학습 {ts['n_fit']}회 · "
+                f"모델 재사용 {ts['n_reuse']}회 (총 {ts['n_windows']}개 윈도우) · "
+                + (f"저장소 로드 {ts['n_stored']}회 · " if ts.get("n_stored") else "")
+                + (f"이전 결과 이어서 계산 (윈도우 {ts['n_extended']}개 재사용) · "
+                   if ts.get("n_extended") else "")
+                + (f"체크포인트에서 재개 (윈도우 {ts['n_resumed']}개) · "
+                   if ts.get("n_resumed") else "")
+                + f"학습 시간 **{ts['fit_sec']:.1f}초** "
+                f"(매 기간 튜닝·재학습 대비 약 **{ts['saved_sec']:.1f}초 절약**)"
+                + (f" · RF 튜닝 트리 {ts['search_trees']:,}개 (GridSearch 기준 {ts['grid_trees']:,}개)"
+                   if ts.get("grid_trees") else "")
+                + (f" · 부스팅 웜스타트 {ts['n_warm']}회 "
+                   f"({ts['boost_warm_sec']:.1f}초, 전체 재학습 시 {ts['boost_full_sec']:.1f}초)"
+                   if ts.get("n_warm") else "")
+            )
+        stage_df = results.get("stage_times")
+        if stage_df is not None and not stage_df.empty:
+            with st.expander("⏱️ 단계별 실행 시간 · 코어 사용률"):
+                plan = next(iter(results.get("compute_plan", {}).values()), None)
+                if plan:
+                    st.caption(f"코어 예산 {plan['budget']}개 · "
+                               f"사용률 = CPU시간 ÷ (실행시간 × 코어 예산)")
+                st.dataframe(
+                    stage_df.style.format({"실행시간(초)": "{:.2f}", "CPU시간(초)": "{:.2f}",
+                                           "코어 사용률": "{:.0%}"}),
+                    use_container_width=True, hide_index=True,
+                )
 
         tabs = st.tabs([
             "🏠 요약",
@@ -3776,19 +2375,20 @@ def main():
             "🗺️ 영향력 히트맵",
             "📊 성과 추적",
             "🔴 AI 추천",
+            "🧪 파라미터 스윕",
         ])
 
         with tabs[0]:
-            tab_summary(results, benchmarks, price_data,
+            tab_summary(results, benchmarks, price_panel,
                         fund_map=fund_map, tech_map=tech_map,
                         n_stocks=saved_cfg.get("n_stocks", 5),
                         rf=rf_rate,
-                        pit_map=st.session_state.get("pit_map"),
+                        pit_table=pit_table,
                         spy_close=st.session_state.get("spy_close"),
                         vix_close=st.session_state.get("vix_close"),
                         sector_map=st.session_state.get("sector_map"))
         with tabs[1]:
-            tab_performance(results, benchmarks, price_data, rf=rf_rate)
+            tab_performance(results, benchmarks, price_panel, rf=rf_rate)
         with tabs[2]:
             tab_ic(results)
         with tabs[3]:
@@ -3800,12 +2400,15 @@ def main():
         with tabs[6]:
             tab_tracking(results, price_data)
         with tabs[7]:
-            tab_realtime(price_data, fund_map, tech_map, results,
+            tab_realtime(price_panel, fund_map, tech_map, results,
                          saved_cfg.get("n_stocks", 10),
-                         pit_map=st.session_state.get("pit_map"),
+                         pit_table=pit_table,
                          spy_close=st.session_state.get("spy_close"),
                          vix_close=st.session_state.get("vix_close"),
-                         sector_map=st.session_state.get("sector_map"))
+                         sector_map=st.session_state.get("sector_map"),
+                         price_data=price_data)
+        with tabs[8]:
+            tab_sweep(results, saved_cfg, rf=rf_rate)
 
 
 if __name__ == "__main__":
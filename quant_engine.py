@@ -0,0 +1,4460 @@
+#!/usr/bin/env python3
+"""
+quant_engine.py
+AI 퀀트 백테스트 엔진 (Streamlit 비의존)
+데이터 수집·가격 저장소 → 가격 패널 → 기술지표 → PIT 재무 → 스냅샷 → 워크포워드 학습·예측
+→ 포트폴리오 시뮬레이션 → 성과 지표, 파이프라인 캐시.
+UI(claude_backtest_Ver4.2.py)와 배치 작업에서 공통 사용. import 시 부작용 없음:
+scikit-learn / SciPy / XGBoost / LightGBM은 학습·계산 함수 안에서 처음 필요할 때 import.
+"""
+
+import pandas as pd
+import numpy as np
+import yfinance as yf
+import requests
+from io import StringIO
+import warnings
+import concurrent.futures
+import itertools
+import time
+import os
+import calendar
+import json
+import hashlib
+import pickle
+import threading
+from urllib.parse import quote
+from datetime import datetime
+
+# ═══════════════════════════════════════════════════════════
+# CONSTANTS
+# ═══════════════════════════════════════════════════════════
+IS_CLOUD = any([
+    os.environ.get("STREAMLIT_SERVER_HEADLESS", "").lower() in ("1", "true"),
+    os.environ.get("STREAMLIT_SHARING_MODE", "") != "",
+    os.environ.get("HOME", "") == "/home/appuser",   # Streamlit Cloud 기본 홈
+])
+MAX_WORKERS  = 1 if IS_CLOUD else 6   # 클라우드: 동시 요청 최소화
+CLOUD_DELAY  = 0.4 if IS_CLOUD else 0.0  # 클라우드: 요청 간 딜레이(초)
+REPORT_LAG         = 45  # 분기 재무보고 지연일
+ANNUAL_REPORT_LAG  = 75  # 연간 재무보고 지연일 (60~90일 중간값)
+
+BENCHMARKS = {"SPY": "S&P 500", "QQQ": "Nasdaq 100", "TQQQ": "3x Nasdaq"}
+
+FEATURE_META = {
+    # ── 모멘텀 ──────────────────────────────────────────────
+    "Mom_1w":            {"name": "1주 수익률",        "group": "모멘텀"},
+    "Mom_1m":            {"name": "1개월 수익률",      "group": "모멘텀"},
+    "Mom_3m":            {"name": "3개월 수익률",      "group": "모멘텀"},
+    "Mom_6m":            {"name": "6개월 수익률",      "group": "모멘텀"},
+    "Mom_12m":           {"name": "12개월 수익률",     "group": "모멘텀"},
+    "Mom_12_1":          {"name": "12-1개월 모멘텀",   "group": "모멘텀"},
+    "Mom_6_1":           {"name": "6-1개월 모멘텀",    "group": "모멘텀"},
+    "Momentum_Custom":   {"name": "모멘텀대체(12-1→6-1)", "group": "모멘텀"},
+    "RS_Market_1m":      {"name": "시장대비 상대강도(1M)", "group": "모멘텀"},
+    "RS_Market_3m":      {"name": "시장대비 상대강도(3M)", "group": "모멘텀"},
+    "RS_Market_6m":      {"name": "시장대비 상대강도(6M)", "group": "모멘텀"},
+    # ── 기술지표 ─────────────────────────────────────────────
+    "RSI_14":            {"name": "RSI(14)",            "group": "기술지표"},
+    "MACD_Hist":         {"name": "MACD 히스토그램",   "group": "기술지표"},
+    "Price_SMA20":       {"name": "Price/SMA20",        "group": "기술지표"},
+    "Price_SMA50":       {"name": "Price/SMA50",        "group": "기술지표"},
+    "Price_SMA200":      {"name": "Price/SMA200",       "group": "기술지표"},
+    "SMA50_SMA200":      {"name": "SMA50/SMA200 골든",  "group": "기술지표"},
+    "ADX_14":            {"name": "ADX(14)",            "group": "기술지표"},
+    "Stoch_K":           {"name": "Stochastic %K",      "group": "기술지표"},
+    "CCI_20":            {"name": "CCI(20)",            "group": "기술지표"},
+    "MFI_14":            {"name": "MFI(14)",            "group": "기술지표"},
+    "BB_Width":          {"name": "볼린저밴드 폭",      "group": "기술지표"},
+    "BB_Pos":            {"name": "볼린저밴드 위치",    "group": "기술지표"},
+    "High52w_Dist":      {"name": "52주 고점 대비",     "group": "기술지표"},
+    "Low52w_Dist":       {"name": "52주 저점 대비",     "group": "기술지표"},
+    # ── 리스크/거래량 ─────────────────────────────────────
+    "Volatility_30d":    {"name": "30일 변동성",        "group": "리스크"},
+    "Volatility_90d":    {"name": "90일 변동성",        "group": "리스크"},
+    "ATR_Ratio":         {"name": "ATR 비율",           "group": "리스크"},
+    "Vol_Ratio":         {"name": "거래량 비율(20일)",  "group": "리스크"},
+    "Risk_Adj_Return":   {"name": "위험조정수익",       "group": "리스크"},
+    "Beta_60d":          {"name": "베타(60일)",         "group": "리스크"},
+    "Beta_120d":         {"name": "베타(120일)",        "group": "리스크"},
+    "Rolling_Sharpe_60d":{"name": "롤링 Sharpe(60일)",  "group": "리스크"},
+    "Daily_Win_Rate_60d":{"name": "일별 승률(60일)",    "group": "리스크"},
+    "Vol_Ratio_30_90":   {"name": "변동성 비율(30/90)", "group": "리스크"},
+    # ── 밸류에이션 ─────────────────────────────────────────
+    "P_E":               {"name": "P/E 비율",           "group": "밸류에이션"},
+    "P_B":               {"name": "P/B 비율",           "group": "밸류에이션"},
+    "P_S":               {"name": "P/S 비율",           "group": "밸류에이션"},
+    "EV_EBITDA":         {"name": "EV/EBITDA",          "group": "밸류에이션"},
+    "P_FCF":             {"name": "P/FCF",              "group": "밸류에이션"},
+    "FCF_Yield":         {"name": "FCF 수익률",         "group": "밸류에이션"},
+    "Div_Yield":         {"name": "배당수익률",         "group": "밸류에이션"},
+    "PEG_Ratio":         {"name": "PEG 비율",           "group": "밸류에이션"},
+    # ── 수익성 ─────────────────────────────────────────────
+    "ROE":               {"name": "ROE",                "group": "수익성"},
+    "ROA":               {"name": "ROA",                "group": "수익성"},
+    "Gross_Margin":      {"name": "매출총이익률",       "group": "수익성"},
+    "Op_Margin":         {"name": "영업이익률",         "group": "수익성"},
+    "EBITDA_Margin":     {"name": "EBITDA 마진",        "group": "수익성"},
+    # ── 성장성 ─────────────────────────────────────────────
+    "Rev_Growth":        {"name": "매출 성장률",        "group": "성장성"},
+    "NI_Growth":         {"name": "순이익 성장률",      "group": "성장성"},
+    "EPS_Growth":        {"name": "EPS 성장률",         "group": "성장성"},
+    # ── 재무안정성 ─────────────────────────────────────────
+    "Debt_Equity":       {"name": "부채비율",           "group": "재무안정성"},
+    "Current_Ratio":     {"name": "유동비율",           "group": "재무안정성"},
+    "Interest_Coverage": {"name": "이자보상배율",       "group": "재무안정성"},
+    # ── 효율성/규모 ────────────────────────────────────────
+    "Asset_Turnover":    {"name": "자산회전율",         "group": "효율성"},
+    "GP_A_Quality":      {"name": "GP/자산 품질",       "group": "효율성"},
+    "MktCap_Log":        {"name": "시가총액(log)",      "group": "규모"},
+    # ── Cross-Sectional 백분위 (Ver3.9) ────────────────────
+    "Mom_3m_Pct":        {"name": "3개월모멘텀 백분위",  "group": "CS정규화"},
+    "RS_Market_3m_Pct":  {"name": "상대강도3M 백분위",   "group": "CS정규화"},
+    "P_E_Pct":           {"name": "P/E 백분위",          "group": "CS정규화"},
+    "ROE_Pct":           {"name": "ROE 백분위",          "group": "CS정규화"},
+    "Volatility_30d_Pct":{"name": "변동성30d 백분위",    "group": "CS정규화"},
+    # ── Regime (시장 상태) ─────────────────────────────────
+    "Market_Regime":     {"name": "시장 레짐(SPY/SMA200)","group": "레짐"},
+    "VIX_Level":         {"name": "VIX 수준",            "group": "레짐"},
+    # ── Sector Relative Strength ───────────────────────────
+    "RS_Sector_1m":      {"name": "섹터대비 상대강도(1M)","group": "섹터상대"},
+    "RS_Sector_3m":      {"name": "섹터대비 상대강도(3M)","group": "섹터상대"},
+}
+
+FEAT_COLS  = list(FEATURE_META.keys())
+FEAT_NAMES = {k: v["name"] for k, v in FEATURE_META.items()}
+
+# ═══════════════════════════════════════════════════════════
+# DATA LAYER
+# ═══════════════════════════════════════════════════════════
+
+def get_sp1500_info(warn=None) -> tuple:
+    """Wikipedia에서 S&P 500 / 400 / 600 종목 목록을 합산하여 S&P 1500 구성.
+    warn(msg): 조회 실패 알림 (기본 warnings.warn, UI는 st.warning)"""
+    warn = warn or warnings.warn
+    headers = {"User-Agent": "Mozilla/5.0"}
+
+    # (url, cap_tier) 순서대로 시도
+    index_sources = [
+        ("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies",  "Large Cap"),
+        ("https://en.wikipedia.org/wiki/List_of_S%26P_400_companies",  "Mid Cap"),
+        ("https://en.wikipedia.org/wiki/List_of_S%26P_600_companies",  "Small Cap"),
+    ]
+
+    frames = []
+    for url, cap_tier in index_sources:
+        try:
+            resp = requests.get(url, headers=headers, timeout=15)
+            tables = pd.read_html(StringIO(resp.text))
+            # Wikipedia 표 구조: 첫 번째 표에 Symbol / GICS Sector / Security 컬럼
+            raw = tables[0]
+            # 컬럼명이 다를 수 있으므로 유연하게 매핑
+            col_map = {}
+            for c in raw.columns:
+                lc = str(c).lower()
+                if "symbol" in lc or "ticker" in lc:
+                    col_map[c] = "ticker"
+                elif "gics sector" in lc or "sector" in lc:
+                    col_map[c] = "sector"
+                elif "security" in lc or "company" in lc or "name" in lc:
+                    col_map[c] = "name"
+            raw = raw.rename(columns=col_map)
+            needed = [c for c in ["ticker", "name", "sector"] if c in raw.columns]
+            raw = raw[needed].copy()
+            raw["ticker"] = raw["ticker"].astype(str).str.replace(".", "-", regex=False).str.strip()
+            raw["cap_tier"] = cap_tier
+            frames.append(raw)
+        except Exception as e:
+            warn(f"{cap_tier} ({url}) 조회 실패: {e}")
+
+    if not frames:
+        warn("S&P 1500 목록 조회 실패. 내장 리스트 사용.")
+        return _fallback_sp500(), _fallback_sectors()
+
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset="ticker")
+    if "sector" not in df.columns:
+        df["sector"] = "Unknown"
+    df["sector"] = df["sector"].fillna("Unknown")
+    sectors = sorted(df["sector"].dropna().unique().tolist())
+    return df[["ticker", "name", "sector", "cap_tier"]], sectors
+
+
+def _fallback_sp500() -> pd.DataFrame:
+    data = [
+        ("AAPL","Apple","Information Technology"),("MSFT","Microsoft","Information Technology"),
+        ("NVDA","Nvidia","Information Technology"),("GOOGL","Alphabet","Communication Services"),
+        ("META","Meta","Communication Services"),("AMZN","Amazon","Consumer Discretionary"),
+        ("TSLA","Tesla","Consumer Discretionary"),("AMD","AMD","Information Technology"),
+        ("INTC","Intel","Information Technology"),("QCOM","Qualcomm","Information Technology"),
+        ("CRM","Salesforce","Information Technology"),("ORCL","Oracle","Information Technology"),
+        ("ADBE","Adobe","Information Technology"),("TXN","TI","Information Technology"),
+        ("AVGO","Broadcom","Information Technology"),("MU","Micron","Information Technology"),
+        ("CSCO","Cisco","Information Technology"),("HPQ","HP","Information Technology"),
+        ("JNJ","J&J","Health Care"),("PFE","Pfizer","Health Care"),
+        ("UNH","UnitedHealth","Health Care"),("ABT","Abbott","Health Care"),
+        ("MRK","Merck","Health Care"),("LLY","Eli Lilly","Health Care"),
+        ("BMY","BMS","Health Care"),("AMGN","Amgen","Health Care"),
+        ("MDT","Medtronic","Health Care"),("TMO","Thermo Fisher","Health Care"),
+        ("ABBV","AbbVie","Health Care"),("CVS","CVS Health","Health Care"),
+        ("GILD","Gilead","Health Care"),("REGN","Regeneron","Health Care"),
+        ("JPM","JPMorgan","Financials"),("BAC","Bank of America","Financials"),
+        ("WFC","Wells Fargo","Financials"),("GS","Goldman","Financials"),
+        ("MS","Morgan Stanley","Financials"),("C","Citigroup","Financials"),
+        ("AXP","AmEx","Financials"),("BLK","BlackRock","Financials"),
+        ("SCHW","Schwab","Financials"),("COF","Capital One","Financials"),
+        ("HD","Home Depot","Consumer Discretionary"),("MCD","McDonald's","Consumer Discretionary"),
+        ("NKE","Nike","Consumer Discretionary"),("SBUX","Starbucks","Consumer Discretionary"),
+        ("LOW","Lowe's","Consumer Discretionary"),("TJX","TJX","Consumer Discretionary"),
+        ("PG","P&G","Consumer Staples"),("KO","Coca-Cola","Consumer Staples"),
+        ("PEP","PepsiCo","Consumer Staples"),("WMT","Walmart","Consumer Staples"),
+        ("COST","Costco","Consumer Staples"),("PM","Philip Morris","Consumer Staples"),
+        ("MO","Altria","Consumer Staples"),("CL","Colgate","Consumer Staples"),
+        ("XOM","ExxonMobil","Energy"),("CVX","Chevron","Energy"),
+        ("COP","ConocoPhillips","Energy"),("SLB","Schlumberger","Energy"),
+        ("EOG","EOG Resources","Energy"),("MPC","Marathon","Energy"),
+        ("HON","Honeywell","Industrials"),("UPS","UPS","Industrials"),
+        ("CAT","Caterpillar","Industrials"),("DE","Deere","Industrials"),
+        ("GE","GE","Industrials"),("LMT","Lockheed","Industrials"),
+        ("NEE","NextEra","Utilities"),("DUK","Duke","Utilities"),
+        ("SO","Southern","Utilities"),("D","Dominion","Utilities"),
+        ("AMT","American Tower","Real Estate"),("PLD","Prologis","Real Estate"),
+        ("CCI","Crown Castle","Real Estate"),("EQIX","Equinix","Real Estate"),
+        ("LIN","Linde","Materials"),("APD","Air Products","Materials"),
+        ("SHW","Sherwin","Materials"),("FCX","Freeport","Materials"),
+        ("NFLX","Netflix","Communication Services"),("DIS","Disney","Communication Services"),
+        ("CMCSA","Comcast","Communication Services"),("VZ","Verizon","Communication Services"),
+        ("T","AT&T","Communication Services"),
+    ]
+    return pd.DataFrame(data, columns=["ticker","name","sector"])
+
+
+def _fallback_sectors() -> list:
+    return sorted(["Information Technology","Health Care","Financials",
+                   "Consumer Discretionary","Consumer Staples","Energy",
+                   "Industrials","Materials","Real Estate","Utilities",
+                   "Communication Services"])
+
+
+# ── 로컬 가격 저장소 (Parquet, 종목별 파일) ─────────────────
+# 재시작·캐시 만료 후에도 유지되며, 요청 구간 중 비어 있는 부분만 yfinance로 보충.
+# _coverage.json: {ticker: [[조회 시작일, 조회 종료일(미포함)], ...]} — 거래 없는 날도 "조회 완료"로 기록
+#                 "_empty": {ticker: [...]} — 파일 없이 빈 응답만 받은 종목(상폐·미상장)의 조회 구간
+PRICE_STORE_DIR = os.environ.get(
+    "AQL_PRICE_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".price_store"),
+)
+STORE_OVERLAP_DAYS  = 7   # 증분 조회 시 기존 구간과 겹쳐 받는 일수 (수정주가 변경 감지용)
+STORE_COALESCE_DAYS = 5   # 시작·종료일이 이 일수 이내로 다른 요청 구간은 하나로 병합
+_PRICE_STORE_LOCK = threading.Lock()
+
+
+def _store_file(ticker: str) -> str:
+    return os.path.join(PRICE_STORE_DIR, f"{quote(ticker, safe='')}.parquet")
+
+
+def _load_coverage() -> dict:
+    path = os.path.join(PRICE_STORE_DIR, "_coverage.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_coverage(cov: dict):
+    os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+    path = os.path.join(PRICE_STORE_DIR, "_coverage.json")
+    tmp  = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cov, f)
+    os.replace(tmp, path)   # 원자적 교체 (중간 종료 시 파일 손상 방지)
+
+
+def load_stored_prices(ticker: str) -> pd.DataFrame | None:
+    """저장소의 종목 OHLCV 전체 이력 (없으면 None)."""
+    path = _store_file(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        return None
+
+
+def _save_stored_prices(ticker: str, df: pd.DataFrame):
+    os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+    path = _store_file(ticker)
+    tmp  = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp)
+    os.replace(tmp, path)
+
+
+def _yf_download_batch(tickers: list, start: str, end: str) -> dict:
+    """yfinance 배치 다운로드 → {ticker: OHLCV}. 최대 3회 재시도, 행 수 필터 없음."""
+    out = {}
+    for attempt in range(3):   # 최대 3회 재시도
+        try:
+            raw = yf.download(tickers, start=start, end=end,
+                              auto_adjust=True, progress=False,
+                              threads=(not IS_CLOUD))  # 클라우드: 단일 스레드
+            if raw.empty:
+                break
+            if isinstance(raw.columns, pd.MultiIndex):
+                for t in tickers:
+                    try:
+                        sub = raw.xs(t, axis=1, level=1).dropna(how="all")
+                        if len(sub) > 0:
+                            out[t] = sub
+                    except Exception:
+                        pass
+            elif len(tickers) == 1:
+                sub = raw.dropna(how="all")
+                if len(sub) > 0:
+                    out[tickers[0]] = sub
+            break  # 성공 시 재시도 루프 탈출
+        except Exception:
+            if attempt < 2:
+                time.sleep(1.5 ** attempt)  # 0s, 1.5s 후 재시도
+    return out
+
+
+def _same_adjustment(old: pd.DataFrame, new: pd.DataFrame) -> bool:
+    """겹치는 날짜의 종가 비교 — 분할·배당으로 수정주가가 바뀌었으면 False."""
+    common = old.index.intersection(new.index)
+    if len(common) == 0:
+        return True
+    a = old.loc[common, "Close"].astype(float)
+    b = new.loc[common, "Close"].astype(float)
+    ok = a.notna() & b.notna()
+    if not ok.any():
+        return True
+    return bool(np.allclose(a[ok], b[ok], rtol=1e-4, atol=0))
+
+
+def _cov_intervals(entry) -> list:
+    """manifest 항목 → [(start, end), ...] (단일 구간 [s, e] 형식도 허용)."""
+    if not entry:
+        return []
+    if isinstance(entry[0], str):
+        entry = [entry]
+    return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in entry]
+
+
+def _known_intervals(cov: dict, ticker: str) -> list:
+    """조회 완료 구간. 파일이 있으면 종목 항목, 없으면 빈 응답 기록(_empty)만 신뢰
+    (파일이 삭제된 종목의 오래된 항목은 무시 → 재다운로드)."""
+    if os.path.exists(_store_file(ticker)):
+        return _cov_intervals(cov.get(ticker))
+    return _cov_intervals(cov.get("_empty", {}).get(ticker))
+
+
+def _merge_intervals(intervals: list) -> list:
+    out = []
+    for s, e in sorted(intervals):
+        if out and s <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], e))
+        else:
+            out.append((s, e))
+    return out
+
+
+def _missing_ranges(intervals: list, req_s: pd.Timestamp, req_e: pd.Timestamp) -> list:
+    """[req_s, req_e) 중 조회 이력이 없는 구간. 영업일이 없는 구간(주말 등)은 제외."""
+    gaps, cur = [], req_s
+    for s, e in intervals:
+        if e <= cur:
+            continue
+        if s >= req_e:
+            break
+        if s > cur:
+            gaps.append((cur, s))
+        cur = max(cur, e)
+    if cur < req_e:
+        gaps.append((cur, req_e))
+
+    out = []
+    for s, e in gaps:
+        bd = pd.bdate_range(s, e - pd.Timedelta(days=1))
+        if len(bd):
+            out.append((bd[0], bd[-1] + pd.Timedelta(days=1)))
+    return out
+
+
+def plan_price_fetches(tickers: list, start: str, end: str, coverage: dict = None) -> list:
+    """종목별 누락 구간 계산 → 최소 배치 요청 목록 [(start, end, [tickers]), ...].
+    ① 조회 이력(coverage)과 비교해 빈 구간만 요청 (앞·뒤·중간 구멍 모두)
+    ② 기존 구간과 STORE_OVERLAP_DAYS만큼 겹쳐 받아 수정주가 변경 감지
+    ③ 같은 구간이 필요한 종목끼리 묶고, 시작·종료일 차이가 STORE_COALESCE_DAYS 이내인
+       구간은 합집합 하나로 병합 (몇 개 봉을 더 받는 편이 요청 수를 늘리는 것보다 저렴)
+    """
+    req_s = pd.Timestamp(start)
+    # 오늘 봉은 장중 미완성일 수 있으므로 오늘 이전까지만 계획
+    req_e = min(pd.Timestamp(end), pd.Timestamp.today().normalize())
+    if req_s >= req_e:
+        return []
+    cov = _load_coverage() if coverage is None else coverage
+    overlap = pd.Timedelta(days=STORE_OVERLAP_DAYS)
+
+    groups: dict = {}
+    for t in tickers:
+        iv = _known_intervals(cov, t)
+        for g_s, g_e in _missing_ranges(iv, req_s, req_e):
+            left  = [s for s, e in iv if e <= g_s]
+            right = [e for s, e in iv if s >= g_e]
+            if left:
+                g_s = max(g_s - overlap, max(left))
+            if right:
+                g_e = min(g_e + overlap, min(right))
+            groups.setdefault((g_s, g_e), []).append(t)
+
+    # 인접 구간 병합 (종료일 → 시작일 순 정렬 후 순차 병합)
+    tol = pd.Timedelta(days=STORE_COALESCE_DAYS)
+    merged = []
+    for (g_s, g_e) in sorted(groups, key=lambda k: (k[1], k[0])):
+        members = groups[(g_s, g_e)]
+        if merged:
+            m_s, m_e, m_t = merged[-1]
+            if abs(g_e - m_e) <= tol and abs(g_s - m_s) <= tol:
+                merged[-1] = (min(m_s, g_s), max(m_e, g_e), m_t + members)
+                continue
+        merged.append((g_s, g_e, list(members)))
+
+    batch = 10 if IS_CLOUD else 20   # 클라우드: 배치 크기 줄여 안정성 확보
+    plan = []
+    for g_s, g_e, members in merged:
+        members = list(dict.fromkeys(members))
+        for i in range(0, len(members), batch):
+            plan.append((g_s, g_e, members[i: i + batch]))
+    return plan
+
+
+def update_price_store(tickers: list, start: str, end: str) -> int:
+    """plan_price_fetches 계획대로 누락 구간만 다운로드해 저장소에 병합. 반환: 요청 횟수.
+    수정주가 변경이 감지된 종목은 전체 구간을 다시 받아 교체.
+    배치 응답에서 빠진 종목은 단독 재요청도 비어 있을 때만 해당 구간을 조회 완료로 기록.
+    """
+    with _PRICE_STORE_LOCK:
+        cov  = _load_coverage()
+        plan = plan_price_fetches(tickers, start, end, coverage=cov)
+        if not plan:
+            return 0
+
+        def _mark(t, s, e):
+            iv = _merge_intervals(_known_intervals(cov, t) + [(s, e)])
+            iv = [[a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")] for a, b in iv]
+            if os.path.exists(_store_file(t)):
+                cov[t] = iv
+            else:   # 데이터 없는 종목(상폐 등): 파일 없이 빈 응답 구간만 기록
+                cov.setdefault("_empty", {})[t] = iv
+
+        refetch = {}
+
+        def _absorb(t, new, g_s, g_e):
+            """응답 데이터를 저장소에 병합하고 구간 기록. 수정주가가 바뀌었으면 재다운로드 예약."""
+            old = load_stored_prices(t)
+            if old is not None and not _same_adjustment(old, new):
+                # 여러 배치에서 감지돼도 전체 구간이 빠지지 않도록 기존 예약과 합집합
+                iv = _cov_intervals(cov.get(t)) + [(g_s, g_e)] + ([refetch[t]] if t in refetch else [])
+                refetch[t] = (min(s for s, _ in iv), max(e for _, e in iv))
+                return
+            merged = new if old is None else pd.concat([old, new])
+            merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            _save_stored_prices(t, merged)
+            if old is None:   # 첫 파일: 이전 빈 응답 구간을 종목 항목으로 이전
+                cov[t] = cov.get("_empty", {}).pop(t, [])
+            _mark(t, g_s, g_e)
+
+        n_retry = 0
+        for n_req, (g_s, g_e, chunk) in enumerate(plan):
+            if CLOUD_DELAY and n_req:
+                time.sleep(CLOUD_DELAY)   # 배치 간 딜레이
+            s_str, e_str = g_s.strftime("%Y-%m-%d"), g_e.strftime("%Y-%m-%d")
+            fetched = _yf_download_batch(chunk, s_str, e_str)
+            if not fetched:
+                continue   # 전부 비어 있으면 일시 장애일 수 있음 → 조회 이력 미기록
+            for t in chunk:
+                if t in fetched:
+                    _absorb(t, fetched[t], g_s, g_e)
+                    continue
+                # 배치에서 빠진 종목: 일시 오류일 수 있으므로 단독 재요청으로 확인
+                if CLOUD_DELAY:
+                    time.sleep(CLOUD_DELAY)
+                n_retry += 1
+                single = _yf_download_batch([t], s_str, e_str)
+                if t in single:
+                    _absorb(t, single[t], g_s, g_e)
+                else:   # 단독 재요청도 빈 응답 → 해당 구간 데이터 없음 확정
+                    _mark(t, g_s, g_e)
+
+        # 수정주가 변경 종목: 전체 구간 재다운로드 후 교체
+        for t, (r_s, r_e) in refetch.items():
+            fetched = _yf_download_batch([t], r_s.strftime("%Y-%m-%d"), r_e.strftime("%Y-%m-%d"))
+            if t in fetched:
+                _save_stored_prices(t, fetched[t])
+                cov[t] = [[r_s.strftime("%Y-%m-%d"), r_e.strftime("%Y-%m-%d")]]
+
+        _save_coverage(cov)
+        return len(plan) + n_retry + len(refetch)
+
+
+def read_price_store(tickers: list, start: str, end: str) -> dict:
+    """저장소에서 [start, end) 구간 OHLCV 읽기 → {ticker: DataFrame}."""
+    s, e = pd.Timestamp(start), pd.Timestamp(end)
+    out = {}
+    for t in tickers:
+        df = load_stored_prices(t)
+        if df is None:
+            continue
+        sub = df.loc[(df.index >= s) & (df.index < e)]
+        if len(sub) > 0:
+            out[t] = sub
+    return out
+
+
+def load_price_history(ticker: str, start: str, end: str) -> pd.DataFrame:
+    """단일 종목(벤치마크·지수 포함) OHLCV — 저장소 우선, 부족분만 다운로드."""
+    update_price_store([ticker], start, end)
+    return read_price_store([ticker], start, end).get(ticker, pd.DataFrame())
+
+
+def download_price_data(tickers: tuple, start: str, end: str) -> dict:
+    """OHLCV 일괄 조회 — 로컬 저장소 우선, 누락 구간만 yfinance 다운로드."""
+    tlist = list(tickers)
+    update_price_store(tlist, start, end)
+    return {t: df for t, df in read_price_store(tlist, start, end).items()
+            if len(df) >= 60}
+
+
+def get_fundamental_yf(tickers: tuple) -> dict:
+    """yfinance .info에서 펀더멘털 데이터 취득."""
+    out = {}
+    for t in tickers:
+        info = {}
+        for attempt in range(3):   # 최대 3회 재시도
+            try:
+                info = yf.Ticker(t).info or {}
+                break
+            except Exception:
+                if attempt < 2:
+                    time.sleep(1.0 + attempt)  # 1s, 2s 후 재시도
+        try:
+            mkt  = info.get("marketCap", 0) or 0
+            out[t] = {
+                "pe":         info.get("trailingPE", np.nan),
+                "fwd_pe":     info.get("forwardPE", np.nan),
+                "pb":         info.get("priceToBook", np.nan),
+                "ps":         info.get("priceToSalesTrailing12Months", np.nan),
+                "ev_ebitda":  info.get("enterpriseToEbitda", np.nan),
+                "peg":        info.get("pegRatio", np.nan),
+                "div_yield":  (info.get("dividendYield") or 0),
+                "roe":        info.get("returnOnEquity", np.nan),
+                "roa":        info.get("returnOnAssets", np.nan),
+                "gross_mg":   info.get("grossMargins", np.nan),
+                "op_mg":      info.get("operatingMargins", np.nan),
+                "net_mg":     info.get("profitMargins", np.nan),
+                "rev_growth": info.get("revenueGrowth", np.nan),
+                "ni_growth":  info.get("earningsGrowth", np.nan),
+                "eps_growth": info.get("earningsQuarterlyGrowth", np.nan),
+                "debt_eq":    info.get("debtToEquity", np.nan),
+                "curr_ratio": info.get("currentRatio", np.nan),
+                "fcf":        info.get("freeCashflow", np.nan),
+                "revenue":    info.get("totalRevenue", np.nan),
+                "net_income": info.get("netIncomeToCommon", np.nan),
+                "total_debt": info.get("totalDebt", np.nan),
+                "total_cash": info.get("totalCash", np.nan),
+                "total_assets": info.get("totalAssets", np.nan),
+                "ebitda":     info.get("ebitda", np.nan),
+                "shares":     info.get("sharesOutstanding", np.nan),
+                "mkt_cap":    mkt,
+                "ev":         info.get("enterpriseValue", np.nan),
+                "interest_exp": info.get("interestExpense", np.nan),
+                "gross_profit": info.get("grossProfit", np.nan),
+                "ebit":       info.get("ebit", np.nan),
+            }
+        except Exception:
+            out[t] = {}
+        if CLOUD_DELAY:
+            time.sleep(CLOUD_DELAY)   # 종목 간 딜레이 (rate limit 방지)
+    return out
+
+
+def get_benchmark_prices(start: str, end: str) -> dict:
+    bm = {}
+    for tk in BENCHMARKS:
+        try:
+            df = load_price_history(tk, start, end)
+            if not df.empty:
+                bm[tk] = df["Close"].squeeze()
+        except Exception:
+            pass
+    return bm
+
+
+def get_sp500_changes() -> pd.DataFrame:
+    """Wikipedia S&P 500 변경 이력 파싱 (편입/퇴출 날짜·티커).
+    반환: DataFrame[date, added_ticker, removed_ticker]
+    """
+    url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+    headers = {"User-Agent": "Mozilla/5.0"}
+    try:
+        resp = requests.get(url, headers=headers, timeout=20)
+        tables = pd.read_html(StringIO(resp.text))
+        if len(tables) < 2:
+            return pd.DataFrame()
+        raw = tables[1]  # 두 번째 표 = 변경 이력
+    except Exception:
+        return pd.DataFrame()
+
+    # 컬럼 평탄화 (MultiIndex 가능)
+    if isinstance(raw.columns, pd.MultiIndex):
+        raw.columns = ["_".join(str(c) for c in col).strip() for col in raw.columns]
+
+    # 날짜·티커 컬럼 탐색
+    date_col = added_col = removed_col = None
+    for c in raw.columns:
+        lc = c.lower()
+        if "date" in lc and date_col is None:
+            date_col = c
+        elif "added" in lc and "ticker" in lc and added_col is None:
+            added_col = c
+        elif "added" in lc and "symbol" in lc and added_col is None:
+            added_col = c
+        elif "removed" in lc and "ticker" in lc and removed_col is None:
+            removed_col = c
+        elif "removed" in lc and "symbol" in lc and removed_col is None:
+            removed_col = c
+
+    if date_col is None:
+        return pd.DataFrame()
+
+    rows = []
+    for _, r in raw.iterrows():
+        try:
+            d = pd.to_datetime(r[date_col], format="mixed")
+        except Exception:
+            continue
+        at = str(r.get(added_col, "")).strip() if added_col else ""
+        rt = str(r.get(removed_col, "")).strip() if removed_col else ""
+        at = at.replace(".", "-") if at and at != "nan" else ""
+        rt = rt.replace(".", "-") if rt and rt != "nan" else ""
+        rows.append({"date": d, "added_ticker": at, "removed_ticker": rt})
+
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).sort_values("date").reset_index(drop=True)
+
+
+def build_sp500_membership(current_members: list, changes_df: pd.DataFrame) -> pd.DataFrame:
+    """현재 S&P 500 구성 + 변경 이력 → 편입 구간 테이블 (1회 구성).
+    반환: DataFrame[ticker, member_from, member_to] — member_from 이상 ~ member_to 미만 구성 종목
+          (Timestamp.min / Timestamp.max = 이력 이전부터 / 현재까지)
+    규칙: 현재 목록에서 출발해 변경을 최신→과거 순으로 역산 (같은 날짜는 표 역순, 한 행은 편입 → 퇴출 순)
+    행 순서: 변경 이력이 있으면 티커 정렬순, 없으면 current_members 순서.
+    """
+    cols = ["ticker", "member_from", "member_to"]
+    lo, hi = pd.Timestamp.min, pd.Timestamp.max
+    ns = {"member_from": "datetime64[ns]", "member_to": "datetime64[ns]"}
+    if changes_df is None or changes_df.empty:
+        return pd.DataFrame([(t, lo, hi) for t in current_members], columns=cols).astype(ns)
+
+    # 티커별 이벤트 (날짜, 표 순번, 역산 후 상태) — 편입일 이전엔 비구성, 퇴출일 이전엔 구성
+    events: dict = {}
+    for k, (d, added, removed) in enumerate(zip(changes_df["date"],
+                                                changes_df["added_ticker"],
+                                                changes_df["removed_ticker"])):
+        if added:
+            events.setdefault(added, []).append((d, k, 1, False))
+        if removed:
+            events.setdefault(removed, []).append((d, k, 0, True))
+
+    current = set(current_members)
+    rows = []
+    for t in sorted(current | set(events)):
+        # 최신→과거로 상태 역산, 구간 경계는 이벤트 날짜 (해당 날짜부터 이후 상태)
+        state, to = t in current, hi
+        for d, _, _, before in sorted(events.get(t, []), reverse=True):
+            if d != to:
+                if state:
+                    rows.append((t, d, to))
+                to = d
+            state = before
+        if state:
+            rows.append((t, lo, to))
+    out = pd.DataFrame(rows, columns=cols).astype(ns)
+    # 같은 종목 인접 구간 병합 + 과거→최신 순
+    out = out.sort_values(["ticker", "member_from"], kind="stable", ignore_index=True)
+    joint = (out["ticker"] == out["ticker"].shift()) & (out["member_from"] == out["member_to"].shift())
+    grp = (~joint).cumsum()
+    return out.groupby(grp, sort=False).agg(
+        ticker=("ticker", "first"), member_from=("member_from", "first"),
+        member_to=("member_to", "last")).reset_index(drop=True)
+
+
+def sp500_members_at(membership: pd.DataFrame, date) -> list:
+    """date 시점 구성 종목 (membership 행 순서)."""
+    date = pd.Timestamp(date)
+    hit = (membership["member_from"] <= date) & (membership["member_to"] > date)
+    return list(dict.fromkeys(membership.loc[hit, "ticker"]))
+
+
+def sp500_member_periods(membership: pd.DataFrame, ticker: str) -> list:
+    """종목의 전체 편입 구간 [(member_from, member_to), ...] (과거→최신)."""
+    sub = membership[membership["ticker"] == ticker]
+    return list(zip(sub["member_from"], sub["member_to"]))
+
+
+def sp500_membership_mask(membership: pd.DataFrame, dates, tickers: list) -> np.ndarray:
+    """날짜 × 종목 구성 여부 (bool). dates는 오름차순."""
+    dates = pd.DatetimeIndex(dates).as_unit("ns")
+    col = {t: j for j, t in enumerate(tickers)}
+    j = membership["ticker"].map(col)
+    sub = membership[j.notna()]
+    j = j[j.notna()].to_numpy(dtype=np.int64)
+    # 구간 시작 +1 / 종료 -1 → 날짜 축 누적합 > 0
+    diff = np.zeros((len(dates) + 1, len(tickers)), dtype=np.int32)
+    np.add.at(diff, (dates.searchsorted(sub["member_from"], side="left"), j), 1)
+    np.add.at(diff, (dates.searchsorted(sub["member_to"], side="left"), j), -1)
+    return np.cumsum(diff[:-1], axis=0) > 0
+
+
+def get_riskfree_rate(start: str, end: str) -> float:
+    """백테스트 기간의 평균 무위험수익률 조회 (미국 3개월 T-bill ^IRX).
+    ^IRX는 연율화된 수익률을 % 단위로 제공 (예: 5.0 → 5.0%).
+    조회 실패 시 기간에 따른 합리적 기본값 반환.
+    """
+    try:
+        df = load_price_history("^IRX", start, end)
+        if not df.empty:
+            avg_pct = float(df["Close"].squeeze().mean())
+            return avg_pct / 100  # 소수로 변환 (0.05 = 5%)
+    except Exception:
+        pass
+
+    # 조회 실패 시: 기간 중간 연도 기준 합리적 기본값
+    try:
+        mid_year = int(start[:4])
+    except Exception:
+        mid_year = 2022
+
+    # 연도별 대략적인 미국 기준금리
+    fallback = {
+        2018: 0.022, 2019: 0.021, 2020: 0.005,
+        2021: 0.003, 2022: 0.030, 2023: 0.051,
+        2024: 0.052, 2025: 0.045,
+    }
+    return fallback.get(mid_year, 0.03)
+
+
+def get_pit_financials(tickers: tuple) -> dict:
+    """분기별 재무제표(손익계산서 + 대차대조표) 수집 — PIT 근사용.
+    반환: {ticker: {"income": pd.DataFrame, "balance": pd.DataFrame}}
+    columns = 보고 분기 날짜, rows = 재무 항목
+    주의: yfinance 분기 데이터는 최근 4~5분기만 제공하는 경우 있음.
+    """
+    out = {}
+    workers = 1 if IS_CLOUD else 4
+
+    def _safe(df):
+        return df if (df is not None and not df.empty) else pd.DataFrame()
+
+    def _fetch(t):
+        for attempt in range(3):
+            try:
+                tk = yf.Ticker(t)
+                return t, {
+                    "income":          _safe(tk.quarterly_financials),
+                    "balance":         _safe(tk.quarterly_balance_sheet),
+                    "cashflow":        _safe(tk.quarterly_cashflow),
+                    "annual_income":   _safe(tk.financials),
+                    "annual_balance":  _safe(tk.balance_sheet),
+                    "annual_cashflow": _safe(tk.cashflow),
+                }
+            except Exception:
+                if attempt < 2:
+                    time.sleep(1.0 + attempt)
+        return t, {k: pd.DataFrame() for k in
+                   ["income", "balance", "cashflow",
+                    "annual_income", "annual_balance", "annual_cashflow"]}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = {ex.submit(_fetch, t): t for t in tickers}
+        for fut in concurrent.futures.as_completed(futs):
+            t, data = fut.result()
+            out[t] = data
+            if CLOUD_DELAY:
+                time.sleep(CLOUD_DELAY)
+    return out
+
+
+# ═══════════════════════════════════════════════════════════
+# PRICE PANEL (거래일 × 종목 정렬 배열)
+# ═══════════════════════════════════════════════════════════
+
+PANEL_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+PANEL_DTYPE  = np.float32
+ADV_WINDOW   = 20   # 평균 거래대금 기간 (거래 행 기준)
+
+
+def build_price_panel(price_data: dict) -> dict:
+    """{ticker: OHLCV} → 거래일 × 종목 정렬 패널 (엔진 전 단계 공용).
+    dates: 전체 거래일 (합집합), tickers / col: 열 순서와 {ticker: 열 번호}
+    Open~Volume: float32 배열 (거래일 × 종목), 미거래일은 NaN
+    present: 해당 종목의 실제 거래 행 여부
+    last_valid[r, j]: r행 이하 마지막 거래 행 (없으면 -1)
+    next_valid[r, j]: r행 이상 첫 거래 행 (없으면 n_days, 마지막 행은 센티넬)
+    ADV: 최근 ADV_WINDOW 거래 행 평균 거래대금 (float64, _panel_adv)
+    """
+    tickers = list(price_data.keys())
+    idx = [df.index for df in price_data.values() if len(df) > 0]
+    dates = idx[0].append(idx[1:]).unique().sort_values() if idx else pd.DatetimeIndex([])
+    n, m = len(dates), len(tickers)
+
+    panel = {"dates": dates, "tickers": tickers,
+             "col": {t: j for j, t in enumerate(tickers)}}
+    for f in PANEL_FIELDS:
+        panel[f] = np.full((n, m), np.nan, dtype=PANEL_DTYPE)
+    present = np.zeros((n, m), dtype=bool)
+
+    for j, t in enumerate(tickers):
+        df = price_data[t]
+        if len(df) == 0:
+            continue
+        rows = dates.get_indexer(df.index)
+        present[rows, j] = True
+        for f in PANEL_FIELDS:
+            if f in df.columns:
+                panel[f][rows, j] = df[f].to_numpy(dtype=np.float64)
+
+    panel["present"] = present
+    panel["last_valid"], panel["next_valid"] = _panel_index(present)
+    panel["ADV"] = _panel_adv(panel)
+    return panel
+
+
+def _panel_index(present: np.ndarray):
+    """거래 여부 → (last_valid, next_valid) 행 번호 배열."""
+    n, m = present.shape
+    row_no = np.arange(n, dtype=np.int32)[:, None]
+    last_valid = np.maximum.accumulate(np.where(present, row_no, -1), axis=0)
+    next_valid = np.full((n + 1, m), n, dtype=np.int32)
+    if n:
+        next_valid[:n] = np.minimum.accumulate(
+            np.where(present, row_no, n)[::-1], axis=0)[::-1]
+    return last_valid.astype(np.int32), next_valid
+
+
+def _panel_adv(panel: dict, window: int = ADV_WINDOW) -> np.ndarray:
+    """종목별 최근 window개 거래 행의 평균 거래대금 (Close × Volume, NaN 제외 평균).
+    거래 행이 window개 미만이거나 미거래 행이면 NaN — 날짜 조회는 panel_asof(panel, "ADV", ...).
+    거래 행 순번으로 압축한 누적합의 차로 계산 (종목·날짜 전체 1회).
+    """
+    present = panel["present"]
+    n, m = present.shape
+    adv = np.full((n, m), np.nan)
+    rr, jj = np.nonzero(present)
+    if not len(rr):
+        return adv
+    dv = panel["Close"][rr, jj].astype(np.float64) * panel["Volume"][rr, jj].astype(np.float64)
+    ok = ~np.isnan(dv)
+    k = np.cumsum(present, axis=0)[rr, jj]   # 종목 내 거래 행 순번 (1부터)
+    cs_v = np.zeros((n + 1, m))
+    cs_c = np.zeros((n + 1, m))
+    cs_v[k, jj] = np.where(ok, dv, 0.0)
+    cs_c[k, jj] = ok
+    np.cumsum(cs_v, axis=0, out=cs_v)
+    np.cumsum(cs_c, axis=0, out=cs_c)
+    lo = np.maximum(k - window, 0)
+    tot = cs_v[k, jj] - cs_v[lo, jj]
+    cnt = cs_c[k, jj] - cs_c[lo, jj]
+    sel = (k >= window) & (cnt > 0)
+    adv[rr[sel], jj[sel]] = tot[sel] / cnt[sel]
+    return adv
+
+
+def panel_asof_rows(panel: dict, field: str, dates) -> np.ndarray:
+    """날짜 × 전 종목의 as-of 값 행렬 (float64, 없으면 NaN)."""
+    m = len(panel["tickers"])
+    r = panel["dates"].searchsorted(pd.DatetimeIndex(dates), side="right") - 1
+    out = np.full((len(r), m), np.nan)
+    ok = r >= 0
+    rows = panel["last_valid"][r[ok]]
+    vals = panel[field][np.maximum(rows, 0), np.arange(m)].astype(np.float64)
+    out[ok] = np.where(rows >= 0, vals, np.nan)
+    return out
+
+
+def extend_price_panel(panel: dict, new_data: dict) -> dict:
+    """기존 패널 마지막 거래일 이후 행만 덧붙인 새 패널 (종목 열은 기존 그대로)."""
+    last = panel["dates"][-1] if len(panel["dates"]) else None
+    tail = {}
+    for t in panel["tickers"]:
+        df = new_data.get(t)
+        if df is not None and len(df) > 0:
+            tail[t] = df.loc[df.index > last] if last is not None else df
+        else:
+            tail[t] = pd.DataFrame()
+    add = build_price_panel(tail)
+    if not len(add["dates"]):
+        return panel
+
+    out = {"dates": panel["dates"].append(add["dates"]),
+           "tickers": panel["tickers"], "col": panel["col"]}
+    for f in PANEL_FIELDS:
+        out[f] = np.vstack([panel[f], add[f]])
+    out["present"] = np.vstack([panel["present"], add["present"]])
+    out["last_valid"], out["next_valid"] = _panel_index(out["present"])
+    out["ADV"] = _panel_adv(out)
+    return out
+
+
+def _row_le(panel: dict, date) -> int:
+    """date 이하 마지막 패널 행 (없으면 -1)."""
+    return int(panel["dates"].searchsorted(pd.Timestamp(date), side="right")) - 1
+
+
+def _row_ge(panel: dict, date) -> int:
+    """date 이상 첫 패널 행 (없으면 n_days)."""
+    return int(panel["dates"].searchsorted(pd.Timestamp(date), side="left"))
+
+
+def _row_gt(panel: dict, date) -> int:
+    """date 초과 첫 패널 행 (없으면 n_days)."""
+    return int(panel["dates"].searchsorted(pd.Timestamp(date), side="right"))
+
+
+def panel_asof(panel: dict, field: str, date, tickers: list) -> np.ndarray:
+    """각 종목의 date 이하 마지막 거래일 값 (float64, 없으면 NaN).
+    date: 단일 날짜 또는 tickers와 같은 길이의 날짜 배열
+    """
+    cols = np.array([panel["col"].get(t, -1) for t in tickers], dtype=np.int64)
+    out  = np.full(len(cols), np.nan)
+    if np.ndim(date) == 0:
+        r = np.full(len(cols), _row_le(panel, date))
+    else:
+        r = panel["dates"].searchsorted(pd.DatetimeIndex(date), side="right") - 1
+    ok = (cols >= 0) & (r >= 0)
+    if not ok.any():
+        return out
+    rows = panel["last_valid"][r[ok], cols[ok]]
+    vals = panel[field][np.maximum(rows, 0), cols[ok]].astype(np.float64)
+    out[ok] = np.where(rows >= 0, vals, np.nan)
+    return out
+
+
+# ═══════════════════════════════════════════════════════════
+# ROLLING KERNELS (시간축 = axis 0, 열 단위 벡터화)
+# ═══════════════════════════════════════════════════════════
+# pandas rolling(n) / ewm(adjust=False) 와 같은 규칙:
+#   창 안에 NaN이 하나라도 있거나 관측치가 n개 미만이면 NaN,
+#   창 전체가 같은 값이면 평균은 그 값, 분산은 정확히 0.
+# 입력이 Series/DataFrame이면 같은 형태로, ndarray면 ndarray로 반환.
+
+def _as2d(x) -> np.ndarray:
+    a = np.asarray(x, dtype=np.float64)
+    return a.reshape(len(a), -1)
+
+
+def _like(x, a: np.ndarray):
+    if isinstance(x, pd.DataFrame):
+        return pd.DataFrame(a, index=x.index, columns=x.columns, copy=False)
+    if isinstance(x, pd.Series):
+        return pd.Series(a[:, 0], index=x.index, name=x.name, copy=False)
+    return a.reshape(np.shape(x))
+
+
+def _window_diff(cs: np.ndarray, n: int) -> np.ndarray:
+    """누적합 → 길이 n 창 합계 (제자리 계산)."""
+    cs[n:] -= cs[:-n].copy()
+    return cs
+
+
+def _nan_edges(nan: np.ndarray):
+    """열별 첫·마지막 유효 행과 '앞뒤에만 NaN' 여부 (전부 NaN 열은 first=L, last=-1)."""
+    L = len(nan)
+    ok    = ~nan
+    has   = ok.any(axis=0)
+    first = np.where(has, np.argmax(ok, axis=0), L)
+    last  = np.where(has, L - 1 - np.argmax(ok[::-1], axis=0), -1)
+    edge_only = (nan.sum(axis=0) == first + (L - 1 - last)) | ~has
+    return first, last, edge_only
+
+
+def _partial_window(a: np.ndarray, n: int) -> np.ndarray:
+    """창이 n개의 유효값으로 꽉 차지 않은 위치 (bool) — 결과를 NaN 처리할 곳."""
+    nan = np.isnan(a)
+    first, last, edge_only = _nan_edges(nan)
+    if edge_only.all():
+        t = np.arange(len(a))[:, None]
+        return (t < first + n - 1) | (t > last)
+    bad = _window_diff(np.cumsum(nan, axis=0, dtype=np.int32), n) > 0
+    bad[:n - 1] = True
+    return bad
+
+
+def _const_window(a: np.ndarray, n: int):
+    """창 n개가 모두 같은 값인 위치 (bool). 연속 동일값이 없으면 None."""
+    eq = a[1:] == a[:-1]
+    if n < 2 or not eq.any():
+        return None
+    const = np.zeros(a.shape, dtype=bool)
+    const[1:] = _window_diff(np.cumsum(eq, axis=0, dtype=np.int32), n - 1) == n - 1
+    return const
+
+
+def _fill_gaps(a: np.ndarray) -> np.ndarray:
+    """누적 계산용 결측 메움 (직전 유효값, 선행 결측은 첫 유효값).
+    결측이 든 창은 어차피 NaN 처리되므로, 값 점프를 줄여 누적 오차만 억제하는 용도."""
+    bad = ~np.isfinite(a)
+    if not bad.any():
+        return a
+    first, last, edge_only = _nan_edges(bad)
+    if edge_only.all():
+        k, t = np.arange(a.shape[1]), np.arange(len(a))[:, None]
+        f, l = np.minimum(first, len(a) - 1), np.maximum(last, 0)
+        out = a.copy()
+        np.copyto(out, a[f, k], where=t < first)
+        np.copyto(out, a[l, k], where=t > last)
+    else:
+        t   = np.arange(len(a))[:, None]
+        pos = np.maximum.accumulate(np.where(bad, -1, t), axis=0)
+        pos = np.where(pos < 0, first, pos)
+        out = np.take_along_axis(a, np.minimum(pos, len(a) - 1), axis=0)
+    return np.where(np.isfinite(out), out, 0.0)
+
+
+def _centered_sum(a0: np.ndarray, n: int) -> np.ndarray:
+    """결측 없는 배열의 창 합계: 열별 첫 값을 뺀 누적합 차분 (O(n), 누적 오차 억제)."""
+    ref = a0[0] if len(a0) else 0.0
+    out = _window_diff(np.cumsum(a0 - ref, axis=0), n)
+    out += n * ref
+    return out
+
+
+def rolling_sum(x, n: int):
+    a = _as2d(x)
+    out = _centered_sum(_fill_gaps(a), n)
+    out[_partial_window(a, n)] = np.nan
+    return _like(x, out)
+
+
+def rolling_mean(x, n: int):
+    a   = _as2d(x)
+    out = _centered_sum(_fill_gaps(a), n) / n
+    same = _const_window(a, n)
+    if same is not None:
+        out[same] = a[same]
+    out[_partial_window(a, n)] = np.nan
+    return _like(x, out)
+
+
+def _comoment(a0: np.ndarray, b0: np.ndarray, n: int) -> np.ndarray:
+    """슬라이딩 Welford 공적률 Σ(x-mx)(y-my) (창 끝 위치 기준, 앞 n-1행은 미정의).
+    창이 한 칸 이동할 때 증분 (x_in-mx)(y_in-my') - (x_out-mx)(y_out-my')을
+    창 평균(누적합)으로 한 번에 계산 후 누적 → 파이썬 루프 없이 O(n).
+    """
+    out = np.empty(a0.shape)
+    ma = _centered_sum(a0, n)[n - 1:] / n            # ma[k] = 창 [k, k+n) 평균
+    mb = ma if b0 is a0 else _centered_sum(b0, n)[n - 1:] / n
+    c0 = ((a0[:n] - ma[0]) * (b0[:n] - mb[0])).sum(axis=0)
+    inc = (a0[n:] - ma[:-1]) * (b0[n:] - mb[1:])
+    inc -= (a0[:-n] - ma[:-1]) * (b0[:-n] - mb[1:])
+    out[n - 1] = c0
+    np.cumsum(inc, axis=0, out=out[n:])
+    out[n:] += c0
+    return out
+
+
+def rolling_cov(x, y, n: int, ddof: int = 1):
+    a, b = np.broadcast_arrays(_as2d(x), _as2d(y))
+    out = np.full(a.shape, np.nan)
+    if len(a) >= n:
+        out = _comoment(_fill_gaps(a), _fill_gaps(b), n) / (n - ddof)
+        out[_partial_window(a, n) | _partial_window(b, n)] = np.nan
+    return _like(x, out)
+
+
+def rolling_var(x, n: int, ddof: int = 1):
+    a   = _as2d(x)
+    out = np.full(a.shape, np.nan)
+    if len(a) >= n:
+        a0  = _fill_gaps(a)
+        out = np.maximum(_comoment(a0, a0, n) / (n - ddof), 0.0)
+        same = _const_window(a, n)
+        if same is not None:
+            out[same] = 0.0
+        out[_partial_window(a, n)] = np.nan
+    return _like(x, out)
+
+
+def rolling_std(x, n: int, ddof: int = 1):
+    return _like(x, np.sqrt(_as2d(rolling_var(x, n, ddof))))
+
+
+def _block_extreme(a: np.ndarray, n: int, fn) -> np.ndarray:
+    """van Herk/Gil-Werman: 길이 n 블록의 전방·후방 누적 극값 2개로 창 극값 산출 (O(n))."""
+    L, C = a.shape
+    out  = np.full((L, C), np.nan)
+    if L < n:
+        return out
+    nb   = -(-L // n)
+    pad  = np.full((nb * n, C), a[0] if L else 0.0)
+    pad[:L] = a
+    blk  = pad.reshape(nb, n, C)
+    pre  = fn.accumulate(blk, axis=1).reshape(nb * n, C)
+    suf  = fn.accumulate(blk[:, ::-1], axis=1)[:, ::-1].reshape(nb * n, C)
+    out[n - 1:] = fn(suf[:L - n + 1], pre[n - 1:L])
+    return out
+
+
+def rolling_max(x, n: int):
+    a = _as2d(x)
+    out = _block_extreme(np.where(np.isnan(a), -np.inf, a), n, np.maximum)
+    out[_partial_window(a, n)] = np.nan
+    return _like(x, out)
+
+
+def rolling_min(x, n: int):
+    a = _as2d(x)
+    out = _block_extreme(np.where(np.isnan(a), np.inf, a), n, np.minimum)
+    out[_partial_window(a, n)] = np.nan
+    return _like(x, out)
+
+
+def rolling_mad(x, n: int):
+    """창 평균 기준 평균 절대편차. 창 평균이 위치마다 달라 누적 갱신이 불가하므로
+    n개 시차를 열 전체에 대해 한 번씩 누적 (파이썬 람다 없이 n회 벡터 연산)."""
+    a   = _as2d(x)
+    m   = _as2d(rolling_mean(a, n))
+    acc = np.abs(a - m)
+    for k in range(1, n):
+        acc[k:] += np.abs(a[:-k] - m[k:])
+    acc /= n
+    acc[_partial_window(a, n)] = np.nan
+    return _like(x, acc)
+
+
+def ewm_mean(x, alpha: float):
+    """pandas ewm(alpha, adjust=False).mean() 동등 지수이동평균.
+    앞뒤 NaN만 있는 열은 1차 IIR 필터(lfilter)로 일괄 계산,
+    중간 결측이 있는 열만 pandas의 결측 감쇠 규칙 그대로 계산.
+    """
+    from scipy.signal import lfilter
+    a   = _as2d(x)
+    L, C = a.shape
+    out = np.full((L, C), np.nan)
+    if L == 0:
+        return _like(x, out)
+    first, last, edge_only = _nan_edges(np.isnan(a))
+    has = last >= 0
+
+    fast = np.flatnonzero(has & edge_only)
+    if len(fast):
+        whole = len(fast) == C
+        sub = a.copy() if whole else a[:, fast]
+        f, l = first[fast], last[fast]
+        k = np.arange(len(fast))
+        t = np.arange(L)[:, None]
+        lead, trail = t < f, t > l
+        x0 = sub[f, k]
+        np.copyto(sub, x0, where=lead)
+        np.copyto(sub, sub[l, k], where=trail)
+        y = lfilter([alpha], [1.0, alpha - 1.0], sub, axis=0,
+                    zi=((1.0 - alpha) * x0)[None, :])[0]
+        np.copyto(y, y[l, k], where=trail)
+        y[lead] = np.nan
+        if whole:
+            out = y
+        else:
+            out[:, fast] = y
+
+    slow = np.flatnonzero(has & ~edge_only)
+    if len(slow):
+        out[:, slow] = pd.DataFrame(a[:, slow]).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return _like(x, out)
+
+
+def wilder_ema(x, n: int):
+    """Wilder 평활 (alpha = 1/n)."""
+    return ewm_mean(x, 1.0 / n)
+
+
+def ema_span(x, span: int):
+    return ewm_mean(x, 2.0 / (span + 1))
+
+
+# ═══════════════════════════════════════════════════════════
+# TECHNICAL INDICATOR CALCULATORS
+# ═══════════════════════════════════════════════════════════
+# 모든 지표 함수는 Series(단일 종목)와 DataFrame(열 = 종목) 입력을 동일하게 처리.
+
+TECH_PANEL_CHUNK = 256   # 패널 지표 계산 시 한 번에 처리할 종목 수 (메모리 상한)
+
+
+def _true_range(high, low, close):
+    prev = close.shift()
+    return np.fmax(np.fmax(high - low, (high - prev).abs()), (low - prev).abs())
+
+
+def _rsi(close: pd.Series, n=14) -> pd.Series:
+    d = close.diff()
+    g = wilder_ema(d.clip(lower=0), n)
+    l = wilder_ema(-d.clip(upper=0), n)
+    return 100 - 100 / (1 + g / l.replace(0, np.nan))
+
+
+def _macd(close: pd.Series):
+    e12 = ema_span(close, 12)
+    e26 = ema_span(close, 26)
+    line = e12 - e26
+    sig  = ema_span(line, 9)
+    return line - sig  # histogram
+
+
+def _adx(high, low, close, n=14) -> pd.Series:
+    tr   = _true_range(high, low, close)
+    up   = high - high.shift()
+    dn   = low.shift() - low
+    dm_p = up.clip(lower=0).where(up > dn, 0.0)
+    dm_m = dn.clip(lower=0).where(dn > up, 0.0)
+    atr   = ema_span(tr, n)
+    di_p  = 100 * ema_span(dm_p, n) / atr
+    di_m  = 100 * ema_span(dm_m, n) / atr
+    dx    = 100 * (di_p - di_m).abs() / (di_p + di_m).replace(0, np.nan)
+    return ema_span(dx, n)
+
+
+def _stoch_k(high, low, close, n=14) -> pd.Series:
+    ll = rolling_min(low, n)
+    hh = rolling_max(high, n)
+    return 100 * (close - ll) / (hh - ll).replace(0, np.nan)
+
+
+def _cci(high, low, close, n=20) -> pd.Series:
+    tp  = (high + low + close) / 3
+    sma = rolling_mean(tp, n)
+    mad = rolling_mad(tp, n)
+    return (tp - sma) / (0.015 * mad.replace(0, np.nan))
+
+
+def _mfi(high, low, close, volume, n=14) -> pd.Series:
+    tp   = (high + low + close) / 3
+    rmf  = tp * volume
+    pos  = rmf.where(tp > tp.shift(1), 0.0)
+    neg  = rmf.where(tp < tp.shift(1), 0.0)
+    mfr  = rolling_sum(pos, n) / rolling_sum(neg, n).replace(0, np.nan)
+    return 100 - 100 / (1 + mfr)
+
+
+def _technical_frames(c, h, l, v, spy_a=None) -> dict:
+    """calc_all_technical / calc_panel_technical 공용 본체 → {피처명: Series|DataFrame}.
+    spy_a: c와 같은 모양으로 정렬된 SPY 종가 (없으면 상대강도·베타 NaN).
+    """
+    logr = np.log(c / c.shift(1))
+
+    sma20  = rolling_mean(c, 20)
+    sma50  = rolling_mean(c, 50)
+    sma200 = rolling_mean(c, 200)
+    std20  = rolling_std(c, 20)
+    bb_up  = sma20 + 2 * std20
+    bb_lo  = sma20 - 2 * std20
+
+    atr = rolling_mean(_true_range(h, l, c), 14)
+
+    macd_h = _macd(c)
+
+    df = {}
+
+    # Momentum
+    df["Mom_1w"]  = c.pct_change(5)
+    df["Mom_1m"]  = c.pct_change(21)
+    df["Mom_3m"]  = c.pct_change(63)
+    df["Mom_6m"]  = c.pct_change(126)
+    df["Mom_12m"] = c.pct_change(252)
+    df["Mom_12_1"]       = c.shift(21) / c.shift(252) - 1
+    df["Mom_6_1"]        = c.shift(21) / c.shift(126) - 1
+    df["Momentum_Custom"] = df["Mom_12_1"].fillna(df["Mom_6_1"])
+
+    # ── 상대강도 (종목 수익률 - SPY 수익률) ───────────────
+    if spy_a is not None:
+        spy_1m = spy_a.pct_change(21)
+        spy_3m = spy_a.pct_change(63)
+        spy_6m = spy_a.pct_change(126)
+        df["RS_Market_1m"] = df["Mom_1m"] - spy_1m
+        df["RS_Market_3m"] = df["Mom_3m"] - spy_3m
+        df["RS_Market_6m"] = df["Mom_6m"] - spy_6m
+    else:
+        df["RS_Market_1m"] = np.nan
+        df["RS_Market_3m"] = np.nan
+        df["RS_Market_6m"] = np.nan
+
+    # Trend (WilliamsR_14만 제거 — Stoch_K와 수학적 동치)
+    df["RSI_14"]    = _rsi(c)
+    df["MACD_Hist"] = macd_h / c
+    df["Price_SMA20"]  = c / sma20  - 1
+    df["Price_SMA50"]  = c / sma50  - 1
+    df["Price_SMA200"] = c / sma200 - 1
+    df["SMA50_SMA200"] = sma50 / sma200 - 1
+    df["ADX_14"]       = _adx(h, l, c)
+    df["Stoch_K"]      = _stoch_k(h, l, c)
+    df["CCI_20"]       = _cci(h, l, c)
+    df["MFI_14"]       = _mfi(h, l, c, v)
+    df["BB_Width"]     = (bb_up - bb_lo) / sma20
+    df["BB_Pos"]       = (c - bb_lo) / (bb_up - bb_lo).replace(0, np.nan)
+    df["High52w_Dist"] = c / rolling_max(c, 252) - 1
+    df["Low52w_Dist"]  = c / rolling_min(c, 252) - 1
+
+    # Risk / Volume
+    df["Volatility_30d"]   = rolling_std(logr, 30) * np.sqrt(252)
+    df["Volatility_90d"]   = rolling_std(logr, 90) * np.sqrt(252)
+    df["ATR_Ratio"]        = atr / c
+    vol_sma20 = rolling_mean(v, 20)
+    df["Vol_Ratio"]        = v / vol_sma20.replace(0, np.nan)
+    df["Risk_Adj_Return"]  = rolling_mean(logr, 21) / rolling_std(logr, 21).replace(0, np.nan)
+
+    # ── 베타 (종목-시장 공분산/시장분산) ──────────────────
+    if spy_a is not None:
+        spy_logr = np.log(spy_a / spy_a.shift(1))
+        for win, name in [(60, "Beta_60d"), (120, "Beta_120d")]:
+            cov = rolling_cov(logr, spy_logr, win)
+            var = rolling_var(spy_logr, win)
+            df[name] = cov / var.replace(0, np.nan)
+    else:
+        df["Beta_60d"]  = np.nan
+        df["Beta_120d"] = np.nan
+
+    # ── 롤링 Sharpe (60일) ───────────────────────────────
+    df["Rolling_Sharpe_60d"] = (rolling_mean(logr, 60) / rolling_std(logr, 60).replace(0, np.nan)) * np.sqrt(252)
+
+    # ── 일별 승률 (최근 60일 중 양수 수익률 비율) ─────────
+    df["Daily_Win_Rate_60d"] = rolling_mean((logr > 0).astype(float), 60)
+
+    # ── 변동성 비율 (30d / 90d) — 확대/수축 추세 ─────────
+    df["Vol_Ratio_30_90"] = df["Volatility_30d"] / df["Volatility_90d"].replace(0, np.nan)
+
+    return df
+
+
+def calc_all_technical(ohlcv: pd.DataFrame, spy_close: pd.Series = None) -> pd.DataFrame:
+    """단일 종목의 전체 기술지표 DataFrame 사전 계산 (전체 기간).
+    spy_close: SPY 종가 시리즈 (상대강도·베타 계산용, 없으면 해당 피처 NaN).
+    """
+    spy_a = spy_close.reindex(ohlcv.index, method="ffill") if spy_close is not None else None
+    frames = _technical_frames(ohlcv["Close"], ohlcv["High"], ohlcv["Low"],
+                               ohlcv["Volume"], spy_a)
+    return pd.DataFrame(frames, index=ohlcv.index)
+
+
+def calc_panel_technical(price_data: dict, spy_close: pd.Series = None,
+                         chunk: int = TECH_PANEL_CHUNK) -> dict:
+    """전 종목 기술지표 일괄 계산 → {ticker: 지표 DataFrame} (calc_all_technical과 동일 결과).
+    종목별 거래일을 위로 모은 (봉 순번 × 종목) 배열에서 rolling/shift를 열 단위로 한 번에 수행.
+    SPY 정렬은 전체 거래일 합집합 기준 1회만 계산 후 종목별 행 번호로 수집.
+    """
+    need = {"High", "Low", "Close", "Volume"}
+    tickers = [t for t, df in price_data.items() if len(df) > 0 and need <= set(df.columns)]
+    if not tickers:
+        return {}
+
+    spy_u = all_idx = None
+    if spy_close is not None:
+        idx = [price_data[t].index for t in tickers]
+        all_idx = idx[0].append(idx[1:]).unique().sort_values()
+        spy_u = spy_close.reindex(all_idx, method="ffill").to_numpy(dtype=np.float64)
+
+    out = {}
+    for k in range(0, len(tickers), chunk):
+        part  = tickers[k:k + chunk]
+        n_bar = max(len(price_data[t]) for t in part)
+        arrs  = {f: np.full((n_bar, len(part)), np.nan) for f in ("Close", "High", "Low", "Volume")}
+        spy_p = np.full((n_bar, len(part)), np.nan) if spy_u is not None else None
+        for j, t in enumerate(part):
+            df = price_data[t]
+            for f in arrs:
+                arrs[f][:len(df), j] = df[f].to_numpy(dtype=np.float64)
+            if spy_p is not None:
+                spy_p[:len(df), j] = spy_u[all_idx.get_indexer(df.index)]
+
+        try:
+            frames = _technical_frames(
+                *(pd.DataFrame(arrs[f], columns=part) for f in ("Close", "High", "Low", "Volume")),
+                spy_a=pd.DataFrame(spy_p, columns=part) if spy_p is not None else None,
+            )
+        except Exception:
+            # 일괄 계산 실패 시 해당 묶음만 종목별 계산으로 대체
+            for t in part:
+                try:
+                    out[t] = calc_all_technical(price_data[t], spy_close=spy_close)
+                except Exception:
+                    pass
+            continue
+
+        names = list(frames.keys())
+        block = np.stack([np.broadcast_to(np.asarray(frames[nm], dtype=np.float64),
+                                          (n_bar, len(part))) for nm in names], axis=2)
+        for j, t in enumerate(part):
+            df = price_data[t]
+            out[t] = pd.DataFrame(block[:len(df), j, :].copy(), index=df.index, columns=names)
+    return out
+
+
+# ═══════════════════════════════════════════════════════════
+# STREAMING INDICATOR STATE (새 봉 1개씩 증분 갱신)
+# ═══════════════════════════════════════════════════════════
+# 종목별 상태 dict (JSON 직렬화 가능): EMA 상태, 고정 길이 창 버퍼·누적합, 창 극값 큐.
+# init_tech_state로 전체 이력에서 1회 구성(벡터화) → update_tech_state로 새 봉마다 O(1) 갱신.
+# 갱신 결과는 calc_all_technical 마지막 행과 부동소수 오차 범위에서 동일.
+
+TECH_STATE_VERSION = 2
+_CLOSE_LAGS = (5, 21, 63, 126, 252)
+_NO_NAN     = -(10 ** 9)   # 창 안 결측 위치 초기값 (결측 없음)
+
+# 상태 구성요소: 이름 → 길이 (창 / 극값 큐 / EMA 계수)
+_STATE_WINDOWS = {"c20": 20, "c50": 50, "c200": 200, "tp20": 20, "tr14": 14, "v20": 20,
+                  "pos14": 14, "neg14": 14, "r21": 21, "r30": 30, "r60": 60, "r90": 90,
+                  "up60": 60}
+_STATE_PAIRS   = {"b60": 60, "b120": 120}
+_STATE_EXTREME = {"hi14": (14, True), "lo14": (14, False),
+                  "hi252": (252, True), "lo252": (252, False)}
+_STATE_EMAS    = {"rsi_g": 1 / 14, "rsi_l": 1 / 14, "e12": 2 / 13, "e26": 2 / 27,
+                  "sig": 2 / 10, "atr": 2 / 15, "dmp": 2 / 15, "dmm": 2 / 15, "adx": 2 / 15}
+
+
+def _div(a: float, b: float) -> float:
+    """numpy 나눗셈 규칙 (0으로 나누면 inf/NaN, 예외 없음)."""
+    return float(np.float64(a) / np.float64(b))
+
+
+def _nz(x: float) -> float:
+    return np.nan if x == 0 else x
+
+
+def _ring_new(n: int) -> dict:
+    return {"buf": [np.nan] * n, "pos": 0}
+
+
+def _ring_push(r: dict, x: float) -> float:
+    """값 추가, 밀려난 가장 오래된 값 반환."""
+    out = r["buf"][r["pos"]]
+    r["buf"][r["pos"]] = x
+    r["pos"] = (r["pos"] + 1) % len(r["buf"])
+    return out
+
+
+def _ring_lag(r: dict, k: int) -> float:
+    """k봉 전 값 (k=0: 최신)."""
+    return r["buf"][(r["pos"] - 1 - k) % len(r["buf"])]
+
+
+def _win_new(n: int, pair: bool = False) -> dict:
+    w = {"n": n, "x": _ring_new(n), "i": -1, "last_nan": _NO_NAN, "age": 0,
+         "kx": 0.0, "sx": 0.0, "qx": 0.0, "run": 0, "prev": np.nan}
+    if pair:
+        w.update({"y": _ring_new(n), "ky": 0.0, "sy": 0.0, "qy": 0.0, "sxy": 0.0,
+                  "run_y": 0, "prev_y": np.nan})
+    return w
+
+
+def _win_resync(w: dict) -> None:
+    """누적합을 버퍼에서 다시 계산 (n회 갱신마다 → 누적 오차 상한, 분할상환 O(1))."""
+    pair = "y" in w
+    xs = np.asarray(w["x"]["buf"], dtype=np.float64)
+    ys = np.asarray(w["y"]["buf"], dtype=np.float64) if pair else xs
+    ok = np.isfinite(xs) & np.isfinite(ys)
+    if ok.any():
+        w["kx"] = float(xs[ok].mean())
+        dx = xs[ok] - w["kx"]
+        w["sx"], w["qx"] = float(dx.sum()), float((dx * dx).sum())
+        if pair:
+            w["ky"] = float(ys[ok].mean())
+            dy = ys[ok] - w["ky"]
+            w["sy"], w["qy"], w["sxy"] = float(dy.sum()), float((dy * dy).sum()), float((dx * dy).sum())
+    else:
+        w["sx"] = w["qx"] = 0.0
+        if pair:
+            w["sy"] = w["qy"] = w["sxy"] = 0.0
+    w["age"] = 0
+
+
+def _win_push(w: dict, x: float, y: float = np.nan) -> None:
+    """고정 길이 창에 값(쌍) 추가: 나가는 값은 빼고 들어오는 값은 더함 (O(1))."""
+    pair = "y" in w
+    w["i"] += 1
+    xo = _ring_push(w["x"], x)
+    yo = _ring_push(w["y"], y) if pair else xo
+    if xo == xo and yo == yo:
+        dx = xo - w["kx"]
+        w["sx"] -= dx
+        w["qx"] -= dx * dx
+        if pair:
+            dy = yo - w["ky"]
+            w["sy"] -= dy
+            w["qy"] -= dy * dy
+            w["sxy"] -= dx * dy
+    yv = y if pair else x
+    if np.isfinite(x) and np.isfinite(yv):
+        dx = x - w["kx"]
+        w["sx"] += dx
+        w["qx"] += dx * dx
+        if pair:
+            dy = y - w["ky"]
+            w["sy"] += dy
+            w["qy"] += dy * dy
+            w["sxy"] += dx * dy
+    else:
+        w["last_nan"] = w["i"]
+    w["run"]  = w["run"] + 1 if x == w["prev"] else 1
+    w["prev"] = x
+    if pair:
+        w["run_y"]  = w["run_y"] + 1 if y == w["prev_y"] else 1
+        w["prev_y"] = y
+    w["age"] += 1
+    if w["age"] >= w["n"]:
+        _win_resync(w)
+
+
+def _win_full(w: dict) -> bool:
+    return w["i"] >= w["n"] - 1 and w["last_nan"] <= w["i"] - w["n"]
+
+
+def _win_sum(w: dict) -> float:
+    return w["sx"] + w["n"] * w["kx"] if _win_full(w) else np.nan
+
+
+def _win_mean(w: dict) -> float:
+    if not _win_full(w):
+        return np.nan
+    return w["prev"] if w["run"] >= w["n"] else w["kx"] + w["sx"] / w["n"]
+
+
+def _win_var(w: dict, which: str = "x") -> float:
+    if not _win_full(w):
+        return np.nan
+    n = w["n"]
+    if which == "x":
+        if w["run"] >= n:
+            return 0.0
+        return max((w["qx"] - w["sx"] * w["sx"] / n) / (n - 1), 0.0)
+    if w["run_y"] >= n:
+        return 0.0
+    return max((w["qy"] - w["sy"] * w["sy"] / n) / (n - 1), 0.0)
+
+
+def _win_cov(w: dict) -> float:
+    if not _win_full(w):
+        return np.nan
+    n = w["n"]
+    return (w["sxy"] - w["sx"] * w["sy"] / n) / (n - 1)
+
+
+def _ext_new(n: int, is_max: bool) -> dict:
+    return {"n": n, "max": is_max, "q": [], "i": -1, "last_nan": _NO_NAN}
+
+
+def _ext_push(e: dict, x: float) -> None:
+    """단조 큐 창 극값: 새 값보다 못한 뒤쪽 후보 제거, 창 밖 앞쪽 후보 제거 (분할상환 O(1))."""
+    e["i"] += 1
+    q = e["q"]
+    if x != x:
+        e["last_nan"] = e["i"]
+    else:
+        while q and ((q[-1][1] <= x) if e["max"] else (q[-1][1] >= x)):
+            q.pop()
+        q.append([e["i"], x])
+    while q and q[0][0] <= e["i"] - e["n"]:
+        q.pop(0)
+
+
+def _ext_value(e: dict) -> float:
+    if e["i"] < e["n"] - 1 or e["last_nan"] > e["i"] - e["n"] or not e["q"]:
+        return np.nan
+    return e["q"][0][1]
+
+
+def _ema_push(e: dict, x: float) -> float:
+    """pandas ewm(adjust=False) 1스텝 (결측 구간 가중치 감쇠 포함)."""
+    a, w = e["a"], e["w"]
+    if w == w:
+        e["old"] *= 1.0 - a
+        if x == x:
+            if w != x:
+                w = (e["old"] * w + a * x) / (e["old"] + a)
+            e["old"] = 1.0
+    elif x == x:
+        w = x
+    e["w"] = w
+    return w
+
+
+def _ema_tail(x: pd.Series, alpha: float) -> dict:
+    """전체 이력 EMA의 마지막 상태 (벡터 계산 후 마지막 값 + 후행 결측 감쇠)."""
+    vals = x.to_numpy(dtype=np.float64)
+    ok = ~np.isnan(vals)
+    if not ok.any():
+        return {"a": alpha, "w": np.nan, "old": 1.0}
+    trail = len(vals) - 1 - int(np.flatnonzero(ok)[-1])
+    return {"a": alpha, "w": float(ewm_mean(x, alpha).iloc[-1]),
+            "old": (1.0 - alpha) ** trail}
+
+
+def _state_inputs(c, h, l, v, c_prev, h_prev, l_prev, tp_prev, spy, spy_prev):
+    """봉 1개의 파생 입력값 (calc_all_technical과 같은 정의)."""
+    d    = c - c_prev
+    tp   = (h + l + c) / 3
+    rmf  = tp * v
+    up, dn = h - h_prev, l_prev - l
+    logr = float(np.log(np.float64(_div(c, c_prev))))
+    return {
+        "tp":    tp,
+        "logr":  logr,
+        "spy_logr": float(np.log(np.float64(_div(spy, spy_prev)))),
+        "gain":  d if d != d else max(d, 0.0),
+        "loss":  d if d != d else -min(d, 0.0),
+        "tr":    float(np.fmax(np.fmax(h - l, abs(h - c_prev)), abs(l - c_prev))),
+        "dm_p":  max(up, 0.0) if up > dn else 0.0,
+        "dm_m":  max(dn, 0.0) if dn > up else 0.0,
+        "pos":   rmf if tp > tp_prev else 0.0,
+        "neg":   rmf if tp < tp_prev else 0.0,
+        "up":    1.0 if logr > 0 else 0.0,
+    }
+
+
+def _state_push(state: dict, c, h, l, v, spy) -> dict:
+    """새 봉 1개를 상태에 반영하고 지표 계산용 입력값 반환."""
+    p = state["prev"]
+    inp = _state_inputs(c, h, l, v, p["c"], p["h"], p["l"], p["tp"], spy, p["spy"])
+    W, E, X = state["win"], state["ema"], state["ext"]
+
+    _ring_push(state["closes"], c)
+    _ring_push(state["spy"], spy)
+    for k in ("c20", "c50", "c200"):
+        _win_push(W[k], c)
+    _win_push(W["tp20"], inp["tp"])
+    _win_push(W["tr14"], inp["tr"])
+    _win_push(W["v20"], v)
+    _win_push(W["pos14"], inp["pos"])
+    _win_push(W["neg14"], inp["neg"])
+    for k in ("r21", "r30", "r60", "r90"):
+        _win_push(W[k], inp["logr"])
+    _win_push(W["up60"], inp["up"])
+    for k in ("b60", "b120"):
+        _win_push(W[k], inp["logr"], inp["spy_logr"])
+    _ext_push(X["hi14"], h)
+    _ext_push(X["lo14"], l)
+    _ext_push(X["hi252"], c)
+    _ext_push(X["lo252"], c)
+
+    _ema_push(E["rsi_g"], inp["gain"])
+    _ema_push(E["rsi_l"], inp["loss"])
+    e12, e26 = _ema_push(E["e12"], c), _ema_push(E["e26"], c)
+    _ema_push(E["sig"], e12 - e26)
+    atr = _ema_push(E["atr"], inp["tr"])
+    di_p = 100 * _div(_ema_push(E["dmp"], inp["dm_p"]), atr)
+    di_m = 100 * _div(_ema_push(E["dmm"], inp["dm_m"]), atr)
+    _ema_push(E["adx"], 100 * _div(abs(di_p - di_m), _nz(di_p + di_m)))
+
+    state["prev"] = {"c": c, "h": h, "l": l, "tp": inp["tp"], "spy": spy}
+    state["n_bars"] += 1
+    return inp
+
+
+def tech_state_row(state: dict) -> dict:
+    """현재 상태의 기술지표 1행 (calc_all_technical 열 순서)."""
+    W, E, X = state["win"], state["ema"], state["ext"]
+    cl = state["closes"]
+    c  = _ring_lag(cl, 0)
+    lag = {k: _ring_lag(cl, k) for k in _CLOSE_LAGS}
+    row = {}
+
+    row["Mom_1w"]  = _div(c, lag[5]) - 1
+    row["Mom_1m"]  = _div(c, lag[21]) - 1
+    row["Mom_3m"]  = _div(c, lag[63]) - 1
+    row["Mom_6m"]  = _div(c, lag[126]) - 1
+    row["Mom_12m"] = _div(c, lag[252]) - 1
+    row["Mom_12_1"] = _div(_ring_lag(cl, 21), _ring_lag(cl, 252)) - 1
+    row["Mom_6_1"]  = _div(_ring_lag(cl, 21), _ring_lag(cl, 126)) - 1
+    row["Momentum_Custom"] = row["Mom_12_1"] if row["Mom_12_1"] == row["Mom_12_1"] else row["Mom_6_1"]
+
+    if state["has_spy"]:
+        sp = state["spy"]
+        s0 = _ring_lag(sp, 0)
+        row["RS_Market_1m"] = row["Mom_1m"] - (_div(s0, _ring_lag(sp, 21)) - 1)
+        row["RS_Market_3m"] = row["Mom_3m"] - (_div(s0, _ring_lag(sp, 63)) - 1)
+        row["RS_Market_6m"] = row["Mom_6m"] - (_div(s0, _ring_lag(sp, 126)) - 1)
+    else:
+        row["RS_Market_1m"] = row["RS_Market_3m"] = row["RS_Market_6m"] = np.nan
+
+    sma20, sma50, sma200 = _win_mean(W["c20"]), _win_mean(W["c50"]), _win_mean(W["c200"])
+    std20 = np.sqrt(_win_var(W["c20"]))
+    bb_up, bb_lo = sma20 + 2 * std20, sma20 - 2 * std20
+    line = E["e12"]["w"] - E["e26"]["w"]
+
+    row["RSI_14"]    = 100 - _div(100, 1 + _div(E["rsi_g"]["w"], _nz(E["rsi_l"]["w"])))
+    row["MACD_Hist"] = _div(line - E["sig"]["w"], c)
+    row["Price_SMA20"]  = _div(c, sma20) - 1
+    row["Price_SMA50"]  = _div(c, sma50) - 1
+    row["Price_SMA200"] = _div(c, sma200) - 1
+    row["SMA50_SMA200"] = _div(sma50, sma200) - 1
+    row["ADX_14"]       = E["adx"]["w"]
+    ll, hh = _ext_value(X["lo14"]), _ext_value(X["hi14"])
+    row["Stoch_K"]      = 100 * _div(c - ll, _nz(hh - ll))
+    tp_w = W["tp20"]
+    sma_tp = _win_mean(tp_w)
+    if sma_tp == sma_tp:
+        mad = float(np.mean(np.abs(np.asarray(tp_w["x"]["buf"]) - sma_tp)))
+    else:
+        mad = np.nan
+    row["CCI_20"]       = _div(state["prev"]["tp"] - sma_tp, 0.015 * _nz(mad))
+    mfr = _div(_win_sum(W["pos14"]), _nz(_win_sum(W["neg14"])))
+    row["MFI_14"]       = 100 - _div(100, 1 + mfr)
+    row["BB_Width"]     = _div(bb_up - bb_lo, sma20)
+    row["BB_Pos"]       = _div(c - bb_lo, _nz(bb_up - bb_lo))
+    row["High52w_Dist"] = _div(c, _ext_value(X["hi252"])) - 1
+    row["Low52w_Dist"]  = _div(c, _ext_value(X["lo252"])) - 1
+
+    ann = np.sqrt(252)
+    row["Volatility_30d"]  = np.sqrt(_win_var(W["r30"])) * ann
+    row["Volatility_90d"]  = np.sqrt(_win_var(W["r90"])) * ann
+    row["ATR_Ratio"]       = _div(_win_mean(W["tr14"]), c)
+    row["Vol_Ratio"]       = _div(W["v20"]["prev"], _nz(_win_mean(W["v20"])))
+    row["Risk_Adj_Return"] = _div(_win_mean(W["r21"]), _nz(np.sqrt(_win_var(W["r21"]))))
+
+    for k, name in (("b60", "Beta_60d"), ("b120", "Beta_120d")):
+        row[name] = (_div(_win_cov(W[k]), _nz(_win_var(W[k], "y")))
+                     if state["has_spy"] else np.nan)
+
+    row["Rolling_Sharpe_60d"] = _div(_win_mean(W["r60"]), _nz(np.sqrt(_win_var(W["r60"])))) * ann
+    row["Daily_Win_Rate_60d"] = _win_mean(W["up60"])
+    row["Vol_Ratio_30_90"]    = _div(row["Volatility_30d"], _nz(row["Volatility_90d"]))
+    return row
+
+
+def tech_state_source(ohlcv: pd.DataFrame, spy_close: pd.Series = None) -> dict:
+    """상태를 구성한 입력 이력 지문 — 종목 OHLCV + 종목 마지막 날짜까지의 SPY.
+    마지막 날짜가 같아도 수정주가 재조정·SPY 이력 변경 시 달라짐 (저장 상태 재사용 판단용)."""
+    spy = None
+    if spy_close is not None:
+        spy = spy_close.loc[:ohlcv.index[-1]] if len(ohlcv) else spy_close
+    return {"price": frame_fingerprint(ohlcv), "spy": frame_fingerprint(spy)}
+
+
+def init_tech_state(ohlcv: pd.DataFrame, spy_close: pd.Series = None) -> dict:
+    """전체 이력에서 스트리밍 상태 구성.
+    EMA는 전 구간 벡터 계산의 마지막 상태, 창·극값 큐는 마지막 창 길이만큼만 적재.
+    """
+    c, h, l, v = (ohlcv["Close"], ohlcv["High"], ohlcv["Low"], ohlcv["Volume"])
+    spy_a = (spy_close.reindex(ohlcv.index, method="ffill") if spy_close is not None
+             else pd.Series(np.nan, index=ohlcv.index))
+    c_prev, h_prev, l_prev = c.shift(), h.shift(), l.shift()
+    tp = (h + l + c) / 3
+    inp = pd.DataFrame({
+        "c": c, "h": h, "l": l, "v": v, "tp": tp, "spy": spy_a,
+        "logr": np.log(c / c_prev),
+        "spy_logr": np.log(spy_a / spy_a.shift()),
+        "tr": _true_range(h, l, c),
+        "pos": (tp * v).where(tp > tp.shift(1), 0.0),
+        "neg": (tp * v).where(tp < tp.shift(1), 0.0),
+    })
+    inp["up"] = (inp["logr"] > 0).astype(float)
+
+    state = {
+        "version": TECH_STATE_VERSION,
+        "has_spy": spy_close is not None,
+        "last_date": ohlcv.index[-1].isoformat() if len(ohlcv) else None,
+        "n_bars": len(ohlcv),
+        "source": tech_state_source(ohlcv, spy_close),
+        "closes": _ring_new(max(_CLOSE_LAGS) + 1),
+        "spy": _ring_new(127),
+        "win": {k: _win_new(n) for k, n in _STATE_WINDOWS.items()},
+        "ext": {k: _ext_new(n, mx) for k, (n, mx) in _STATE_EXTREME.items()},
+    }
+    state["win"].update({k: _win_new(n, pair=True) for k, n in _STATE_PAIRS.items()})
+
+    # 창·링 버퍼: 각 길이만큼의 최근 값만 적재
+    def tail(col, n):
+        return inp[col].to_numpy(dtype=np.float64)[-n:].tolist()
+
+    for x in tail("c", 253):
+        _ring_push(state["closes"], x)
+    for x in tail("spy", 127):
+        _ring_push(state["spy"], x)
+    src = {"c20": "c", "c50": "c", "c200": "c", "tp20": "tp", "tr14": "tr", "v20": "v",
+           "pos14": "pos", "neg14": "neg", "r21": "logr", "r30": "logr", "r60": "logr",
+           "r90": "logr", "up60": "up"}
+    for k, col in src.items():
+        for x in tail(col, _STATE_WINDOWS[k]):
+            _win_push(state["win"][k], x)
+    for k, n in _STATE_PAIRS.items():
+        for x, y in zip(tail("logr", n), tail("spy_logr", n)):
+            _win_push(state["win"][k], x, y)
+    for k, (n, _) in _STATE_EXTREME.items():
+        for x in tail("h" if k == "hi14" else "l" if k == "lo14" else "c", n):
+            _ext_push(state["ext"][k], x)
+
+    # EMA: 전체 이력 벡터 계산 → 마지막 상태
+    d = c.diff()
+    e12, e26 = ema_span(c, 12), ema_span(c, 26)
+    up, dn = h - h_prev, l_prev - l
+    dm_p = up.clip(lower=0).where(up > dn, 0.0)
+    dm_m = dn.clip(lower=0).where(dn > up, 0.0)
+    atr  = ema_span(inp["tr"], 14)
+    di_p = 100 * ema_span(dm_p, 14) / atr
+    di_m = 100 * ema_span(dm_m, 14) / atr
+    dx   = 100 * (di_p - di_m).abs() / (di_p + di_m).replace(0, np.nan)
+    state["ema"] = {
+        "rsi_g": _ema_tail(d.clip(lower=0), _STATE_EMAS["rsi_g"]),
+        "rsi_l": _ema_tail(-d.clip(upper=0), _STATE_EMAS["rsi_l"]),
+        "e12":   _ema_tail(c, _STATE_EMAS["e12"]),
+        "e26":   _ema_tail(c, _STATE_EMAS["e26"]),
+        "sig":   _ema_tail(e12 - e26, _STATE_EMAS["sig"]),
+        "atr":   _ema_tail(inp["tr"], _STATE_EMAS["atr"]),
+        "dmp":   _ema_tail(dm_p, _STATE_EMAS["dmp"]),
+        "dmm":   _ema_tail(dm_m, _STATE_EMAS["dmm"]),
+        "adx":   _ema_tail(dx, _STATE_EMAS["adx"]),
+    }
+
+    last = inp.iloc[-1] if len(inp) else pd.Series(np.nan, index=inp.columns)
+    state["prev"] = {k: float(last[k]) for k in ("c", "h", "l", "tp", "spy")}
+    return state
+
+
+def update_tech_state(state: dict, date, bar, spy: float = np.nan) -> dict:
+    """새 봉 1개 반영 후 해당 날짜의 기술지표 1행 반환 (O(1)).
+    bar: Close/High/Low/Volume을 가진 dict 또는 Series, spy: 해당 날짜(이전 최근) SPY 종가.
+    """
+    _state_push(state, float(bar["Close"]), float(bar["High"]), float(bar["Low"]),
+                float(bar["Volume"]), float(spy) if state["has_spy"] else np.nan)
+    state["last_date"] = pd.Timestamp(date).isoformat()
+    state["source"] = None   # 구성 이력 이후 봉 반영 → 저장 이력 지문과 더 이상 대응하지 않음
+    return tech_state_row(state)
+
+
+def save_tech_states(states: dict, path: str) -> None:
+    """{ticker: 상태} → JSON 파일 (원자적 교체)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(states, f)
+    os.replace(tmp, path)
+
+
+def load_tech_states(path: str) -> dict:
+    """JSON 파일 → {ticker: 상태} (버전 불일치 항목 제외)."""
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {t: s for t, s in raw.items() if s.get("version") == TECH_STATE_VERSION}
+
+
+# ═══════════════════════════════════════════════════════════
+# PIT (POINT-IN-TIME) FINANCIALS
+# ═══════════════════════════════════════════════════════════
+
+def _to_ts(c):
+    try:
+        return pd.Timestamp(c)
+    except Exception:
+        return pd.NaT
+
+
+# PIT 재무 값 항목 (PIT 테이블 컬럼 순서)
+PIT_VALUE_KEYS = (
+    "ttm_rev", "ttm_gross", "ttm_op", "ttm_net", "ttm_ebit", "ttm_ebitda",
+    "ttm_interest", "ttm_eps", "ttm_ocf", "ttm_capex", "ttm_fcf",
+    "total_assets", "equity", "current_assets", "current_liabilities",
+    "total_debt", "cash", "shares_outstanding",
+    "prev_rev", "prev_net", "prev_eps",
+)
+# 재무제표 키 → 공시 지연(일)
+_PIT_STATEMENTS = {
+    "income": REPORT_LAG, "balance": REPORT_LAG, "cashflow": REPORT_LAG,
+    "annual_income": ANNUAL_REPORT_LAG, "annual_balance": ANNUAL_REPORT_LAG,
+    "annual_cashflow": ANNUAL_REPORT_LAG,
+}
+# (값 키, 행 이름 후보 — 앞에서부터 시도)
+_PIT_INCOME_ROWS = (
+    ("ttm_rev",      ("Total Revenue",)),
+    ("ttm_gross",    ("Gross Profit",)),
+    ("ttm_op",       ("Operating Income",)),
+    ("ttm_net",      ("Net Income",)),
+    ("ttm_ebit",     ("EBIT",)),
+    ("ttm_ebitda",   ("EBITDA",)),
+    ("ttm_interest", ("Interest Expense", "Interest Expense Non Operating")),
+    ("ttm_eps",      ("Basic EPS",)),
+)
+_PIT_PREV_ROWS = (
+    ("prev_rev", ("Total Revenue",)),
+    ("prev_net", ("Net Income",)),
+    ("prev_eps", ("Basic EPS",)),
+)
+_PIT_BALANCE_ROWS = (
+    ("total_assets",        ("Total Assets",)),
+    ("equity",              ("Stockholders Equity",
+                             "Total Equity Gross Minority Interest",
+                             "Common Stock Equity")),
+    ("current_assets",      ("Current Assets",)),
+    ("current_liabilities", ("Current Liabilities",)),
+    ("total_debt",          ("Total Debt", "Long Term Debt And Capital Lease Obligation")),
+    ("cash",                ("Cash And Cash Equivalents",
+                             "Cash Cash Equivalents And Short Term Investments")),
+    ("shares_outstanding",  ("Ordinary Shares Number", "Share Issued")),
+)
+_PIT_CASHFLOW_ROWS = (
+    ("ttm_ocf",   ("Operating Cash Flow",)),
+    ("ttm_capex", ("Capital Expenditure",)),
+    ("ttm_fcf",   ("Free Cash Flow",)),
+)
+
+
+def _pit_statement(df) -> dict | None:
+    """재무제표 DataFrame → 결산일 최신순 float 행렬 (라벨 파싱·정렬 1회).
+    반환: {"ts": 결산일 배열(최신순), "vals": 항목 × 결산일, "row": {항목: 행 번호}}
+    날짜로 해석되지 않는 컬럼은 제외, 중복 라벨·숫자가 아닌 셀은 NaN.
+    """
+    if df is None or df.empty:
+        return None
+    ts = [_to_ts(c) for c in df.columns]
+    keep = [i for i, t in enumerate(ts) if t is not pd.NaT]
+    if not keep:
+        return None
+    order = sorted(keep, key=lambda i: ts[i], reverse=True)
+    if not all(pd.api.types.is_numeric_dtype(t) for t in df.dtypes):
+        df = df.apply(pd.to_numeric, errors="coerce")
+    vals = df.to_numpy(dtype=np.float64)[:, order]
+    vals[:, df.columns.duplicated(keep=False)[order]] = np.nan
+    dup_row = df.index.duplicated(keep=False)
+    return {
+        "ts":   np.array([ts[i].to_datetime64() for i in order], dtype="datetime64[ns]"),
+        "vals": vals,
+        "row":  {r: i for i, r in enumerate(df.index) if not dup_row[i]},
+    }
+
+
+def _stmt_first(st: dict, k: int, names) -> float:
+    """k번째(최신 가용) 결산 컬럼에서 행 이름 후보 순서대로 첫 유효값."""
+    for name in names:
+        i = st["row"].get(name)
+        if i is not None and not np.isnan(st["vals"][i, k]):
+            return float(st["vals"][i, k])
+    return np.nan
+
+
+def _stmt_sum(st: dict, k: int, names, lo: int, hi: int, full: bool) -> float:
+    """가용 컬럼 [k+lo, k+hi) 합산 (부족하면 연율화). full: 4개 모두 유효 시 단순 합."""
+    for name in names:
+        i = st["row"].get(name)
+        if i is None:
+            continue
+        v = st["vals"][i, k + lo:k + hi]
+        valid = v[~np.isnan(v)].tolist()
+        if not valid:
+            continue
+        return sum(valid) if (full and len(valid) == 4) else sum(valid) * 4 / len(valid)
+    return np.nan
+
+
+def _stmt_avail(st: dict | None, cutoff: np.datetime64) -> int:
+    """cutoff 이전 결산 컬럼의 시작 위치 (없으면 -1)."""
+    if st is None:
+        return -1
+    k = int(np.count_nonzero(st["ts"] > cutoff))
+    return k if k < len(st["ts"]) else -1
+
+
+def _pit_values_at(stmts: dict, date) -> dict:
+    """정규화된 재무제표(_pit_statement) 기준, 특정 날짜에 사용 가능한 TTM 재무 값.
+    우선순위: 분기 TTM → 연간 폴백.
+    분기: REPORT_LAG(45일), 연간: ANNUAL_REPORT_LAG(75일).
+    """
+    date = np.datetime64(pd.Timestamp(date).to_datetime64(), "ns")
+    cutoff   = date - np.timedelta64(REPORT_LAG, "D")
+    cutoff_a = date - np.timedelta64(ANNUAL_REPORT_LAG, "D")
+    out = dict.fromkeys(PIT_VALUE_KEYS, np.nan)
+
+    # ── 분기 손익계산서 (최근 4분기 TTM + 4~7분기 전 전년 동기) ──
+    inc = stmts["income"]
+    k = _stmt_avail(inc, cutoff)
+    if k >= 0:
+        for key, names in _PIT_INCOME_ROWS:
+            out[key] = _stmt_sum(inc, k, names, 0, 4, True)
+        for key, names in _PIT_PREV_ROWS:
+            out[key] = _stmt_sum(inc, k, names, 4, 8, False)
+
+    # ── 분기 대차대조표 (최신 분기) ──────────────────────
+    bal = stmts["balance"]
+    k = _stmt_avail(bal, cutoff)
+    if k >= 0:
+        for key, names in _PIT_BALANCE_ROWS:
+            out[key] = _stmt_first(bal, k, names)
+
+    # ── 분기 현금흐름표 ──────────────────────────────────
+    cf = stmts["cashflow"]
+    k = _stmt_avail(cf, cutoff)
+    if k >= 0:
+        for key, names in _PIT_CASHFLOW_ROWS:
+            out[key] = _stmt_sum(cf, k, names, 0, 4, True)
+
+    # ── 연간 폴백: 분기 값이 없으면 최신 연간으로 보완 ────
+    if np.isnan(out["ttm_rev"]):
+        a_inc = stmts["annual_income"]
+        k = _stmt_avail(a_inc, cutoff_a)
+        if k >= 0:
+            for key, names in _PIT_INCOME_ROWS:
+                out[key] = _stmt_first(a_inc, k, names)
+            # 전년 비교 (연간 2번째)
+            if k + 1 < len(a_inc["ts"]):
+                for key, names in _PIT_PREV_ROWS:
+                    out[key] = _stmt_first(a_inc, k + 1, names)
+
+    if np.isnan(out["total_assets"]):
+        a_bal = stmts["annual_balance"]
+        k = _stmt_avail(a_bal, cutoff_a)
+        if k >= 0:
+            shares_out = out["shares_outstanding"]
+            for key, names in _PIT_BALANCE_ROWS:
+                out[key] = _stmt_first(a_bal, k, names)
+            if not np.isnan(shares_out):
+                out["shares_outstanding"] = shares_out
+
+    if np.isnan(out["ttm_ocf"]):
+        a_cf = stmts["annual_cashflow"]
+        k = _stmt_avail(a_cf, cutoff_a)
+        if k >= 0:
+            for key, names in _PIT_CASHFLOW_ROWS:
+                out[key] = _stmt_first(a_cf, k, names)
+
+    if (np.isnan(out["ttm_fcf"]) and not np.isnan(out["ttm_ocf"])
+            and not np.isnan(out["ttm_capex"])):
+        out["ttm_fcf"] = out["ttm_ocf"] + out["ttm_capex"]  # CapEx는 보통 음수
+    return out
+
+
+def build_pit_table(pit_data: dict) -> pd.DataFrame:
+    """종목 1개의 get_pit_financials 결과 → 반영일 순 PIT 값 테이블.
+    행: 값이 바뀔 수 있는 날짜(분기 결산일+REPORT_LAG, 연간 결산일+ANNUAL_REPORT_LAG)
+        + 첫 공시 이전 구간(Timestamp.min, 전부 NaN)
+    열: PIT_VALUE_KEYS — 다음 행 날짜 전까지 그대로 유효 (as-of 조회)
+    """
+    stmts = {key: _pit_statement(pit_data.get(key)) for key in _PIT_STATEMENTS}
+    events = set()
+    for key, lag in _PIT_STATEMENTS.items():
+        if stmts[key] is not None:
+            events.update(stmts[key]["ts"] + np.timedelta64(lag, "D"))
+    dates = sorted(events)
+    rows = [dict.fromkeys(PIT_VALUE_KEYS, np.nan)]
+    rows += [_pit_values_at(stmts, d) for d in dates]
+    index = pd.DatetimeIndex([pd.Timestamp.min] + [pd.Timestamp(d) for d in dates],
+                             name="avail_date").as_unit("ns")
+    return pd.DataFrame(rows, index=index, columns=list(PIT_VALUE_KEYS))
+
+
+def build_pit_tables(pit_map: dict) -> pd.DataFrame:
+    """{ticker: PIT 재무} → 전 종목 PIT 테이블 (long: ticker, avail_date, 값…, 반영일 순).
+    백테스트 시작 전 1회 구성 → 모든 스냅샷이 as-of 병합으로 조회.
+    """
+    frames = [build_pit_table(d).reset_index().assign(ticker=t)
+              for t, d in (pit_map or {}).items() if d]
+    if not frames:
+        return pd.DataFrame(columns=["ticker", "avail_date", *PIT_VALUE_KEYS])
+    tbl = pd.concat(frames, ignore_index=True)
+    tbl = tbl[["ticker", "avail_date", *PIT_VALUE_KEYS]]
+    return tbl.sort_values("avail_date", kind="stable", ignore_index=True)
+
+
+def pit_values_asof(pit_table: pd.DataFrame, tickers, dates) -> pd.DataFrame:
+    """(종목, 날짜) 쌍 → 해당 날짜에 사용 가능했던 PIT 값 (as-of 병합 1회).
+    dates: 단일 날짜 또는 tickers와 같은 길이의 날짜 배열
+    반환: 입력 순서의 DataFrame (ticker, date, PIT_VALUE_KEYS, has_pit)
+          has_pit=False: PIT 재무 자체가 없는 종목 (값 전부 NaN)
+    """
+    tickers = list(tickers)
+    if np.ndim(dates) == 0:
+        dates = [dates] * len(tickers)
+    left = pd.DataFrame({
+        "ticker": pd.Series(tickers, dtype=object),
+        "date":   pd.DatetimeIndex(dates).as_unit("ns"),
+    })
+    if not len(left) or pit_table is None or pit_table.empty:
+        out = left.assign(**dict.fromkeys(PIT_VALUE_KEYS, np.nan))
+        out["has_pit"] = False
+        return out
+    right = pit_table.astype({"ticker": object})
+    right["avail_date"] = pd.DatetimeIndex(right["avail_date"]).as_unit("ns")
+    order = np.argsort(left["date"].to_numpy(), kind="stable")
+    merged = pd.merge_asof(
+        left.iloc[order], right,
+        left_on="date", right_on="avail_date", by="ticker",
+        direction="backward", allow_exact_matches=True,
+    )
+    merged.index = order
+    merged = merged.sort_index()
+    merged["has_pit"] = merged["avail_date"].notna()
+    return merged.drop(columns="avail_date")
+
+
+def _sdiv(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """원소별 a / b — 어느 쪽이든 NaN이거나 b == 0이면 NaN."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.isnan(a) | np.isnan(b) | (b == 0), np.nan, a / b)
+
+
+def _compute_pit_metrics(pit_vals: pd.DataFrame, hist_price, shares) -> pd.DataFrame:
+    """PIT 재무 값 + 역사적 주가 → PIT 지표 행렬 (횡단면 또는 전 기간 일괄).
+    pit_vals: PIT_VALUE_KEYS 열 (행 = 종목 또는 종목×날짜)
+    hist_price: 행별 리밸런싱 시점의 실제 주가
+    shares: 행별 .info 발행주식수 (PIT balance sheet 값이 없을 때 사용)
+    주가 또는 주식수(0 포함)가 없는 행은 전부 NaN.
+    """
+    v = pit_vals.reindex(columns=list(PIT_VALUE_KEYS))
+
+    def col(k):
+        return v[k].to_numpy(dtype=np.float64)
+
+    price = np.asarray(hist_price, dtype=np.float64)
+    # PIT shares 우선 사용
+    s = col("shares_outstanding")
+    s = np.where(np.isnan(s), np.asarray(shares, dtype=np.float64), s)
+    ok = ~np.isnan(price) & ~np.isnan(s) & (s != 0)
+
+    r, gp, op, ni = col("ttm_rev"), col("ttm_gross"), col("ttm_op"), col("ttm_net")
+    ebit, ebitda  = col("ttm_ebit"), col("ttm_ebitda")
+    iexp, eps     = col("ttm_interest"), col("ttm_eps")
+    fcf           = col("ttm_fcf")
+    ta, eq        = col("total_assets"), col("equity")
+    ca, cl        = col("current_assets"), col("current_liabilities")
+    debt, cash    = col("total_debt"), col("cash")
+    pr, pn, pe_   = col("prev_rev"), col("prev_net"), col("prev_eps")
+
+    mktcap = np.where(ok, price * s, np.nan)
+    ev = mktcap + np.nan_to_num(debt, nan=0.0) - np.nan_to_num(cash, nan=0.0)
+
+    rev_g = _sdiv(r - pr, np.abs(pr))
+    ni_g  = _sdiv(ni - pn, np.abs(pn))
+    eps_g = _sdiv(eps - pe_, np.abs(pe_))
+
+    pe_val = _sdiv(mktcap, ni)
+    with np.errstate(invalid="ignore"):
+        peg   = np.where(eps_g > 0, _sdiv(pe_val, eps_g * 100), np.nan)
+        p_fcf = np.where(fcf > 0, _sdiv(mktcap, fcf), np.nan)
+        mcap_log = np.log(np.maximum(mktcap, 1))
+
+    out = pd.DataFrame({
+        "P_E":               pe_val,
+        "P_B":               _sdiv(mktcap, eq),
+        "P_S":               _sdiv(mktcap, r),
+        "EV_EBITDA":         _sdiv(ev, ebitda),
+        "P_FCF":             p_fcf,
+        "FCF_Yield":         _sdiv(fcf, mktcap),
+        "PEG_Ratio":         peg,
+        "ROE":               _sdiv(ni, eq),
+        "ROA":               _sdiv(ni, ta),
+        "Gross_Margin":      _sdiv(gp, r),
+        "Op_Margin":         _sdiv(op, r),
+        "EBITDA_Margin":     _sdiv(ebitda, r),
+        "Rev_Growth":        rev_g,
+        "NI_Growth":         ni_g,
+        "EPS_Growth":        eps_g,
+        "Debt_Equity":       _sdiv(debt, eq),
+        "Current_Ratio":     _sdiv(ca, cl),
+        "Interest_Coverage": _sdiv(ebit, np.abs(iexp)),
+        "Asset_Turnover":    _sdiv(r, ta),
+        "GP_A_Quality":      _sdiv(gp, ta),
+        "MktCap_Log":        mcap_log,
+    }, index=v.index)
+    out.loc[~ok] = np.nan
+    return out
+
+
+# ═══════════════════════════════════════════════════════════
+# FEATURE ENGINEERING
+# ═══════════════════════════════════════════════════════════
+
+# 펀더멘털 피처 (FEATURE_META 순서)
+FUND_KEYS = [
+    "P_E", "P_B", "P_S", "EV_EBITDA", "P_FCF", "FCF_Yield",
+    "Div_Yield", "PEG_Ratio", "ROE", "ROA", "Gross_Margin",
+    "Op_Margin", "EBITDA_Margin", "Rev_Growth", "NI_Growth",
+    "EPS_Growth", "Debt_Equity", "Current_Ratio", "Interest_Coverage",
+    "Asset_Turnover", "GP_A_Quality", "MktCap_Log",
+]
+
+
+def _fund_column(funds: list, key: str, default=np.nan, falsy=None) -> np.ndarray:
+    """fund dict 목록 → 항목 1개의 float 배열.
+    default: 항목이 없을 때 값, falsy: 값이 0/None일 때 대체값 (None이면 대체 안 함)
+    숫자로 변환할 수 없는 값은 NaN.
+    """
+    out = np.empty(len(funds))
+    for i, f in enumerate(funds):
+        v = f.get(key, default)
+        if falsy is not None and not v:
+            v = falsy
+        try:
+            out[i] = float(v) if v is not None else np.nan
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def _info_features(funds: list) -> pd.DataFrame:
+    """yfinance info dict 목록 → .info 기반 펀더멘털 피처 (실시간 추천 기본값)."""
+    def c(key, default=np.nan, falsy=None):
+        return _fund_column(funds, key, default, falsy)
+
+    mkt  = c("mkt_cap", falsy=np.nan)
+    fcf  = c("fcf",     falsy=np.nan)
+    rev  = c("revenue", falsy=np.nan)
+    ta   = c("total_assets", 1, falsy=1)
+    ebit_val, ebitda = c("ebit"), c("ebitda")
+    gp, iexp         = c("gross_profit"), c("interest_exp")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "P_E":               c("pe"),
+            "P_B":               c("pb"),
+            "P_S":               c("ps"),
+            "EV_EBITDA":         c("ev_ebitda"),
+            "P_FCF":             np.where((fcf > 0) & (mkt > 0), mkt / fcf, np.nan),
+            "FCF_Yield":         np.where(mkt > 0, fcf / mkt, np.nan),
+            "Div_Yield":         c("div_yield", 0),
+            "PEG_Ratio":         c("peg"),
+            "ROE":               c("roe"),
+            "ROA":               c("roa"),
+            "Gross_Margin":      c("gross_mg"),
+            "Op_Margin":         c("op_mg"),
+            "EBITDA_Margin":     np.where(rev != 0, ebitda / rev, np.nan),
+            "Rev_Growth":        c("rev_growth"),
+            "NI_Growth":         c("ni_growth"),
+            "EPS_Growth":        c("eps_growth"),
+            "Debt_Equity":       c("debt_eq"),
+            "Current_Ratio":     c("curr_ratio"),
+            "Interest_Coverage": np.where(iexp != 0, ebit_val / np.abs(iexp), np.nan),
+            "Asset_Turnover":    rev / ta,
+            "GP_A_Quality":      gp / ta,
+            "MktCap_Log":        np.log(c("mkt_cap", 0, falsy=1)),
+        })
+
+
+def _fund_features(funds: list, pit_metrics: pd.DataFrame,
+                   backtest_mode: bool = False) -> pd.DataFrame:
+    """펀더멘털 피처 행렬 (행 순서 = funds/pit_metrics, columns=FUND_KEYS).
+    backtest_mode=True: .info 미사용, PIT 전용 (Look-Ahead 제거)
+    backtest_mode=False: .info 기본값 + 유효한 PIT 지표 덮어쓰기 (실시간 추천용)
+    """
+    pit = pit_metrics.reindex(columns=FUND_KEYS)
+    if backtest_mode:
+        return pit
+    base = _info_features(funds).set_axis(pit.index)
+    return pit.where(pit.notna(), base)
+
+
+def build_snapshot_df(
+    tickers: list,
+    tech_map: dict,
+    fund_map: dict,
+    date: pd.Timestamp,
+    min_history: int = 252,
+    pit_table: pd.DataFrame = None,
+    panel: dict = None,
+    backtest_mode: bool = False,
+) -> pd.DataFrame:
+    """모든 종목에 대해 특정 날짜의 피처 DataFrame 구성 (build_snapshots 단일 날짜판).
+    pit_table: build_pit_tables 결과 — 전 종목 PIT 값을 as-of 병합 1회로 조회
+    panel: build_price_panel 결과 — 역사적 주가 조회용
+    backtest_mode=True: PIT 전용, .info 미사용
+    """
+    snaps = build_snapshots({date: tickers}, tech_map, fund_map,
+                            min_history=min_history, pit_table=pit_table, panel=panel,
+                            backtest_mode=backtest_mode, enrich=False)
+    return snaps.droplevel("date") if not snaps.empty else snaps
+
+
+def build_snapshots(
+    universe: dict,
+    tech_map: dict,
+    fund_map: dict,
+    min_history: int = 252,
+    pit_table: pd.DataFrame = None,
+    panel: dict = None,
+    backtest_mode: bool = False,
+    spy_close: pd.Series = None,
+    vix_close: pd.Series = None,
+    sector_map: dict = None,
+    enrich: bool = True,
+) -> pd.DataFrame:
+    """여러 리밸런싱 날짜의 피처를 한 번에 구성 (날짜 × 종목 long 테이블).
+    universe: {date: [ticker, ...]} — 날짜별 후보 종목 (순서 유지)
+    enrich=True: enrich_snapshot의 CS 백분위 + Regime + Sector RS까지 계산
+    반환: index=(date, ticker), columns=FEAT_COLS
+          날짜별 단면 = build_snapshot_df (+ enrich_snapshot) 결과와 동일
+    """
+    # (날짜, 종목) 쌍 — 기술지표 이력이 충분한 종목만
+    d_list, t_list = [], []
+    for date, tickers in universe.items():
+        for t in tickers:
+            td = tech_map.get(t)
+            if td is not None and len(td) >= min_history:
+                d_list.append(date)
+                t_list.append(t)
+    if not t_list:
+        return pd.DataFrame()
+    dates = pd.DatetimeIndex(d_list)
+    tick  = np.array(t_list, dtype=object)
+
+    # 기술지표: 종목별로 전 날짜의 as-of 행을 한 번에 조회
+    feat = np.full((len(tick), len(FEAT_COLS)), np.nan)
+    keep = np.zeros(len(tick), dtype=bool)
+    for t, idx in pd.Series(tick).groupby(tick, sort=False).indices.items():
+        td  = tech_map[t]
+        pos = td.index.searchsorted(dates[idx], side="right")
+        hit = pos > 0
+        if not hit.any():
+            continue
+        src = td.columns.get_indexer(FEAT_COLS)
+        dst = np.flatnonzero(src >= 0)
+        feat[np.ix_(idx[hit], dst)] = td.to_numpy(dtype=np.float64)[np.ix_(pos[hit] - 1, src[dst])]
+        keep[idx[hit]] = True
+    if not keep.any():
+        return pd.DataFrame()
+    dates, tick, feat = dates[keep], tick[keep], feat[keep]
+    df = pd.DataFrame(feat, columns=FEAT_COLS,
+                      index=pd.MultiIndex.from_arrays([dates, tick], names=["date", "ticker"]))
+
+    # 펀더멘털: 역사적 주가 + PIT 값 → 전 (날짜, 종목) 일괄 계산
+    if panel is not None:
+        hist_price = panel_asof(panel, "Close", dates, tick)
+    else:
+        hist_price = np.full(len(tick), np.nan)
+    pv = pit_values_asof(pit_table, tick, dates)
+    uniq, inv = np.unique(tick.astype(str), return_inverse=True)
+    shares = _fund_column([fund_map.get(t, {}) for t in uniq], "shares", falsy=np.nan)[inv]
+    metrics = _compute_pit_metrics(pv, hist_price, shares)
+    metrics.loc[~pv["has_pit"].to_numpy()] = np.nan
+    funds = [] if backtest_mode else [fund_map.get(t, {}) for t in tick]
+    df[FUND_KEYS] = _fund_features(funds, metrics, backtest_mode=backtest_mode).to_numpy()
+
+    if enrich:
+        df = _enrich_snapshots(df, spy_close=spy_close, vix_close=vix_close,
+                               sector_map=sector_map)
+    return df
+
+
+# ═══════════════════════════════════════════════════════════
+# SNAPSHOT ENRICHMENT (Ver3.9)
+# ═══════════════════════════════════════════════════════════
+
+# (원본 피처, 백분위 피처)
+_CS_PAIRS = [
+    ("Mom_3m",        "Mom_3m_Pct"),
+    ("RS_Market_3m",  "RS_Market_3m_Pct"),
+    ("P_E",           "P_E_Pct"),
+    ("ROE",           "ROE_Pct"),
+    ("Volatility_30d","Volatility_30d_Pct"),
+]
+
+
+def _asof_last(s: pd.Series, dates: pd.DatetimeIndex) -> tuple:
+    """시리즈에서 각 날짜 이하 관측치 개수와 값 배열 반환."""
+    return s.index.searchsorted(dates, side="right"), s.to_numpy(dtype=np.float64)
+
+
+def _enrich_snapshots(
+    df: pd.DataFrame,
+    spy_close: pd.Series = None,
+    vix_close: pd.Series = None,
+    sector_map: dict = None,
+) -> pd.DataFrame:
+    """(date, ticker) long 스냅샷에 날짜별 CS 백분위 + Regime + Sector RS 추가."""
+    dates = df.index.get_level_values("date")
+    by_date = df.groupby(level="date", sort=False)
+
+    # ── Cross-Sectional 백분위 (해당 시점 전체 종목 대비 순위%) ──
+    for src, dst in _CS_PAIRS:
+        df[dst] = by_date[src].rank(pct=True) if src in df.columns else np.nan
+
+    # ── Regime Feature (시장 전체 — 날짜별 동일 값) ──────────
+    # Market_Regime: SPY / SPY_SMA200 - 1 (SMA가 0 이하·NaN이면 0)
+    u_dates = dates.unique()
+    regime = np.full(len(u_dates), np.nan)
+    if spy_close is not None:
+        n, px = _asof_last(spy_close, u_dates)
+        sma = spy_close.rolling(200).mean().to_numpy(dtype=np.float64)
+        ok = n >= 200
+        last = n[ok] - 1
+        with np.errstate(invalid="ignore"):
+            regime[ok] = np.where(sma[last] > 0, px[last] / sma[last] - 1, 0.0)
+    # VIX_Level
+    vix = np.full(len(u_dates), np.nan)
+    if vix_close is not None:
+        n, px = _asof_last(vix_close, u_dates)
+        vix[n > 0] = px[n[n > 0] - 1]
+    at = u_dates.get_indexer(dates)
+    df["Market_Regime"] = regime[at]
+    df["VIX_Level"]     = vix[at]
+
+    # ── Sector Relative Strength (종목 수익률 - 같은 날짜 섹터 평균) ──
+    if sector_map:
+        sectors = df.index.get_level_values("ticker").map(lambda t: sector_map.get(t, "Unknown"))
+        for ret_col, dst_col in [("Mom_1m", "RS_Sector_1m"), ("Mom_3m", "RS_Sector_3m")]:
+            if ret_col in df.columns:
+                sector_avg = df[ret_col].groupby([dates, sectors]).transform("mean")
+                df[dst_col] = df[ret_col] - sector_avg
+            else:
+                df[dst_col] = np.nan
+    else:
+        df["RS_Sector_1m"] = np.nan
+        df["RS_Sector_3m"] = np.nan
+    return df
+
+
+def enrich_snapshot(
+    snap: pd.DataFrame,
+    date: pd.Timestamp,
+    spy_close: pd.Series = None,
+    vix_close: pd.Series = None,
+    sector_map: dict = None,
+) -> pd.DataFrame:
+    """스냅샷에 Cross-Sectional 백분위 + Regime + Sector RS 추가.
+    snap: build_snapshot_df 결과 (index=ticker, columns=features)
+    spy_close: SPY 종가 시리즈
+    vix_close: VIX 종가 시리즈
+    sector_map: {ticker: sector_name}
+    """
+    if snap.empty:
+        return snap
+    long = pd.concat({pd.Timestamp(date): snap}, names=["date"])
+    return _enrich_snapshots(long, spy_close=spy_close, vix_close=vix_close,
+                             sector_map=sector_map).droplevel("date")
+
+
+# ═══════════════════════════════════════════════════════════
+# FORWARD RETURN
+# ═══════════════════════════════════════════════════════════
+
+def forward_return(tech_df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> float:
+    """start → end 기간의 실제 수익률."""
+    try:
+        close = tech_df["Close"] if "Close" in tech_df.columns else None
+        # tech_df here is original OHLCV, not indicator df
+    except Exception:
+        return np.nan
+    return np.nan  # placeholder — actual call uses price_data dict
+
+
+def _fwd_matrices(panel: dict, dates: pd.DatetimeIndex, use_next_open: bool) -> tuple:
+    """리밸런싱 구간 × 종목 수익률 (원시, 상폐 보정) — 한 가지 체결 가정.
+    원시: 구간 시작·끝 체결가가 모두 있어야 계산 (없으면 NaN)
+    상폐 보정: 원시가 NaN이면 진입가 대비 보유 기간 내 마지막 종가, 데이터 전무 시 -100%
+    """
+    n = len(panel["dates"])
+    m = len(panel["tickers"])
+    side = "right" if use_next_open else "left"
+    # 체결 행: 종가 기준은 date 이상, T+1 시가 기준은 date 초과 첫 거래 행
+    entry = panel["next_valid"][panel["dates"].searchsorted(dates, side=side)]
+    rs, re = entry[:-1], entry[1:]
+    px = panel["Open"] if use_next_open else panel["Close"]
+    cols = np.arange(m)
+
+    ok = (rs < n) & (re < n)
+    p_in = px[np.minimum(rs, n - 1), cols].astype(np.float64)
+    p_out = px[np.minimum(re, n - 1), cols].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        raw = np.where(ok, p_out / p_in - 1, np.nan)
+
+    # 상폐/거래중단: 보유 기간(start 이상 ~ end 이하) 내 마지막 가용 종가
+    r_end = panel["dates"].searchsorted(dates[1:], side="right") - 1
+    r_beg = panel["dates"].searchsorted(dates[:-1], side="left")
+    last = np.where((r_end >= 0)[:, None],
+                    panel["last_valid"][np.maximum(r_end, 0)], -1)
+    dead = (rs >= n) | (p_in <= 0) | (last < r_beg[:, None])
+    last_px = panel["Close"][np.maximum(last, 0), cols].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delisted = np.where(dead, -1.0, last_px / p_in - 1)
+    filled = np.where(np.isnan(raw), delisted, raw)
+    return raw, filled
+
+
+def build_fwd_returns(panel: dict, rebal_dates: list) -> dict:
+    """리밸런싱 구간 × 종목 forward return 행렬 (백테스트 전 1회 계산).
+    행 i: rebal_dates[i] → rebal_dates[i+1], 열: panel["tickers"]
+    "raw"/"filled"[use_next_open]: 원시 수익률 / 상폐 보정 수익률
+    (종가 기준 False, T+1 시가 기준 True)
+    """
+    dates = pd.DatetimeIndex(rebal_dates)
+    fwd = {"dates": dates, "col": panel["col"], "raw": {}, "filled": {}}
+    for use_next_open in (False, True):
+        raw, filled = _fwd_matrices(panel, dates, use_next_open)
+        fwd["raw"][use_next_open] = raw
+        fwd["filled"][use_next_open] = filled
+    return fwd
+
+
+def fwd_returns_at(fwd: dict, i: int, tickers, use_next_open: bool = False,
+                   filled: bool = False) -> np.ndarray:
+    """i번째 구간의 종목별 forward return.
+    filled=True: 상폐 보정 수익률 (패널에 없는 종목 -100%), False: 원시 (없으면 NaN)
+    """
+    cols = np.array([fwd["col"].get(t, -1) for t in tickers], dtype=np.int64)
+    src  = fwd["filled" if filled else "raw"][use_next_open][i]
+    return np.where(cols >= 0, src[np.maximum(cols, 0)], -1.0 if filled else np.nan)
+
+
+# ═══════════════════════════════════════════════════════════
+# BACKTEST ENGINE
+# ═══════════════════════════════════════════════════════════
+
+def add_months(dt: datetime, n: int) -> datetime:
+    month = dt.month - 1 + n
+    year  = dt.year + month // 12
+    month = month % 12 + 1
+    day   = min(dt.day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+
+def generate_rebalance_dates(start: datetime, end: datetime, months: int) -> list:
+    dates = []
+    cur = start
+    while cur <= end:
+        dates.append(pd.Timestamp(cur))
+        cur = add_months(cur, months)
+    return dates
+
+
+# ═══════════════════════════════════════════════════════════
+# WALK-FORWARD 학습 (윈도우 단위 병렬)
+# ═══════════════════════════════════════════════════════════
+
+# 결측 플래그 대상: 펀더멘털 그룹
+_FUND_GROUPS = {"밸류에이션", "수익성", "성장성", "재무안정성", "효율성", "규모"}
+EMBARGO_DAYS = 21   # 예측일과 21일 이내 겹치는 훈련 스냅샷 제외 (Ver4.2)
+
+
+def detect_cpu_budget() -> int:
+    """사용 가능 코어 수 = min(os.cpu_count(), CPU affinity, cgroup CPU 할당량).
+    cgroup v2 (cpu.max) → v1 (cfs_quota_us / cfs_period_us) 순으로 확인, 할당량은 내림."""
+    n = os.cpu_count() or 1
+    try:
+        n = min(n, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        pass
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            q, per = f.read().split()[:2]
+        if q != "max":
+            quota = int(q) / int(per)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                q = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                per = int(f.read())
+            if q > 0:
+                quota = q / per
+        except (OSError, ValueError):
+            pass
+    if quota:
+        n = min(n, max(int(quota), 1))
+    return max(n, 1)
+
+
+def plan_compute(budget: int, n_windows: int, n_models: int = 1) -> dict:
+    """코어 예산 분배: 윈도우 병렬 × 모델 병렬 × 트리 n_jobs ≤ budget (초과 할당 없음).
+    사용 코어 수 최대 → 윈도우 병렬 우선 → 모델 병렬 우선 순으로 선택."""
+    budget = max(int(budget), 1)
+    best_key, plan = None, None
+    for w in range(1, max(min(budget, n_windows), 1) + 1):
+        for m in range(1, max(n_models, 1) + 1):
+            t = budget // (w * m)
+            if t < 1:
+                continue
+            key = (w * m * t, w, m)
+            if best_key is None or key > best_key:
+                best_key = key
+                plan = {"window_workers": w, "model_workers": m, "tree_jobs": t}
+    return {**plan, "budget": budget}
+
+
+def _stage_clock() -> tuple:
+    """(경과 시간, 누적 CPU 시간) — CPU는 자식 프로세스(프로세스 풀) 포함."""
+    t = os.times()
+    return time.perf_counter(), t.user + t.system + t.children_user + t.children_system
+
+
+def _stage_done(stages: list, name: str, start: tuple, budget: int, plan: str = "") -> tuple:
+    """단계 실행 시간·CPU 사용률 기록 후 다음 단계 시작 시각 반환."""
+    now = _stage_clock()
+    wall, cpu = now[0] - start[0], now[1] - start[1]
+    stages.append({"단계": name, "실행시간(초)": wall, "CPU시간(초)": cpu,
+                   "코어 사용률": cpu / (wall * budget) if wall > 0 else np.nan,
+                   "병렬 구성": plan})
+    return now
+
+
+def _norm_imp(d: dict) -> dict:
+    """중요도 정규화 (합계 1)."""
+    s = sum(d.values())
+    return {k: v / s for k, v in d.items()} if s > 0 else d
+
+
+# RF 하이퍼파라미터 탐색 후보
+RF_PARAM_GRID = {"max_depth": [3, 5, 7], "min_samples_leaf": [5, 10, 20]}
+RF_TREES         = 100   # 최종 RF 트리 수
+SEARCH_FOLDS     = 2     # 검증 날짜 수 (최근 날짜부터, 날짜 1개 = fold 1개)
+SEARCH_FACTOR    = 3     # Successive Halving 감축 비율 (라운드마다 상위 1/3 생존)
+SEARCH_ANCHOR_EVERY = 3  # 튜닝 윈도우 3회 중 1회만 전체 그리드 탐색, 나머지는 직전 결과 주변만
+
+
+def _purged_date_folds(groups: np.ndarray, n_folds: int = SEARCH_FOLDS,
+                       min_rows: int = 20) -> list:
+    """날짜 그룹 시계열 CV: 최근 n_folds개 스냅샷 날짜를 하나씩 검증,
+    훈련은 검증일 이전 + 엠바고(EMBARGO_DAYS) 밖의 날짜만 (미래·겹침 구간 제외)."""
+    dates = np.unique(groups)
+    folds = []
+    for v in dates[-n_folds:]:
+        val = np.flatnonzero(groups == v)
+        tr  = np.flatnonzero(groups <= v - np.timedelta64(EMBARGO_DAYS, "D"))
+        if len(tr) >= min_rows and len(val) >= 5:
+            folds.append((tr, val))
+    return folds
+
+
+def _rf_candidates(prior: dict = None) -> list:
+    """탐색 후보: prior(직전 탐색 결과)가 있으면 최적값 ±1칸 이웃만, 없으면 전체 그리드."""
+    keys = list(RF_PARAM_GRID)
+    if prior is None:
+        return [dict(zip(keys, vals)) for vals in itertools.product(*RF_PARAM_GRID.values())]
+    axes = []
+    for k in keys:
+        grid = RF_PARAM_GRID[k]
+        j = grid.index(prior["best"][k])
+        axes.append(grid[max(j - 1, 0): j + 2])
+    return [dict(zip(keys, vals)) for vals in itertools.product(*axes)]
+
+
+def _search_rf_params(X: np.ndarray, y: np.ndarray, groups: np.ndarray, seed: int,
+                      prior: dict = None, n_jobs: int = 1) -> tuple:
+    """RF 하이퍼파라미터 탐색 (GridSearchCV(cv=3) 대체).
+    Purged 날짜 그룹 CV 위에서 Successive Halving: 트리 수를 자원으로 적은 트리로 전체 후보를
+    평가 → 상위 1/SEARCH_FACTOR만 트리를 늘려 재평가 → 후보 1개가 남을 때까지.
+    반환: (최적 파라미터, {"best", "tree_fits"}) — tree_fits: 학습한 트리 총수 (비용 지표)
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    cands = _rf_candidates(prior)
+    folds = _purged_date_folds(groups)
+    if not folds or len(cands) == 1:
+        best = cands[0] if len(cands) == 1 else (prior or {}).get(
+            "best", {k: v[len(v) // 2] for k, v in RF_PARAM_GRID.items()})
+        return best, {"best": best, "tree_fits": 0}
+
+    n_rounds = int(np.ceil(np.log(len(cands)) / np.log(SEARCH_FACTOR)))
+    trees = max(int(np.ceil(RF_TREES / SEARCH_FACTOR ** n_rounds)), 2)
+    tree_fits = 0
+    while True:
+        scores = np.zeros(len(cands))
+        for c, params in enumerate(cands):
+            for tr, val in folds:
+                rf = RandomForestRegressor(n_estimators=trees, random_state=seed,
+                                           n_jobs=n_jobs, **params)
+                rf.fit(X[tr], y[tr])
+                scores[c] += np.mean((rf.predict(X[val]) - y[val]) ** 2) / len(folds)
+                tree_fits += trees
+        order = np.argsort(scores, kind="stable")
+        keep  = max(int(np.ceil(len(cands) / SEARCH_FACTOR)), 1)
+        cands = [cands[k] for k in order[:keep]]
+        if len(cands) == 1 or trees >= RF_TREES:
+            break
+        trees = min(trees * SEARCH_FACTOR, RF_TREES)
+    best = cands[0]
+    return best, {"best": best, "tree_fits": tree_fits}
+
+
+def _fit_window(task: dict) -> dict:
+    """윈도우 1개 학습: 결측 플래그 → 대체 → 윈저화 → RF(+XGB/LGBM) 학습.
+    task["rf_params"]가 있으면 탐색 생략하고 해당 파라미터로 RF만 학습.
+    탐색 시 task["groups"](행별 스냅샷 날짜)로 Purged CV, task["search_prior"]로 후보 축소.
+    task["X_train"]: float32 배열 (열 = task["cols"]), task["y_train"]: float64 배열
+    반환: 모델·imputer·전처리 정보·중요도·학습 시간(fit_sec)
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.impute import SimpleImputer
+    t0 = time.perf_counter()
+    X_train      = task["X_train"]
+    y_train      = task["y_train"]
+    use_ensemble = task["use_ensemble"]
+    seed         = task["seed"]
+    avail_cols   = list(task["cols"])
+    n_feat       = len(avail_cols)
+
+    # ── 결측 플래그 (펀더멘털 피처) — 배열 1회 연산 ──
+    miss_src = [c for c in avail_cols
+                if FEATURE_META.get(c, {}).get("group", "") in _FUND_GROUPS]
+    miss_idx = [avail_cols.index(c) for c in miss_src]
+    all_train_cols = avail_cols + [f"{mc}_miss" for mc in miss_src]
+    nan_mask = np.isnan(X_train)
+
+    # ── Ver4.2: 결측 대체 먼저 → 윈저화 (순서 수정) ──
+    # 중앙값 대체: 열별 nanmedian 1회 (all-NaN 열은 0 → SimpleImputer keep_empty_features와 동일)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        med = np.nanmedian(X_train, axis=0)
+    X_imp = np.empty((len(X_train), len(all_train_cols)), dtype=np.float32)
+    X_imp[:, :n_feat] = X_train
+    np.copyto(X_imp[:, :n_feat], np.where(np.isnan(med), 0.0, med).astype(np.float32),
+              where=nan_mask)
+    X_imp[:, n_feat:] = nan_mask[:, miss_idx]
+    # 실시간 추천·예측 단계 호환용 imputer (학습된 중앙값만 보유)
+    imputer_step = SimpleImputer(strategy="median", keep_empty_features=True)
+    imputer_step.fit(pd.DataFrame(
+        np.concatenate([med, np.zeros(len(miss_src))])[None, :], columns=all_train_cols))
+
+    # 윈저화: 1%/99% 분위수를 배열 1회 호출로 → 열별 clip
+    q_lo, q_hi = np.quantile(X_imp[:, :n_feat], [0.01, 0.99], axis=0)
+    clip_ok = q_lo < q_hi
+    win_bounds = {avail_cols[k]: (float(q_lo[k]), float(q_hi[k])) for k in np.flatnonzero(clip_ok)}
+    np.clip(X_imp[:, :n_feat],
+            np.where(clip_ok, q_lo, -np.inf).astype(np.float32),
+            np.where(clip_ok, q_hi, np.inf).astype(np.float32),
+            out=X_imp[:, :n_feat])
+
+    prep_sec = time.perf_counter() - t0
+
+    # ── 모델 학습 작업: RF(탐색+학습) · XGB · LGBM — model_workers개 스레드로 동시 실행 ──
+    # 각 모델 n_jobs = tree_jobs (윈도우 병렬 × 모델 병렬 × tree_jobs ≤ 코어 예산)
+    n_jobs = int(task.get("tree_jobs", 1))
+
+    def _rf_job():
+        # Ver4.2: RF 하이퍼파라미터 자동 튜닝 (재튜닝 주기 외에는 직전 파라미터 사용)
+        params, found = task.get("rf_params"), None
+        if params is None:
+            params, found = _search_rf_params(
+                X_imp, y_train, task["groups"], seed,
+                prior=task.get("search_prior"), n_jobs=n_jobs,
+            )
+        rf = RandomForestRegressor(
+            n_estimators=RF_TREES, random_state=seed, n_jobs=n_jobs, **params,
+        )
+        rf.fit(X_imp, y_train)
+        return rf, params, found
+
+    # XGBoost + LightGBM (앙상블 모드 시)
+    # 웜스타트: 직전 윈도우 부스터에서 warm["rounds"]만큼 추가 부스팅 (피처 구성이 같을 때만)
+    jobs = {"rf": _rf_job}
+    warm = task.get("warm")
+    warm_ok = use_ensemble and warm is not None and warm["cols"] == all_train_cols
+    if use_ensemble:
+        rounds = warm["rounds"] if warm_ok else 100
+        jobs["xgb"]  = lambda: _fit_xgb(X_imp, y_train, seed, rounds,
+                                        warm["xgb"] if warm_ok else None, n_jobs)
+        jobs["lgbm"] = lambda: _fit_lgbm(X_imp, y_train, seed, rounds,
+                                         warm["lgbm"] if warm_ok else None, n_jobs)
+        # 기준선 비교: 같은 윈도우를 처음부터 학습한 부스터 (IC 비교 전용, 예측 선정엔 미사용)
+        if warm_ok and task.get("warm_compare"):
+            jobs["xgb_full"]  = lambda: _fit_xgb(X_imp, y_train, seed, 100, None, n_jobs)
+            jobs["lgbm_full"] = lambda: _fit_lgbm(X_imp, y_train, seed, 100, None, n_jobs)
+
+    def _timed(fn):
+        t = time.perf_counter()
+        return fn(), time.perf_counter() - t
+
+    model_workers = min(int(task.get("model_workers", 1)), len(jobs))
+    if model_workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=model_workers) as ex:
+            futs = {k: ex.submit(_timed, fn) for k, fn in jobs.items()}
+            done = {k: f.result() for k, f in futs.items()}
+    else:
+        done = {k: _timed(fn) for k, fn in jobs.items()}
+
+    (model_rf, rf_params, search), rf_sec = done["rf"]
+    model_xgb  = done["xgb"][0]  if use_ensemble else None
+    model_lgbm = done["lgbm"][0] if use_ensemble else None
+    extra = {}
+    if use_ensemble:
+        extra = {"warm_started": warm_ok,
+                 "boost_sec": done["xgb"][1] + done["lgbm"][1]}
+        if "xgb_full" in done:
+            extra.update(model_xgb_full=done["xgb_full"][0], model_lgbm_full=done["lgbm_full"][0],
+                         boost_full_sec=done["xgb_full"][1] + done["lgbm_full"][1])
+
+    # 중요도: 모델별 개별 저장 (raw) + 앙상블 평균 (정규화 후)
+    # LightGBM은 split 기반으로 RF/XGBoost 대비 스케일이 수백배 다름
+    # → 각 모델을 합계 1로 정규화한 뒤 평균해야 공정한 앙상블 중요도
+    imp_rf_raw = {}
+    imp_xgb_raw = {}
+    imp_lgbm_raw = {}
+    for idx_c, col_name in enumerate(all_train_cols):
+        if col_name in avail_cols:
+            imp_rf_raw[col_name] = model_rf.feature_importances_[idx_c]
+            if use_ensemble:
+                imp_xgb_raw[col_name]  = model_xgb.feature_importances_[idx_c]
+                imp_lgbm_raw[col_name] = model_lgbm.feature_importances_[idx_c]
+
+    imp_rf_n = _norm_imp(imp_rf_raw)
+    imp_dict = dict(imp_rf_n)  # RF 단독일 때 기본값
+
+    if use_ensemble:
+        imp_xgb_n  = _norm_imp(imp_xgb_raw)
+        imp_lgbm_n = _norm_imp(imp_lgbm_raw)
+        imp_dict = {k: (imp_rf_n.get(k, 0) + imp_xgb_n.get(k, 0) + imp_lgbm_n.get(k, 0)) / 3
+                    for k in imp_rf_n}
+
+    return {
+        "imp":        imp_dict,
+        "imp_rf":     imp_rf_raw,
+        "imp_xgb":    imp_xgb_raw,
+        "imp_lgbm":   imp_lgbm_raw,
+        "model_rf":   model_rf,
+        "model_xgb":  model_xgb,
+        "model_lgbm": model_lgbm,
+        "imputer":    imputer_step,
+        "win_bounds": win_bounds,
+        "miss_src":   miss_src,
+        "all_cols":   all_train_cols,
+        "avail_cols": avail_cols,
+        "rf_params":  rf_params,
+        "tuned":      task.get("rf_params") is None,
+        "search":     search,
+        **extra,
+        # 모델 학습 시간 = 전처리 + 모델별 학습 시간 합 (기준선 비교 학습 제외)
+        "fit_sec":    prep_sec + rf_sec + extra.get("boost_sec", 0.0),
+    }
+
+
+def _fit_xgb(X: np.ndarray, y, seed: int, n_rounds: int = 100,
+             init=None, n_jobs: int = 1):
+    """XGBoost 학습. init이 주어지면 해당 부스터에서 n_rounds 추가 부스팅."""
+    from xgboost import XGBRegressor
+    model = XGBRegressor(
+        n_estimators=n_rounds, max_depth=4, learning_rate=0.1,
+        subsample=0.8, colsample_bytree=0.8,
+        random_state=seed, n_jobs=n_jobs, verbosity=0,
+    )
+    return model.fit(X, y, xgb_model=init)
+
+
+def _fit_lgbm(X: np.ndarray, y, seed: int, n_rounds: int = 100,
+              init=None, n_jobs: int = 1):
+    """LightGBM 학습. init이 주어지면 해당 부스터에서 n_rounds 추가 부스팅."""
+    from lightgbm import LGBMRegressor
+    model = LGBMRegressor(
+        n_estimators=n_rounds, max_depth=4, learning_rate=0.1,
+        subsample=0.8, colsample_bytree=0.8,
+        random_state=seed, n_jobs=n_jobs, verbose=-1,
+    )
+    return model.fit(X, y, init_model=init)
+
+
+_FIT_MODEL_KEYS = ("model_rf", "model_xgb", "model_lgbm", "imputer")
+_FIT_BASELINE_KEYS = ("model_xgb_full", "model_lgbm_full")   # 웜스타트 비교용 (반환 안 함)
+_FIT_KEYS = ("imp", "imp_rf", "imp_xgb", "imp_lgbm", "win_bounds", "miss_src",
+             "all_cols", "avail_cols", "rf_params", "tuned", "search", "fit_sec") + _FIT_MODEL_KEYS
+
+
+# ── 모델 저장소 (윈도우 지문별 pickle, 용량 초과 시 LRU 삭제) ─────────
+# 같은 학습 윈도우(스냅샷 날짜·피처·학습 데이터·하이퍼파라미터 동일)는 재학습 없이 로드.
+# 파일 수정 시각 = 마지막 사용 시각 (로드 시 갱신) → 오래된 파일부터 삭제
+MODEL_STORE_DIR = os.environ.get(
+    "AQL_MODEL_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_store"),
+)
+MODEL_STORE_MAX_MB  = float(os.environ.get("AQL_MODEL_STORE_MB", 2048))
+MODEL_STORE_VERSION = 1
+
+
+def _model_lib_versions() -> tuple:
+    import sklearn, xgboost, lightgbm
+    return sklearn.__version__, xgboost.__version__, lightgbm.__version__
+
+
+def window_fingerprint(task: dict) -> str:
+    """학습 윈도우 지문: 스냅샷 날짜 + 피처 컬럼 + 학습 데이터 해시 + 하이퍼파라미터.
+    RF 파라미터가 주어지지 않으면 탐색 설정(그리드·prior)을, 웜스타트면 직전 윈도우 지문을 포함."""
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(task["X_train"]).tobytes())
+    h.update(np.ascontiguousarray(task["y_train"]).tobytes())
+    warm = task.get("warm")
+    key = {
+        "version":  MODEL_STORE_VERSION,
+        "libs":     _model_lib_versions(),
+        "dates":    [str(d) for d in np.unique(task["groups"])],
+        "cols":     list(task["cols"]),
+        "data":     h.hexdigest(),
+        "ensemble": bool(task["use_ensemble"]),
+        "seed":     int(task["seed"]),
+        "rf_trees": RF_TREES,
+        "rf_params": task.get("rf_params"),
+        "search":   None if task.get("rf_params") is not None else {
+            "grid": RF_PARAM_GRID, "folds": SEARCH_FOLDS, "factor": SEARCH_FACTOR,
+            "prior": (task.get("search_prior") or {}).get("best")},
+        "warm":     None if warm is None else {
+            "from": warm.get("fingerprint"), "rounds": warm["rounds"],
+            "compare": bool(task.get("warm_compare"))},
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _model_file(fingerprint: str, store_dir: str) -> str:
+    return os.path.join(store_dir, f"{fingerprint}.pkl")
+
+
+def _load_pickle(path: str):
+    """pickle 로드 + 마지막 사용 시각 갱신 (LRU). 없거나 손상 시 None."""
+    try:
+        with open(path, "rb") as f:
+            obj = pickle.load(f)
+        os.utime(path)
+        return obj
+    except Exception:
+        return None
+
+
+def _save_pickle(path: str, obj) -> None:
+    """pickle 저장 (원자적 교체 — 병렬 워커가 동시에 써도 안전)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_window_models(fingerprint: str, store_dir: str = None) -> dict | None:
+    """저장된 윈도우 학습 결과 (모델·imputer·win_bounds 등, 없거나 손상 시 None)."""
+    return _load_pickle(_model_file(fingerprint, store_dir or MODEL_STORE_DIR))
+
+
+def save_window_models(fingerprint: str, fit: dict, store_dir: str = None):
+    """윈도우 학습 결과 저장."""
+    _save_pickle(_model_file(fingerprint, store_dir or MODEL_STORE_DIR), fit)
+
+
+def prune_model_store(store_dir: str = None, max_mb: float = None) -> int:
+    """모델 저장소 용량 상한 적용 → 삭제 파일 수."""
+    return _prune_lru_dir(store_dir or MODEL_STORE_DIR,
+                          MODEL_STORE_MAX_MB if max_mb is None else max_mb)
+
+
+def _prune_lru_dir(path: str, max_mb: float, match=None) -> int:
+    """용량 상한 초과 시 마지막 사용이 가장 오래된 .pkl 파일부터 삭제 → 삭제 파일 수.
+    match(파일명): 정리 대상 파일만 True (None이면 모든 .pkl)."""
+    limit = max_mb * 1024 ** 2
+    try:
+        files = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                 for e in os.scandir(path)
+                 if e.name.endswith(".pkl") and (match is None or match(e.name))]
+    except OSError:
+        return 0
+    total, removed = sum(f[1] for f in files), 0
+    for _, size, fpath in sorted(files):
+        if total <= limit:
+            break
+        try:
+            os.remove(fpath)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    return removed
+
+
+def replay_window(row: dict, use_ensemble: bool, store_dir: str = None) -> dict | None:
+    """과거 윈도우 예측 재현: results["preds"]["rows"]의 행 → 저장된 모델로 같은 스냅샷 재예측.
+    반환: _train_window 결과 (pred·pred_rf/xgb/lgbm·ranks·IC, 모델 포함), 저장소에 없으면 None."""
+    fit = load_window_models(row.get("fingerprint") or "", store_dir)
+    if fit is None:
+        return None
+    return _train_window({"fit": fit, "cur_snap": row["snap"],
+                          "use_ensemble": use_ensemble, "keep_models": True})
+
+
+def _train_window(task: dict) -> dict:
+    """윈도우 1개 학습 + 예측 (프로세스/스레드 워커에서 독립 실행).
+    task: {"X_train", "y_train", "cur_snap", "use_ensemble", "seed", "keep_models",
+           "rf_params"(선택), "fit"(선택: 재사용할 직전 학습 결과 → 학습 생략),
+           "model_store"(선택: 모델 저장소 경로 → 같은 지문의 윈도우는 로드)}
+    반환: 중요도·예측 점수·IC·전처리 정보 (keep_models면 모델·imputer 포함)
+    """
+    from scipy.stats import spearmanr
+    cur_snap     = task["cur_snap"]
+    use_ensemble = task["use_ensemble"]
+    reused = task.get("fit") is not None
+    stored = False
+    fingerprint = task.get("fingerprint")   # 재사용 윈도우: 원본 학습 윈도우의 지문
+    if reused:
+        fit = task["fit"]
+    elif task.get("model_store"):
+        fingerprint = window_fingerprint(task)
+        fit = load_window_models(fingerprint, task["model_store"])
+        stored = fit is not None
+        if not stored:
+            fit = _fit_window(task)
+            save_window_models(fingerprint, fit, task["model_store"])
+    else:
+        fit = _fit_window(task)
+
+    trained = not (reused or stored)
+    out = {k: v for k, v in fit.items()
+           if k not in _FIT_MODEL_KEYS and k not in _FIT_BASELINE_KEYS}
+    out.update(pred=None, reused=reused, stored=stored, fingerprint=fingerprint,
+               fit_sec=fit["fit_sec"] if trained else 0.0,
+               tuned=fit["tuned"] and trained)
+    if task["keep_models"]:
+        out.update({k: fit[k] for k in _FIT_MODEL_KEYS})
+
+    # ── 예측 ─────────────────────────────────────────
+    if cur_snap is None or cur_snap.empty:
+        return out
+
+    model_rf, model_xgb, model_lgbm = fit["model_rf"], fit["model_xgb"], fit["model_lgbm"]
+    imputer_step = fit["imputer"]
+    win_bounds, miss_src = fit["win_bounds"], fit["miss_src"]
+    avail_cols, all_train_cols = fit["avail_cols"], fit["all_cols"]
+
+    X_pred = cur_snap[[c for c in avail_cols if c in cur_snap.columns]].reindex(columns=avail_cols)
+
+    # 결측 플래그 추가
+    for mc in miss_src:
+        X_pred[f"{mc}_miss"] = X_pred[mc].isna().astype(int) if mc in X_pred.columns else 0
+    X_pred = X_pred.reindex(columns=all_train_cols)
+
+    # Ver4.2: 결측 대체 먼저 → 윈저화 (학습과 동일 순서)
+    X_pred_imp_df = pd.DataFrame(
+        imputer_step.transform(X_pred),
+        columns=all_train_cols, index=cur_snap.index,
+    )
+    for col in avail_cols:
+        if col in win_bounds and col in X_pred_imp_df.columns:
+            lo, hi = win_bounds[col]
+            X_pred_imp_df[col] = X_pred_imp_df[col].clip(lo, hi)
+    X_pred_imp = X_pred_imp_df.values
+
+    # 앙상블 예측: Rank Average (각 모델 예측 → 순위 변환 → 순위 평균)
+    pred_rf_s = pd.Series(model_rf.predict(X_pred_imp), index=cur_snap.index)
+    pred_xgb_s = pred_lgbm_s = ranks = None
+    if use_ensemble:
+        pred_xgb_s  = pd.Series(model_xgb.predict(X_pred_imp),  index=cur_snap.index)
+        pred_lgbm_s = pd.Series(model_lgbm.predict(X_pred_imp), index=cur_snap.index)
+        # rank: ascending=False → 예측 수익률 높을수록 1등 (낮은 rank = 좋은 종목)
+        rank_rf   = pred_rf_s.rank(ascending=False)
+        rank_xgb  = pred_xgb_s.rank(ascending=False)
+        rank_lgbm = pred_lgbm_s.rank(ascending=False)
+        avg_rank  = (rank_rf + rank_xgb + rank_lgbm) / 3
+        # rank average → 낮을수록 좋으므로 nsmallest로 선정하기 위해 부호 반전
+        pred_series = -avg_rank  # 높을수록 좋은 종목
+        ranks = {"평균순위": avg_rank, "RF순위": rank_rf,
+                 "XGB순위": rank_xgb, "LGBM순위": rank_lgbm}
+    else:
+        pred_series = pred_rf_s
+
+    # ── IC 계산 (앙상블: raw 예측 평균 기준 + 모델별) ──
+    actual = cur_snap["_fwd_return"].dropna()
+    common = pred_rf_s.index.intersection(actual.index)
+    ic_val = np.nan
+    ic_rec = None
+    if len(common) >= 10:
+        ic_rec = {}
+        ic_rf, _ = spearmanr(pred_rf_s[common], actual[common])
+        ic_rec["IC_RF"] = ic_rf
+        if use_ensemble:
+            ic_xgb, _ = spearmanr(pred_xgb_s[common], actual[common])
+            ic_lgbm, _ = spearmanr(pred_lgbm_s[common], actual[common])
+            ic_rec["IC_XGB"]  = ic_xgb
+            ic_rec["IC_LGBM"] = ic_lgbm
+            # 앙상블 IC: 3모델 raw 예측 평균 기준
+            raw_avg = (pred_rf_s[common] + pred_xgb_s[common] + pred_lgbm_s[common]) / 3
+            ic_val, _ = spearmanr(raw_avg, actual[common])
+        else:
+            ic_val = ic_rf
+        ic_rec["IC"] = ic_val
+
+        # 웜스타트 기준선 (전체 재학습 부스터) IC
+        if not reused and "model_xgb_full" in fit:
+            p_xgb_f  = pd.Series(fit["model_xgb_full"].predict(X_pred_imp),  index=cur_snap.index)
+            p_lgbm_f = pd.Series(fit["model_lgbm_full"].predict(X_pred_imp), index=cur_snap.index)
+            ic_rec["IC_XGB_full"],  _ = spearmanr(p_xgb_f[common],  actual[common])
+            ic_rec["IC_LGBM_full"], _ = spearmanr(p_lgbm_f[common], actual[common])
+            raw_avg_f = (pred_rf_s[common] + p_xgb_f[common] + p_lgbm_f[common]) / 3
+            ic_rec["IC_full"], _ = spearmanr(raw_avg_f, actual[common])
+
+    out.update(
+        pred=pred_series, pred_rf=pred_rf_s, pred_xgb=pred_xgb_s, pred_lgbm=pred_lgbm_s,
+        ranks=ranks, ic=ic_val, ic_rec=ic_rec,
+    )
+    return out
+
+
+def _ring_init(n_slots: int, cap: int, n_feat: int) -> dict:
+    """학습 행렬 링 버퍼: 날짜 블록 n_slots개를 float32 배열 1개에 고정 위치로 보관.
+    slot k → 행 [k*cap, k*cap + n[k]), 윈도우 이동 시 가장 오래된 slot만 덮어씀."""
+    return {
+        "X":    np.empty((n_slots * cap, n_feat), dtype=np.float32),
+        "y":    np.empty(n_slots * cap, dtype=np.float64),
+        "n":    np.zeros(n_slots, dtype=np.int64),
+        "date": [None] * n_slots,
+        "cap":  cap,
+    }
+
+
+def _ring_put(ring: dict, slot: int, snap: pd.DataFrame, cols: list, date) -> None:
+    """스냅샷 1개(forward return 있는 행)를 slot에 기록."""
+    ring["date"][slot] = date
+    ring["n"][slot] = 0
+    if snap is None or snap.empty or "_fwd_return" not in snap.columns:
+        return
+    y  = snap["_fwd_return"].to_numpy(np.float64)
+    ok = ~np.isnan(y)
+    n  = int(ok.sum())
+    r0 = slot * ring["cap"]
+    ring["X"][r0:r0 + n] = snap[cols].to_numpy(np.float32)[ok]
+    ring["y"][r0:r0 + n] = y[ok]
+    ring["n"][slot] = n
+
+
+def _ring_gather(ring: dict, slots: list) -> tuple:
+    """slot 순서대로 학습 행렬 구성 → (X float32, y, 행별 날짜)."""
+    cap, n = ring["cap"], ring["n"]
+    idx = np.concatenate([np.arange(k * cap, k * cap + n[k]) for k in slots])
+    groups = np.repeat(np.array([ring["date"][k].to_datetime64() for k in slots],
+                                dtype="datetime64[ns]"), n[slots])
+    return ring["X"][idx], ring["y"][idx], groups
+
+
+def walk_forward_schedule(n_windows: int, retrain_every: int = 1,
+                          retune_every: int = 1) -> list:
+    """윈도우별 학습 방식: "tune" (하이퍼파라미터 탐색 + 학습) / "fit" (직전 파라미터로 학습) /
+    "reuse" (직전 학습 모델로 예측만). 재학습은 retrain_every 기간마다,
+    재튜닝은 마지막 튜닝 후 retune_every 기간 이상 지난 첫 재학습 윈도우에서.
+    """
+    retrain_every = max(int(retrain_every), 1)
+    retune_every  = max(int(retune_every), 1)
+    sched, last_tune = [], None
+    for w in range(n_windows):
+        if w % retrain_every:
+            sched.append("reuse")
+        elif last_tune is None or w - last_tune >= retune_every:
+            sched.append("tune")
+            last_tune = w
+        else:
+            sched.append("fit")
+    return sched
+
+
+def _wf_executor(n_workers: int):
+    """워크포워드 실행기: 프로세스 풀 (워커 함수 pickle 가능 시) → 스레드 풀 대체.
+    `import quant_engine`으로 불러오면 프로세스 풀 사용, 파일 경로로 직접 실행하는 등
+    모듈을 import 경로로 찾을 수 없으면 프로세스 전달이 불가하므로
+    스레드로 실행 (sklearn/XGBoost/LightGBM 학습 대부분은 GIL 해제 구간).
+    fork 대신 forkserver(없으면 spawn) 사용 — 부모 프로세스가 이미 n_jobs > 1로
+    LightGBM/XGBoost를 학습했으면(웜스타트 체인·재사용 예측·실시간 탭) 초기화된
+    OpenMP 스레드 풀 상태가 fork로 복제되어 자식의 다중 스레드 학습이 교착됨."""
+    import multiprocessing
+    try:
+        pickle.dumps(_train_window)
+        method = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                  else "spawn")
+        ctx = multiprocessing.get_context(method)
+        if method == "forkserver":
+            ctx.set_forkserver_preload([_train_window.__module__])   # 워커 시작 시 import 생략
+        return concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx)
+    except Exception:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+
+
+def run_walk_forward(tasks: list, n_workers: int = 1, progress=None) -> list:
+    """윈도우별 _train_window를 병렬 실행, 결과는 tasks 순서(날짜순)로 반환.
+    n_workers <= 1 또는 작업 1개 이하: 순차 실행. 프로세스 풀이 중간에 깨지면 스레드로 재실행.
+    progress(k, n): 완료 윈도우 수 콜백 (메인 스레드에서 호출)
+    """
+    n = len(tasks)
+    results = [None] * n
+    if n_workers <= 1 or n <= 1:
+        for k, task in enumerate(tasks):
+            results[k] = _train_window(task)
+            if progress:
+                progress(k + 1, n)
+        return results
+
+    def _run(ex):
+        futs = {ex.submit(_train_window, tasks[k]): k for k in range(n) if results[k] is None}
+        done = n - len(futs)
+        for fut in concurrent.futures.as_completed(futs):
+            results[futs[fut]] = fut.result()
+            done += 1
+            if progress:
+                progress(done, n)
+
+    ex = _wf_executor(min(n_workers, n))
+    try:
+        with ex:
+            _run(ex)
+    except concurrent.futures.process.BrokenProcessPool:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(n_workers, n)) as tex:
+            _run(tex)
+    return results
+
+
+def _extend_state(prev: dict, params: dict, rebal_dates: list, fwd: dict, use_next_open: bool,
+                  retrain_every: int, retune_every: int, use_warm: bool,
+                  data_fp_at=None) -> dict | None:
+    """확장 모드 재사용 상태. 이전 결과의 wf_state가 같은 설정이고 리밸런싱 날짜가 접두사이며
+    이전 종료일까지의 입력 데이터 지문(data_fp_at(이전 종료일))이 같을 때만 — 수정주가 재조정·
+    PIT 갱신 등으로 과거 데이터가 바뀌었으면 None (전체 실행).
+    이전 스냅샷에 새 forward return을 다시 붙여 값이 바뀐 날짜(보통 이전 종료일 직전 구간)부터
+    윈도우를 재계산. 재계산 첫 윈도우가 참조할 직전 학습 모델이 없으면 None (전체 실행).
+    반환: {"rebal_dates", "snapshots", "outs": {i: 재사용 윈도우 결과}, "n_reused"}
+    """
+    state = (prev or {}).get("wf_state")
+    if not state or state["params"] != params:
+        return None
+    old = list(state["rebal_dates"])
+    if len(old) < 2 or len(old) > len(rebal_dates) or list(rebal_dates[:len(old)]) != old:
+        return None
+    if data_fp_at is None or state.get("data_fp") != data_fp_at(old[-1]):
+        return None
+
+    snapshots, first_dirty = {}, len(old) - 1
+    for i, date in enumerate(old[:-1]):
+        snap = state["snapshots"][date]
+        if "_fwd_return" in snap.columns:
+            f = fwd_returns_at(fwd, i, snap.index, use_next_open)
+            if not np.array_equal(f, snap["_fwd_return"].to_numpy(np.float64), equal_nan=True):
+                snap = snap.copy()
+                snap["_fwd_return"] = f
+                first_dirty = min(first_dirty, i)
+        snapshots[date] = snap
+
+    outs = {i: o for i, o in state["outs"].items() if i < first_dirty}
+    n_reused = len(outs)
+    # 재계산 첫 윈도우가 재사용 예측·웜스타트면 직전 학습 윈도우의 모델 필요
+    sched = walk_forward_schedule(n_reused + 1, retrain_every, retune_every)
+    trained = [i for w, i in enumerate(sorted(outs)) if sched[w] != "reuse"]
+    if trained and (use_warm or sched[n_reused] == "reuse") and \
+            "model_rf" not in outs[trained[-1]]:
+        return None
+    return {"rebal_dates": old, "snapshots": snapshots, "outs": outs, "n_reused": n_reused}
+
+
+# ── 체크포인트 (중단된 실행 이어서 계산) ─────────────────────
+# 디렉터리 구성: snapshots.pkl (스냅샷 단계 완료 시 1회) + w{i}.pkl (완료 윈도우별, N개마다 기록)
+# 모든 파일에 실행 지문 저장 → 설정·데이터가 같은 실행만 이어받음
+CHECKPOINT_EVERY = 3 if IS_CLOUD else 10   # 학습 윈도우 N개 완료마다 기록
+
+
+def data_fingerprint(panel: dict, pit_table: pd.DataFrame, fund_map: dict,
+                     spy_close: pd.Series, vix_close: pd.Series, sector_map: dict,
+                     members: dict = None, cutoff=None) -> str:
+    """스냅샷 입력 데이터 지문: 가격 패널·PIT 테이블·상장주식수·SPY/VIX·섹터·S&P 500 구성.
+    cutoff가 주어지면 그 날짜 이하 데이터만 (확장 모드: 이전 종료일까지 데이터 불변 확인).
+    종목은 이름순으로 정렬해 입력 순서와 무관. 펀더멘털은 백테스트 스냅샷이 쓰는 shares만.
+    members: {리밸런싱 날짜: 구성 종목} (생존자 편향 보정 시, cutoff 미만 날짜만 —
+             cutoff 날짜 스냅샷은 확장 시 다시 계산)
+    """
+    end = None if cutoff is None else pd.Timestamp(cutoff)
+
+    def _upto(x):
+        return x if x is None or end is None else x.loc[:end]
+
+    tickers = sorted(panel["col"])
+    cols = [panel["col"][t] for t in tickers]
+    n_rows = (len(panel["dates"]) if end is None else
+              int(panel["dates"].searchsorted(end, side="right")))
+    h = hashlib.sha1(np.asarray(panel["dates"][:n_rows].asi8).tobytes())
+    for f in PANEL_FIELDS:
+        h.update(np.ascontiguousarray(panel[f][:n_rows][:, cols]).tobytes())
+
+    pit_fp = ""
+    if pit_table is not None:
+        pit = pit_table if end is None else pit_table[pit_table["avail_date"] <= end]
+        pit_fp = frame_fingerprint(pit.sort_values(["ticker", "avail_date"], kind="stable",
+                                                   ignore_index=True))
+    return fingerprint("data", tickers, h.hexdigest(), pit_fp,
+               {t: (fund_map or {}).get(t, {}).get("shares") for t in tickers},
+               frame_fingerprint(_upto(spy_close)), frame_fingerprint(_upto(vix_close)),
+               {t: (sector_map or {}).get(t) for t in tickers},
+               None if members is None else
+               {str(d): sorted(m) for d, m in members.items()
+                if end is None or pd.Timestamp(d) < end})
+
+
+def run_fingerprint(params: dict, rebal_dates: list, data_fp: str) -> str:
+    """실행 지문: 엔진 설정 + 리밸런싱 날짜 + 입력 데이터 지문 (data_fingerprint, 전체 기간)."""
+    return fingerprint("run", params, [str(d) for d in rebal_dates], data_fp)
+
+
+def load_checkpoint(ckpt_dir: str, fingerprint: str) -> dict | None:
+    """지문이 일치하는 체크포인트 → {"snapshots", "outs": {i: 윈도우 결과}} (없으면 None)."""
+    snaps = _load_pickle(os.path.join(ckpt_dir, "snapshots.pkl"))
+    if not snaps or snaps["fp"] != fingerprint:
+        return None
+    outs = {}
+    for e in os.scandir(ckpt_dir):
+        if e.name.startswith("w") and e.name.endswith(".pkl"):
+            rec = _load_pickle(e.path)
+            if rec and rec["fp"] == fingerprint:
+                outs[rec["i"]] = rec["out"]
+    return {"snapshots": snaps["snapshots"], "outs": outs}
+
+
+def save_checkpoint(ckpt_dir: str, fingerprint: str, snapshots: dict = None,
+                    outs: dict = None) -> None:
+    """체크포인트 기록 (파일별 원자적 교체). snapshots 기록 시 이전 실행의 윈도우 파일 삭제."""
+    if snapshots is not None:
+        clear_checkpoint(ckpt_dir)
+        _save_pickle(os.path.join(ckpt_dir, "snapshots.pkl"),
+                     {"fp": fingerprint, "snapshots": snapshots})
+    for i, out in (outs or {}).items():
+        _save_pickle(os.path.join(ckpt_dir, f"w{i}.pkl"), {"fp": fingerprint, "i": i, "out": out})
+
+
+def clear_checkpoint(ckpt_dir: str) -> None:
+    """체크포인트 삭제 (실행 완료 시)."""
+    try:
+        entries = list(os.scandir(ckpt_dir))
+    except OSError:
+        return
+    for e in entries:
+        if e.name.endswith(".pkl"):
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+
+def run_backtest(
+    price_data:   dict,
+    fund_map:     dict,
+    tech_map:     dict,
+    rebal_dates:  list,
+    n_stocks:     int,
+    tc_pct:       float,
+    rolling_win:  int,
+    progress,
+    pit_map:      dict = None,
+    min_dollar_vol: float = 0,
+    use_next_open:  bool = False,
+    sp500_changes: pd.DataFrame = None,
+    current_sp500: list = None,
+    use_ensemble:   bool = True,
+    spy_close:      pd.Series = None,
+    vix_close:      pd.Series = None,
+    sector_map:     dict = None,
+    use_mom_filter:      bool = True,
+    use_turnover_buffer: bool = False,
+    turnover_buffer_pct: float = 0.05,
+    use_inv_vol_weight:  bool = False,
+    panel:               dict = None,
+    pit_table:           pd.DataFrame = None,
+    n_workers:           int = 1,
+    seed:                int = 42,
+    retrain_every:       int = 1,
+    retune_every:        int = 1,
+    warm_rounds:         int = 0,
+    warm_refit_every:    int = 6,
+    warm_compare:        bool = True,
+    cpu_budget:          int = None,
+    model_store:         str = None,
+    extend_from:         dict = None,
+    checkpoint:          str = None,
+    checkpoint_every:    int = CHECKPOINT_EVERY,
+) -> dict:
+    """메인 백테스트 엔진.
+    Ver3.9: enrich_snapshot으로 CS정규화 + Regime + Sector RS 추가.
+    panel: build_price_panel 결과 (없으면 price_data로 1회 구성)
+    pit_table: build_pit_tables 결과 (없으면 pit_map으로 1회 구성)
+    n_workers: 윈도우 학습 병렬 워커 수 (1 = 순차), seed: 모델 random_state
+    retrain_every: k기간마다 전체 재학습 (사이 기간은 직전 모델로 예측만)
+    retune_every: RF 하이퍼파라미터 재탐색 주기 (기간 수, 사이 재학습은 직전 파라미터 사용)
+    warm_rounds: > 0이면 XGB/LGBM을 직전 학습 윈도우 부스터에서 이어 학습 (추가 라운드 수),
+                 학습 윈도우 warm_refit_every회마다 처음부터 재학습. 학습 윈도우는 날짜순 순차 실행
+    warm_compare: 웜스타트 윈도우에서 전체 재학습 부스터도 학습해 IC 비교 (ic_df *_full 컬럼)
+    cpu_budget: 연산 코어 예산 — 단계마다 윈도우 병렬 × 모델 병렬(RF/XGB/LGBM 동시 학습) ×
+                트리 n_jobs로 분배 (None이면 n_workers 윈도우 병렬, 모델 순차·n_jobs=1)
+    model_store: 모델 저장소 경로 — 지문이 같은 윈도우는 재학습 없이 로드, 새 학습 결과 저장
+                 (None이면 사용 안 함). 예측 행의 "fingerprint"로 replay_window 재현 가능
+    extend_from: 이전 실행 결과 (종료일만 늘어난 같은 설정·종목) — 저장된 스냅샷·윈도우 결과를
+                 재사용하고 새 리밸런싱 날짜의 스냅샷·모델만 계산 (결과는 전체 재실행과 동일).
+                 설정이 다르거나 재사용 불가 시 전체 실행
+    checkpoint: 체크포인트 디렉터리 — 스냅샷 단계 후 + 학습 윈도우 checkpoint_every개마다 기록,
+                같은 실행 지문의 체크포인트가 있으면 완료된 단계·윈도우는 건너뛰고 이어서 실행.
+                정상 종료 시 삭제 (포트폴리오 시뮬레이션은 예측 점수로 매번 재계산)
+    """
+    n_dates = len(rebal_dates)
+    budget  = int(cpu_budget) if cpu_budget else max(int(n_workers), 1)
+    stages: list = []     # 단계별 실행 시간·CPU 사용률
+    clock   = _stage_clock()
+    feature_cols = FEAT_COLS
+    if panel is None:
+        panel = build_price_panel(price_data)
+    if pit_table is None and pit_map:
+        pit_table = build_pit_tables(pit_map)
+
+    # 구간 × 종목 forward return 행렬 (체결가 가정·상폐 보정 포함) — 이후 모든 수익률 조회
+    fwd = build_fwd_returns(panel, rebal_dates)
+
+    # ── 확장 모드: 이전 결과의 스냅샷·윈도우 재사용 → 새 리밸런싱 날짜만 계산 ──
+    use_warm  = use_ensemble and warm_rounds > 0
+    wf_params = {
+        "tickers":       sorted(price_data),
+        "rolling_win":   rolling_win,
+        "min_dollar_vol": min_dollar_vol,
+        "use_next_open": use_next_open,
+        "use_members":   sp500_changes is not None and current_sp500 is not None,
+        "use_ensemble":  use_ensemble,
+        "seed":          seed,
+        "schedule":      (retrain_every, retune_every),
+        "warm":          (warm_rounds, warm_refit_every, warm_compare) if use_warm else None,
+        "features":      list(feature_cols),
+    }
+    # 생존자 편향 보정: 편입 구간 테이블 → 리밸런싱 날짜 × 종목 구성 마스크
+    use_members = wf_params["use_members"]
+    members = None
+    if use_members:
+        membership  = build_sp500_membership(current_sp500, sp500_changes)
+        member_pool = [t for t in dict.fromkeys(membership["ticker"]) if t in price_data]
+        member_mask = sp500_membership_mask(membership, rebal_dates[:-1], member_pool)
+        members = {d: [t for t, ok in zip(member_pool, row) if ok]
+                   for d, row in zip(rebal_dates[:-1], member_mask)}
+
+    def _data_fp(cutoff=None):
+        return data_fingerprint(panel, pit_table, fund_map, spy_close, vix_close, sector_map,
+                                members=members, cutoff=cutoff)
+
+    # 체크포인트: 같은 실행 지문이면 스냅샷·완료 윈도우 이어받음 (확장 모드보다 우선)
+    run_fp = ckpt = None
+    if checkpoint:
+        run_fp = run_fingerprint(wf_params, rebal_dates, _data_fp())
+        ckpt = load_checkpoint(checkpoint, run_fp)
+    prev_state = None if ckpt else _extend_state(
+        extend_from, wf_params, rebal_dates, fwd, use_next_open,
+        retrain_every, retune_every, use_warm, data_fp_at=_data_fp)
+    n_reused  = prev_state["n_reused"] if prev_state else 0
+    done_outs = ckpt["outs"] if ckpt else (prev_state["outs"] if prev_state else {})
+    base_snaps = (ckpt or prev_state or {}).get("snapshots", {})
+    # 새로 계산할 첫 스냅샷 (체크포인트: 전부 완료)
+    new_from = (n_dates - 1 if ckpt else
+                len(prev_state["rebal_dates"]) - 1 if prev_state else 0)
+
+    # ── Step 1: 모든 리밸런싱 날짜의 스냅샷 + 실제 수익률 계산 ──
+    progress(0.05, "📊 지표 스냅샷 계산 중...")
+    snapshots: dict = {}  # date → pd.DataFrame (includes forward_return)
+
+    # 유동성: 리밸런싱 날짜 × 종목 20일 평균 거래대금 기준 통과 여부 (일괄 비교)
+    if min_dollar_vol > 0:
+        liquid_mask = panel_asof_rows(panel, "ADV", rebal_dates[:-1]) >= min_dollar_vol
+
+    universe: dict = {}   # date → 후보 종목
+    for i, date in enumerate(rebal_dates[:-1]):
+        if i < new_from:
+            continue
+        # ── 생존자 편향 보정: 해당 날짜의 역사적 유니버스 ──
+        if use_members:
+            tickers = list(members[date])
+        else:
+            tickers = list(price_data.keys())
+
+        # ── 유동성 필터: 20일 평균 거래대금 기준 ──────────
+        if min_dollar_vol > 0:
+            tickers = [t for t in tickers
+                       if t in panel["col"] and liquid_mask[i, panel["col"][t]]]
+        universe[date] = tickers
+        progress(0.05 + 0.15 * (i / max(n_dates - 2, 1)),
+                 f"유니버스 구성 중 ({i+1}/{n_dates-1})...")
+
+    # 전 날짜 스냅샷 일괄 계산 (Ver3.9: CS정규화 + Regime + Sector RS 포함)
+    progress(0.20, "📊 전 기간 스냅샷 일괄 계산 중...")
+    batch = build_snapshots(universe, tech_map, fund_map,
+                            pit_table=pit_table, panel=panel, backtest_mode=True,
+                            spy_close=spy_close, vix_close=vix_close,
+                            sector_map=sector_map)
+    by_date = {} if batch.empty else {
+        d: g.droplevel("date") for d, g in batch.groupby(level="date", sort=False)}
+
+    clock = _stage_done(stages, "유니버스·스냅샷", clock, budget)
+
+    for i, date in enumerate(rebal_dates[:-1]):
+        if i < new_from:
+            # 체크포인트·이전 실행 스냅샷 (확장 모드 forward return은 _extend_state에서 갱신)
+            snapshots[date] = base_snaps[date]
+            continue
+        snap = by_date.get(date)
+        if snap is None:
+            snapshots[date] = pd.DataFrame()
+            continue
+
+        # 실제 forward return 추가 (체결가 가정 반영)
+        snap["_fwd_return"] = fwd_returns_at(fwd, i, snap.index, use_next_open)
+        snapshots[date] = snap
+    if checkpoint and not ckpt:
+        save_checkpoint(checkpoint, run_fp, snapshots=snapshots)
+    clock = _stage_done(stages, "Forward 수익률", clock, budget)
+
+    # ── Step 2: 롤링 모델 학습 → 날짜별 예측 점수 캐시 ──
+    progress(0.30, "🤖 AI 모델 학습 및 백테스트 실행 중...")
+
+    ic_records     = []
+    feat_imp_rows  = []
+    feat_imp_rf_rows   = []   # 모델별 중요도 (Ver3.8)
+    feat_imp_xgb_rows  = []
+    feat_imp_lgbm_rows = []
+    pred_rows      = []      # 날짜별 예측 점수 (simulate_portfolio 입력)
+
+    # 마지막 학습 정보 (tab_realtime 전달용)
+    last_win_bounds  = {}
+    last_miss_src    = []
+    last_all_cols    = []
+    last_avail_cols  = []
+    model_rf = model_xgb = model_lgbm = imputer_step = None
+
+    # ── 윈도우별 학습 작업 구성 (스냅샷은 모두 준비된 상태 → 윈도우 간 독립) ──
+    # ── 학습 행렬 링 버퍼 (float32, 날짜 블록 rolling_win개) ──
+    # 윈도우가 1칸 이동하면 가장 오래된 블록 자리에 새 블록 1개만 기록
+    # 열 목록은 forward return이 붙은 첫 비어 있지 않은 스냅샷 기준 (없으면 FEAT_COLS)
+    # — 가격 이력 시작 전 날짜는 빈 DataFrame이 저장되므로 첫 스냅샷을 그대로 쓰면 안 됨
+    snap_cols  = next((sn.columns for sn in snapshots.values()
+                       if sn is not None and not sn.empty and "_fwd_return" in sn.columns),
+                      FEAT_COLS)
+    train_cols = [c for c in feature_cols if c in snap_cols]
+    ring = _ring_init(rolling_win, max((len(sn) for sn in snapshots.values()), default=0),
+                      len(train_cols))
+
+    tasks = []
+    for i in range(rolling_win, n_dates - 1):
+        date = rebal_dates[i]
+        if i in done_outs:
+            # 체크포인트·확장 모드: 완료된 윈도우 결과 재사용 (학습 행렬 불필요)
+            tasks.append({"i": i, "cur_snap": snapshots.get(date), "keep_models": False,
+                          "prev_out": done_outs[i]})
+            continue
+        for j in range(i - rolling_win, i):
+            if ring["date"][j % rolling_win] != rebal_dates[j]:
+                _ring_put(ring, j % rolling_win, snapshots.get(rebal_dates[j]),
+                          train_cols, rebal_dates[j])
+
+        # ── 훈련 데이터 수집 (Ver4.2: 엠바고 적용) ─────────
+        # 예측 날짜와 21일 이내 겹치는 스냅샷 제외 → 데이터 누수 방지
+        # 엠바고: 훈련 스냅샷의 forward return 종료일이 예측일과 겹치면 제외
+        slots = [j % rolling_win for j in range(i - rolling_win, i)
+                 if (date - rebal_dates[j]).days >= EMBARGO_DAYS
+                 and ring["n"][j % rolling_win] >= 5]
+        if not slots:
+            continue
+        X_train, y_train, groups = _ring_gather(ring, slots)
+
+        tasks.append({
+            "i":            i,
+            "X_train":      X_train,
+            "y_train":      y_train,
+            "cols":         train_cols,
+            "groups":       groups,   # 행별 스냅샷 날짜 (Purged CV용)
+            "cur_snap":     snapshots.get(date),
+            "use_ensemble": use_ensemble,
+            "seed":         seed,
+            "keep_models":  False,
+            "model_store":  model_store,
+        })
+    clock = _stage_done(stages, "학습 행렬 구성", clock, budget)
+
+    # ── 학습 스케줄: 튜닝 → 재학습 → 모델 재사용 순으로 단계별 병렬 실행 ──
+    # 각 단계 안의 윈도우는 서로 독립 (앞 단계 결과만 참조)
+    sched = walk_forward_schedule(len(tasks), retrain_every, retune_every)
+    for w, task in enumerate(tasks):
+        if "prev_out" in task:
+            continue
+        # 마지막 윈도우(실시간 추천용) + 다음 윈도우가 재사용하는 학습 윈도우만 모델 반환
+        # (웜스타트: 다음 학습 윈도우가 부스터를 이어받으므로 학습 윈도우 전부)
+        task["keep_models"] = (w == len(tasks) - 1 or
+                               (w + 1 < len(tasks) and sched[w + 1] == "reuse") or
+                               (use_warm and sched[w] != "reuse"))
+
+    # 튜닝 윈도우: SEARCH_ANCHOR_EVERY회마다 전체 그리드 탐색(anchor),
+    # 나머지는 직전 anchor의 탐색 결과 주변만 탐색 (탐색 결과 캐시 → 후보 9개 → 4~9개)
+    tune_w   = [w for w, mode in enumerate(sched) if mode == "tune"]
+    anchors  = set(tune_w[::SEARCH_ANCHOR_EVERY])
+    phase_of = ["anchor" if w in anchors else mode for w, mode in enumerate(sched)]
+
+    def _set_prior(w):
+        if phase_of[w] == "tune":
+            src = max(v for v in range(w) if phase_of[v] == "anchor")
+            tasks[w]["search_prior"] = outs[src]["search"]
+
+    # ── 코어 예산 분배: 단계별 (윈도우 병렬 w, 모델 병렬 m, 트리 n_jobs t), w × m × t ≤ 예산 ──
+    def _plan(n_windows, n_models):
+        if cpu_budget:
+            return plan_compute(cpu_budget, n_windows, n_models)
+        return {"window_workers": max(int(n_workers), 1), "model_workers": 1,
+                "tree_jobs": 1, "budget": budget}
+
+    def _apply(plan, ws):
+        for w in ws:
+            tasks[w]["model_workers"] = plan["model_workers"]
+            tasks[w]["tree_jobs"]     = plan["tree_jobs"]
+        return f"윈도우 {plan['window_workers']} × 모델 {plan['model_workers']} × 트리 {plan['tree_jobs']}"
+
+    n_models = 3 if use_ensemble else 1
+    phase_names = {"anchor": "모델 학습 (전체 탐색)", "tune": "모델 학습 (축소 탐색)",
+                   "fit": "모델 학습 (재학습)", "reuse": "예측 (모델 재사용)"}
+    compute_plan = {}
+
+    n_tasks = max(len(tasks), 1)
+    outs    = [t.get("prev_out") for t in tasks]
+    n_done  = sum(o is not None for o in outs)
+    n_resumed = n_done if ckpt else 0
+
+    # 체크포인트: 완료 윈도우 checkpoint_every개마다 기록 (단계 경계·중단 시에는 즉시)
+    pending: list = []
+
+    def _checkpoint(ws=(), flush=False):
+        if not checkpoint:
+            return
+        pending.extend(ws)
+        if pending and (flush or len(pending) >= max(int(checkpoint_every), 1)):
+            save_checkpoint(checkpoint, run_fp, outs={tasks[w]["i"]: outs[w] for w in pending})
+            pending.clear()
+
+    try:
+        if use_warm:
+            # 웜스타트 체인: 학습 윈도우를 날짜순으로 → 직전 부스터 전달 (윈도우 병렬 없음)
+            # 모델 병렬 대상: RF + XGB + LGBM (+ 비교용 전체 재학습 부스터 2개)
+            chain_w = [v for v, mode in enumerate(sched) if mode != "reuse"]
+            compute_plan["warm"] = _plan(1, 5 if warm_compare else n_models)
+            layout = _apply(compute_plan["warm"], chain_w)
+            prev, chain = None, 0
+            for w in chain_w:
+                if outs[w] is not None:   # 체크포인트·확장 모드: 완료 윈도우로 체인 상태 복원
+                    chain = chain + 1 if outs[w].get("warm_started") else 1
+                    prev = outs[w]
+                    continue
+                if sched[w] == "fit":
+                    src = max(v for v in range(w) if sched[v] == "tune")
+                    tasks[w]["rf_params"] = outs[src]["rf_params"]
+                _set_prior(w)
+                if prev is not None and chain < max(int(warm_refit_every), 1):
+                    tasks[w]["warm"] = {"xgb": prev["model_xgb"].get_booster(),
+                                        "lgbm": prev["model_lgbm"].booster_,
+                                        "cols": prev["all_cols"], "rounds": int(warm_rounds),
+                                        "fingerprint": prev["fingerprint"]}
+                    tasks[w]["warm_compare"] = warm_compare
+                outs[w] = _train_window(tasks[w])
+                chain = chain + 1 if outs[w].get("warm_started") else 1
+                prev = outs[w]
+                n_done += 1
+                _checkpoint([w])
+                progress(min(0.30 + 0.65 * n_done / n_tasks, 0.95),
+                         f"AI 모델 학습 중 ({n_done}/{n_tasks} 윈도우, 웜스타트)...")
+            _checkpoint(flush=True)
+            clock = _stage_done(stages, "모델 학습 (웜스타트 체인)", clock, budget, layout)
+        for phase in ("reuse",) if use_warm else ("anchor", "tune", "fit", "reuse"):
+            idx = [w for w, ph in enumerate(phase_of) if ph == phase and outs[w] is None]
+            if not idx:
+                continue
+            # 예측만 하는 재사용 단계는 순차로 충분
+            compute_plan[phase] = (_plan(len(idx), n_models) if phase != "reuse" else
+                                   {"window_workers": 1, "model_workers": 1, "tree_jobs": 1,
+                                    "budget": budget})
+            layout = _apply(compute_plan[phase], idx)
+            for w in idx:
+                _set_prior(w)
+                if phase == "fit":
+                    src = max(v for v in range(w) if sched[v] == "tune")
+                    tasks[w]["rf_params"] = outs[src]["rf_params"]
+                elif phase == "reuse":
+                    src = max(v for v in range(w) if sched[v] != "reuse")
+                    tasks[w]["fit"] = {k: outs[src][k] for k in _FIT_KEYS}
+                    tasks[w]["fingerprint"] = outs[src]["fingerprint"]
+                    tasks[w].pop("X_train")
+                    tasks[w].pop("y_train")
+            # 체크포인트 사용 시 checkpoint_every개(최소 워커 수) 단위로 나눠 실행 후 기록
+            step = (max(int(checkpoint_every), compute_plan[phase]["window_workers"])
+                    if checkpoint else len(idx))
+            for k0 in range(0, len(idx), step):
+                part = idx[k0:k0 + step]
+                part_outs = run_walk_forward(
+                    [tasks[w] for w in part],
+                    n_workers=compute_plan[phase]["window_workers"],
+                    progress=lambda k, n, base=n_done: progress(
+                        min(0.30 + 0.65 * (base + k) / n_tasks, 0.95),
+                        f"AI 모델 학습 중 ({base + k}/{n_tasks} 윈도우)..."),
+                )
+                for w, out in zip(part, part_outs):
+                    outs[w] = out
+                n_done += len(part)
+                _checkpoint(part)
+            _checkpoint(flush=True)   # 단계 경계: 남은 완료 윈도우 기록
+            clock = _stage_done(stages, phase_names[phase], clock, budget, layout)
+    finally:   # 중단(예외·세션 종료) 시에도 완료된 윈도우는 기록
+        _checkpoint(flush=True)
+
+    if checkpoint:   # 학습 완료 → 체크포인트 불필요 (결과 정리 단계는 재시작 시 즉시 재계산)
+        clear_checkpoint(checkpoint)
+    if model_store:
+        prune_model_store(model_store)
+
+    # 학습 시간 통계: 매 기간 튜닝+학습(기존 방식) 대비 절약 시간 추정
+    fit_sec  = sum(o["fit_sec"] for o in outs)
+    # 웜스타트 윈도우는 부스터를 처음부터 학습했을 때 시간으로 환산
+    tune_sec = [o["fit_sec"] - o.get("boost_sec", 0.0) + o.get("boost_full_sec", o.get("boost_sec", 0.0))
+                for o in outs if o["tuned"]]
+    est_full = float(np.mean(tune_sec)) * len(outs) if tune_sec else fit_sec
+    n_grid   = int(np.prod([len(v) for v in RF_PARAM_GRID.values()]))
+    train_stats = {
+        "n_windows":    len(outs),
+        "n_tune":       sched.count("tune"),
+        "n_fit":        sched.count("fit"),
+        "n_reuse":      sched.count("reuse"),
+        "n_stored":     sum(1 for o in outs if o["stored"]),   # 모델 저장소에서 로드
+        "n_extended":   n_reused,   # 확장 모드: 이전 실행에서 재사용한 윈도우
+        "n_resumed":    n_resumed,  # 체크포인트에서 이어받은 윈도우
+        "fit_sec":      fit_sec,
+        "est_full_sec": est_full,
+        "saved_sec":    max(est_full - fit_sec, 0.0),
+        # 튜닝 비용 (탐색에 학습한 트리 수, 최종 학습 제외): 현재 탐색 vs GridSearchCV(그리드 × cv=3)
+        "search_trees": sum(o["search"]["tree_fits"] for o in outs if o["tuned"]),
+        "grid_trees":   sched.count("tune") * n_grid * 3 * RF_TREES,
+    }
+    warm_outs = [o for o in outs
+                 if o.get("warm_started") and "boost_full_sec" in o and not o["stored"]]
+    if use_warm:
+        train_stats.update({
+            "n_warm":         sum(1 for o in outs
+                                  if o.get("warm_started") and not (o["reused"] or o["stored"])),
+            "boost_warm_sec": sum(o["boost_sec"] for o in warm_outs),
+            "boost_full_sec": sum(o["boost_full_sec"] for o in warm_outs),
+        })
+
+    for task, out in zip(tasks, outs):
+        i         = task["i"]
+        date      = rebal_dates[i]
+        next_date = rebal_dates[i + 1]
+        if task["keep_models"]:
+            model_rf, model_xgb = out["model_rf"], out["model_xgb"]
+            model_lgbm, imputer_step = out["model_lgbm"], out["imputer"]
+
+        feat_imp_rows.append({"date": date, **out["imp"]})
+        feat_imp_rf_rows.append({"date": date, **out["imp_rf"]})
+        if use_ensemble:
+            feat_imp_xgb_rows.append({"date": date, **out["imp_xgb"]})
+            feat_imp_lgbm_rows.append({"date": date, **out["imp_lgbm"]})
+
+        if out["pred"] is None:
+            continue
+        if out["ic_rec"] is not None:
+            ic_records.append({"date": date, **out["ic_rec"]})
+
+        # ── 예측 점수 캐시 (포트폴리오 단계는 simulate_portfolio에서) ──
+        pred_rows.append({
+            "i":           i,
+            "date":        date,
+            "next_date":   next_date,
+            "learn_start": rebal_dates[i - rolling_win].strftime("%Y-%m-%d"),
+            "snap":        task["cur_snap"],
+            "pred":        out["pred"],
+            "pred_rf":     out["pred_rf"],
+            "pred_xgb":    out["pred_xgb"],
+            "pred_lgbm":   out["pred_lgbm"],
+            "ranks":       out["ranks"],
+            "top10":       sorted(out["imp"].items(), key=lambda x: x[1], reverse=True)[:10],
+            "ic":          out["ic"],
+            "fingerprint": out["fingerprint"],   # 모델 저장소 키 (replay_window)
+        })
+
+        # 마지막 학습 정보 갱신
+        last_win_bounds = out["win_bounds"]
+        last_miss_src   = out["miss_src"]
+        last_all_cols   = out["all_cols"]
+        last_avail_cols = out["avail_cols"]
+
+    progress(0.98, "결과 정리 중...")
+
+    # ── feat_imp_history DataFrame ────────────────────────
+    def _to_fimp_df(rows):
+        if rows:
+            d = pd.DataFrame(rows).set_index("date")
+            d.index = pd.to_datetime(d.index)
+            return d
+        return pd.DataFrame()
+
+    fimp_df      = _to_fimp_df(feat_imp_rows)
+    fimp_rf_df   = _to_fimp_df(feat_imp_rf_rows)
+    fimp_xgb_df  = _to_fimp_df(feat_imp_xgb_rows)
+    fimp_lgbm_df = _to_fimp_df(feat_imp_lgbm_rows)
+
+    ic_df = pd.DataFrame(ic_records) if ic_records else pd.DataFrame()
+
+    # ── Step 3: 포트폴리오 구성 (캐시된 예측 점수 사용) ──
+    preds = {
+        "start":        rebal_dates[0],
+        "rows":         pred_rows,
+        "fwd":          fwd,
+        "use_ensemble": use_ensemble,
+        "use_next_open": use_next_open,
+    }
+    sim = simulate_portfolio(
+        preds, n_stocks, tc_pct,
+        use_mom_filter=use_mom_filter,
+        use_turnover_buffer=use_turnover_buffer,
+        turnover_buffer_pct=turnover_buffer_pct,
+        use_inv_vol_weight=use_inv_vol_weight,
+    )
+    _stage_done(stages, "결과 정리·포트폴리오", clock, budget)
+
+    # 확장 모드용 상태: 스냅샷 + 윈도우 결과 (모델은 마지막 학습 윈도우 2개만 유지)
+    last_trained = set([w for w, mode in enumerate(sched) if mode != "reuse"][-2:])
+    wf_state = {
+        "params":      wf_params,
+        "rebal_dates": list(rebal_dates),
+        "data_fp":     _data_fp(rebal_dates[-1]),   # 다음 확장 시 이 날짜까지 데이터 불변 확인
+        "snapshots":   snapshots,
+        "outs":        {task["i"]: (out if w in last_trained else
+                                    {k: v for k, v in out.items() if k not in _FIT_MODEL_KEYS})
+                        for w, (task, out) in enumerate(zip(tasks, outs))},
+    }
+
+    # 마지막 학습된 모델·imputer·피처 컬럼·전처리 정보 저장
+    # → 실시간 추천 탭에서 동일 전처리 + 앙상블 예측 적용
+    return {
+        **sim,
+        "preds":            preds,   # 포트폴리오 설정 변경 시 재시뮬레이션용
+        "ic_df":            ic_df,
+        "fimp_df":          fimp_df,
+        "fimp_rf_df":       fimp_rf_df,
+        "fimp_xgb_df":      fimp_xgb_df,
+        "fimp_lgbm_df":     fimp_lgbm_df,
+        "last_model_rf":    model_rf,
+        "last_model_xgb":   model_xgb,
+        "last_model_lgbm":  model_lgbm,
+        "last_imputer":     imputer_step,
+        "last_avail_cols":  last_avail_cols,
+        "last_all_cols":    last_all_cols,
+        "last_win_bounds":  last_win_bounds,
+        "last_miss_src":    last_miss_src,
+        "use_ensemble":     use_ensemble,
+        "rebal_m":          rolling_win,   # tab_ic 연간 턴오버 계산용
+        "train_stats":      train_stats,
+        "stage_times":      pd.DataFrame(stages),
+        "compute_plan":     compute_plan,
+        "wf_state":         wf_state,   # extend_from으로 넘기면 새 날짜만 계산
+    }
+
+
+# 포트폴리오 구성 단계에만 쓰이는 설정 — 이 값만 바뀌면 모델 재학습 없이 재시뮬레이션
+PORTFOLIO_KEYS = ("n_stocks", "tc_pct", "use_turnover_buffer", "turnover_buffer_pct",
+                  "use_inv_vol_weight", "use_mom_filter")
+# 결과에 영향 없는 실행 설정 (비교 대상 제외)
+_RUNTIME_KEYS = {"run", "n_workers", "cpu_budget", "extend"}
+
+
+def simulate_portfolio(
+    preds:    dict,
+    n_stocks: int,
+    tc_pct:   float,
+    use_mom_filter:      bool = True,
+    use_turnover_buffer: bool = False,
+    turnover_buffer_pct: float = 0.05,
+    use_inv_vol_weight:  bool = False,
+) -> dict:
+    """캐시된 예측 점수(run_backtest의 results["preds"])로 포트폴리오 구성.
+    종목 선정·가중치·거래비용·턴오버·적중률만 계산하며 모델 학습은 하지 않음.
+    반환: {"port_dates", "port_values", "rebal_hist"}
+    """
+    fwd           = preds["fwd"]
+    use_ensemble  = preds["use_ensemble"]
+    use_next_open = preds["use_next_open"]
+
+    portfolio_dates  = [preds["start"]]
+    portfolio_values = [1.0]
+    current_value    = 1.0
+    rebal_history    = []
+    prev_selected    = set()   # 직전 기간 보유 종목 (turnover 계산용)
+
+    for row in preds["rows"]:
+        i           = row["i"]
+        cur_snap    = row["snap"]
+        pred_series = row["pred"]
+
+        # ── 종목 선정 (모멘텀 필터 + 턴오버 버퍼) ──────────
+        if use_mom_filter and "Mom_1m" in cur_snap.columns:
+            mom_ok = cur_snap["Mom_1m"] > 0
+            candidates = pred_series[pred_series.index.isin(cur_snap[mom_ok].index)]
+        else:
+            candidates = pred_series
+        # Ver4.2: 턴오버 버퍼 — 보유 종목에 가산점 부여
+        if use_turnover_buffer and prev_selected:
+            candidates_adj = candidates.copy()
+            for t in prev_selected:
+                if t in candidates_adj.index:
+                    candidates_adj[t] *= (1 + turnover_buffer_pct)
+            if len(candidates_adj) >= n_stocks:
+                selected = candidates_adj.nlargest(n_stocks)
+            else:
+                selected = pred_series.nlargest(n_stocks)
+        elif len(candidates) >= n_stocks:
+            selected = candidates.nlargest(n_stocks)
+        else:
+            selected = pred_series.nlargest(n_stocks)
+
+        # ── Ver4.2: 포트폴리오 가중치 결정 ────────────────
+        n_sel = len(selected)
+        if n_sel == 0:
+            continue
+        if use_inv_vol_weight and "Volatility_30d" in cur_snap.columns:
+            vols = {}
+            for t in selected.index:
+                v = cur_snap.loc[t, "Volatility_30d"] if t in cur_snap.index else np.nan
+                vols[t] = v if (not np.isnan(v) and v > 0) else 0.30
+            inv_vols = {t: 1 / v for t, v in vols.items()}
+            total_inv = sum(inv_vols.values())
+            weights_dict = {t: iv / total_inv for t, iv in inv_vols.items()}
+        else:
+            w = 1 / n_sel
+            weights_dict = {t: w for t in selected.index}
+
+        # ── 포트폴리오 수익률 (가중 적용) ─────────────────
+        port_ret = 0.0
+        sel_returns = dict(zip(selected.index,
+                               fwd_returns_at(fwd, i, selected.index, use_next_open, filled=True)))
+        for t, r in sel_returns.items():
+            port_ret += weights_dict[t] * r
+
+        # ── 유니버스 평균·Bottom N 수익률 (선정 품질 지표용) ──
+        actual = cur_snap["_fwd_return"].dropna()
+        univ_avg_ret = float(actual.mean()) if len(actual) > 0 else np.nan
+        # Bottom N: 예측 점수 최하위 N개
+        bottom_n = pred_series.nsmallest(n_stocks)
+        bottom_ret = 0.0
+        n_bot = len(bottom_n)
+        for r in fwd_returns_at(fwd, i, bottom_n.index, use_next_open, filled=True):
+            bottom_ret += r
+        if n_bot > 0:
+            bottom_ret /= n_bot
+        # 적중률: TOP N 중 유니버스 평균 초과 종목 비율
+        if not np.isnan(univ_avg_ret) and sel_returns:
+            precision = sum(1 for r in sel_returns.values()
+                           if not np.isnan(r) and r > univ_avg_ret) / len(sel_returns)
+        else:
+            precision = np.nan
+
+        # ── Turnover 계산 + 거래비용 적용 ─────────────────
+        # turnover = 신규 편입 종목 수 / 전체 보유 종목 수
+        # 첫 리밸런싱은 전체 신규 매수이므로 turnover = 1.0
+        new_selected = set(selected.index)
+        if not prev_selected:
+            turnover = 1.0
+        else:
+            newly_bought = len(new_selected - prev_selected)
+            turnover = newly_bought / max(len(new_selected), 1)
+        prev_selected = new_selected
+
+        # 실제 거래비용 = 설정 TC × turnover (교체된 비중에만 비용 발생)
+        tc_actual = (tc_pct / 100) * turnover
+        current_value *= (1 + port_ret - tc_actual)
+        portfolio_dates.append(row["next_date"])
+        portfolio_values.append(current_value)
+
+        # ── 리밸런싱 히스토리 (종목 표는 열 단위로 구성) ──
+        sel_idx = selected.index
+        head = {"ticker": list(sel_idx),
+                "비중":   [f"{weights_dict.get(t, 0):.1%}" for t in sel_idx]}
+        if use_ensemble:
+            for name, rank in row["ranks"].items():
+                head[name] = rank.reindex(sel_idx).values
+        else:
+            head["예측수익률"] = pred_series[sel_idx].values
+        head["실제수익률"] = actual.reindex(sel_idx).values
+        feats = cur_snap.reindex(index=sel_idx, columns=FEAT_COLS)
+        feats.columns = [FEAT_NAMES.get(fc, fc) for fc in FEAT_COLS]
+        ticker_df = pd.concat([pd.DataFrame(head), feats.reset_index(drop=True)], axis=1)
+
+        date      = row["date"]
+        next_date = row["next_date"]
+        rebal_history.append({
+            "rebalance_date":  date,
+            "next_date":       next_date,
+            "holding_period":  f"{date.strftime('%Y-%m-%d')} ~ {next_date.strftime('%Y-%m-%d')}",
+            "learn_start":     row["learn_start"],
+            "selected":        list(sel_idx),
+            "ticker_df":       ticker_df,
+            "top10_features":  row["top10"],
+            "port_return":     port_ret,
+            "ic":              row["ic"],
+            "turnover":        turnover,
+            "tc_actual":       tc_actual,
+            "univ_avg_ret":    univ_avg_ret,
+            "bottom_ret":      bottom_ret,
+            "precision":       precision,
+        })
+
+    return {
+        "port_dates":  portfolio_dates,
+        "port_values": portfolio_values,
+        "rebal_hist":  rebal_history,
+    }
+
+
+def resimulate_backtest(results: dict, cfg: dict) -> dict:
+    """포트폴리오 설정(PORTFOLIO_KEYS)만 바뀐 경우: 캐시된 예측 점수로 결과 갱신."""
+    sim = simulate_portfolio(
+        results["preds"], cfg["n_stocks"], cfg["tc_pct"],
+        use_mom_filter=cfg.get("use_mom_filter", True),
+        use_turnover_buffer=cfg.get("use_turnover_buffer", False),
+        turnover_buffer_pct=cfg.get("turnover_buffer_pct", 0.05),
+        use_inv_vol_weight=cfg.get("use_inv_vol_weight", False),
+    )
+    return {**results, **sim}
+
+
+def portfolio_only_change(old_cfg: dict, new_cfg: dict) -> bool:
+    """두 설정이 PORTFOLIO_KEYS에서만 다르면 True (실행 버튼·워커 수는 무시)."""
+    if not old_cfg or not new_cfg:
+        return False
+    keys = (set(old_cfg) | set(new_cfg)) - _RUNTIME_KEYS
+    diff = {k for k in keys if old_cfg.get(k) != new_cfg.get(k)}
+    return bool(diff) and diff <= set(PORTFOLIO_KEYS)
+
+
+# 스윕 기본값 = simulate_portfolio 기본값
+SWEEP_DEFAULTS = {"n_stocks": 5, "tc_pct": 0.3, "use_turnover_buffer": False,
+                  "turnover_buffer_pct": 0.05, "use_inv_vol_weight": False,
+                  "use_mom_filter": True}
+
+
+def _sweep_inputs(preds: dict) -> dict:
+    """스윕용 날짜별 배열 (종목 순서 = 예측 Series 순서 → nlargest 동률 처리 일치)."""
+    fwd, use_next_open = preds["fwd"], preds["use_next_open"]
+    col, rows = {}, []
+    for row in preds["rows"]:
+        snap, pred = row["snap"], row["pred"]
+        tk = pred.index
+        for t in tk:
+            col.setdefault(t, len(col))
+        mom = (snap["Mom_1m"].reindex(tk).to_numpy(np.float64) > 0
+               if "Mom_1m" in snap.columns else None)
+        if "Volatility_30d" in snap.columns:
+            v = snap["Volatility_30d"].reindex(tk).to_numpy(np.float64)
+            vol = np.where(np.isnan(v) | (v <= 0), 0.30, v)
+        else:
+            vol = None
+        actual = snap["_fwd_return"].dropna()
+        rows.append({
+            "cols":  np.array([col[t] for t in tk], dtype=np.intp),
+            "score": pred.to_numpy(np.float64),
+            "mom":   mom,
+            "vol":   vol,
+            "ret":   np.asarray(fwd_returns_at(fwd, row["i"], tk, use_next_open, filled=True),
+                                dtype=np.float64),
+            "univ":  float(actual.mean()) if len(actual) > 0 else np.nan,
+            "date":  row["date"],
+            "next_date": row["next_date"],
+        })
+    return {"n_tickers": len(col), "rows": rows}
+
+
+def _rank_pos(key: np.ndarray) -> np.ndarray:
+    """행별 내림차순 순위 (동률은 앞 종목 우선 = Series.nlargest keep="first", NaN은 맨 뒤)."""
+    order = np.argsort(-key, axis=1, kind="stable")
+    pos = np.empty_like(order)
+    np.put_along_axis(pos, order, np.arange(key.shape[1])[None, :], axis=1)
+    return pos
+
+
+def sweep_portfolio(preds: dict, grid: dict, base: dict = None,
+                    rf: float = 0.03) -> pd.DataFrame:
+    """포트폴리오 설정 그리드 전체 조합을 캐시된 예측 점수로 한 번에 평가.
+    grid: {PORTFOLIO_KEYS 중 키: 후보값 리스트}, 나머지 설정은 base(없으면 기본값).
+    날짜 루프 1회 안에서 모든 조합을 (조합 × 종목) 배열로 동시에 계산하며,
+    종목 선정·턴오버 버퍼(점수 × (1+pct))·가중치·거래비용 규칙은 simulate_portfolio와 동일
+    (예측 점수 결측 종목 처리 포함 — tests/test_sweep_portfolio.py에서 두 경로 일치 확인).
+    반환: 조합별 설정 + 성과 지표(calc_metrics_matrix) + 평균 턴오버·적중률
+    """
+    params = {**SWEEP_DEFAULTS, **{k: v for k, v in (base or {}).items()
+                                    if k in SWEEP_DEFAULTS}}
+    keys   = [k for k in PORTFOLIO_KEYS if k in grid]
+    combos = list(itertools.product(*[list(grid[k]) for k in keys])) or [()]
+    combo_df = pd.DataFrame(combos, columns=keys)
+    for k in SWEEP_DEFAULTS:
+        if k not in combo_df.columns:
+            combo_df[k] = [params[k]] * len(combo_df)
+    combo_df = combo_df[list(PORTFOLIO_KEYS)]
+
+    G      = len(combo_df)
+    n      = combo_df["n_stocks"].to_numpy(np.int64)
+    tc     = combo_df["tc_pct"].to_numpy(np.float64) / 100
+    use_b  = combo_df["use_turnover_buffer"].to_numpy(bool)
+    bpct   = combo_df["turnover_buffer_pct"].to_numpy(np.float64)
+    use_iv = combo_df["use_inv_vol_weight"].to_numpy(bool)
+    use_mf = combo_df["use_mom_filter"].to_numpy(bool)
+
+    inp = _sweep_inputs(preds)
+    prev   = np.zeros((G, inp["n_tickers"]), dtype=bool)
+    values = [np.ones(G)]
+    dates  = [preds["start"]]
+    turn_l, prec_l = [], []
+    cur = np.ones(G)
+
+    for r in inp["rows"]:
+        m = len(r["cols"])
+        if m == 0:
+            continue
+        score    = r["score"]
+        prev_loc = prev[:, r["cols"]]
+        has_prev = prev.any(axis=1)
+
+        # 후보: 모멘텀 필터 / 버퍼 가산 (보유 종목 점수 × (1+pct))
+        if r["mom"] is not None:
+            cand = np.where(use_mf[:, None], r["mom"][None, :], True)
+        else:
+            cand = np.ones((G, m), dtype=bool)
+        buf  = (use_b & has_prev)[:, None] & prev_loc
+        adj  = score[None, :] * np.where(buf, 1 + bpct[:, None], 1.0)
+        fall = cand.sum(axis=1) < n      # 후보 부족 → 전체 예측 점수로 선정
+        # 순위: 선정 대상 중 점수 있는 종목 → 점수 결측 종목(원래 순서) → 대상 외 종목
+        # (nlargest는 점수 있는 종목이 n개 미만이면 결측 종목으로 나머지를 채움)
+        elig = fall[:, None] | cand
+        val  = np.where(fall[:, None], score[None, :], adj)
+        key  = np.where(elig, np.where(np.isnan(val), -np.inf, val), np.nan)
+        n_sel = np.minimum(n, elig.sum(axis=1))
+        sel  = _rank_pos(key) < n_sel[:, None]
+
+        # 가중치: 역변동성 or 동일 비중
+        eq = sel / n_sel[:, None]
+        if r["vol"] is not None:
+            inv = sel / r["vol"][None, :]
+            w = np.where(use_iv[:, None], inv / inv.sum(axis=1, keepdims=True), eq)
+        else:
+            w = eq
+        port_ret = np.where(sel, w * r["ret"][None, :], 0.0).sum(axis=1)
+
+        # 적중률: TOP N 중 유니버스 평균 초과 비율
+        if np.isnan(r["univ"]):
+            prec = np.full(G, np.nan)
+        else:
+            prec = (sel & (r["ret"][None, :] > r["univ"])).sum(axis=1) / n_sel
+
+        # 턴오버 + 거래비용
+        new_cnt  = (sel & ~prev_loc).sum(axis=1)
+        turnover = np.where(has_prev, new_cnt / np.maximum(n_sel, 1), 1.0)
+        prev[:] = False
+        prev[:, r["cols"]] = sel
+
+        cur = cur * (1 + port_ret - tc * turnover)
+        values.append(cur)
+        dates.append(r["next_date"])
+        turn_l.append(turnover)
+        prec_l.append(prec)
+
+    if not turn_l:
+        return combo_df
+
+    # 성과 지표: 운용 시작(첫 리밸런싱일) 이후 구간, 시작점 1.0 재정규화 (요약 탭과 동일)
+    V   = np.column_stack(values)
+    idx = pd.DatetimeIndex(dates)
+    act = idx >= inp["rows"][0]["date"]
+    met = calc_metrics_matrix(V[:, act], idx[act], rf=rf)
+    met["평균턴오버"] = np.mean(turn_l, axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        met["적중률"] = np.nanmean(np.column_stack(prec_l), axis=1)
+    return pd.concat([combo_df, met], axis=1)
+
+
+# ═══════════════════════════════════════════════════════════
+# PERFORMANCE METRICS
+# ═══════════════════════════════════════════════════════════
+
+def build_daily_portfolio(results: dict, panel: dict) -> pd.Series:
+    """리밸런싱 히스토리 + 가격 패널로 AI 포트폴리오 일단위 시계열 구성."""
+    hist       = results.get("rebal_hist", [])
+    port_dates = [pd.Timestamp(d) for d in results["port_dates"]]
+    port_vals  = results["port_values"]
+
+    # 히스토리나 가격 데이터 없으면 기간 단위 그대로 반환
+    if not hist or panel is None or not panel["tickers"]:
+        return pd.Series(port_vals, index=pd.DatetimeIndex(port_dates))
+
+    records: dict = {}
+    cur_val = 1.0
+
+    # ① warm-up 구간 (학습 기간): 첫 운용 시작일 전까지 1.0으로 평탄
+    init_date   = port_dates[0]
+    first_trade = hist[0]["rebalance_date"]
+    for d in pd.bdate_range(init_date, first_trade):
+        records[d] = 1.0
+
+    # ② 리밸런싱별 일단위 포트폴리오 계산
+    for h in hist:
+        s_dt    = h["rebalance_date"]
+        e_dt    = h["next_date"]
+        tickers = h["selected"]
+
+        cols = [panel["col"][t] for t in tickers if t in panel["col"]]
+        r0, r1 = _row_ge(panel, s_dt), _row_gt(panel, e_dt)
+        sub   = panel["Close"][r0:r1, cols].astype(np.float64)
+        valid = ~np.isnan(sub)
+        keep  = valid.sum(axis=0) >= 2
+        sub, valid = sub[:, keep], valid[:, keep]
+
+        if sub.shape[1] == 0:
+            records[e_dt] = cur_val * (1 + h["port_return"])
+            cur_val = records[e_dt]
+            continue
+
+        # 기간 내 첫 유효 종가 기준 정규화 → 동일 가중 지수 × 현재 포트폴리오 가치
+        first  = sub[valid.argmax(axis=0), np.arange(sub.shape[1])]
+        traded = valid.any(axis=1)
+        eq_idx = np.nanmean(sub[traded] / first, axis=1)
+        for dt, v in zip(panel["dates"][r0:r1][traded], eq_idx):
+            records[dt] = float(v) * cur_val
+
+        cur_val = float(eq_idx[-1]) * cur_val
+
+    if not records:
+        return pd.Series(port_vals, index=pd.DatetimeIndex(port_dates))
+
+    return pd.Series(records).sort_index()
+
+
+def calc_metrics(series: pd.Series, label: str, rf: float = 0.03) -> dict:
+    """성과 지표 계산. rf: 연간 무위험수익률 (소수, 예: 0.05 = 5%).
+    Sharpe/Sortino: 데이터 빈도 자동 감지 후 올바른 연율화 계수 적용.
+    """
+    if len(series) < 2:
+        return {"지표": label}
+    r  = series.pct_change().dropna()
+    yr = (series.index[-1] - series.index[0]).days / 365.25
+    total = series.iloc[-1] / series.iloc[0] - 1
+    cagr  = (series.iloc[-1] / series.iloc[0]) ** (1 / max(yr, 0.01)) - 1
+
+    # 데이터 빈도 자동 감지: 평균 간격(일)으로 판단
+    if len(r) >= 2:
+        avg_gap = (series.index[-1] - series.index[0]).days / len(r)
+        if avg_gap > 15:      # 월간 (간격 ~21일)
+            ann_factor = 12
+        elif avg_gap > 3:     # 주간 (간격 ~5일)
+            ann_factor = 52
+        else:                 # 일간 (간격 ~1일)
+            ann_factor = 252
+    else:
+        ann_factor = 252
+
+    vol = r.std() * np.sqrt(ann_factor)
+
+    # Sharpe: 초과수익 평균 / 표준편차 → 연율화
+    period_rf = rf / ann_factor
+    excess    = r - period_rf
+    sharpe    = excess.mean() / excess.std() * np.sqrt(ann_factor) if excess.std() > 0 else 0
+
+    # Sortino: 초과수익 평균 / 하방 편차 → 연율화
+    neg_excess = excess[excess < 0]
+    sortino    = excess.mean() / neg_excess.std() * np.sqrt(ann_factor) if len(neg_excess) > 1 else 0
+
+    dd = (series / series.cummax() - 1)
+    mdd    = dd.min()
+    calmar = cagr / abs(mdd) if mdd != 0 else 0
+    monthly = series.resample("ME").last().pct_change().dropna()
+    win_rate = (monthly > 0).mean() if len(monthly) > 0 else 0
+    return {
+        "전략":     label,
+        "총수익률": f"{total:.1%}",
+        "CAGR":     f"{cagr:.1%}",
+        "연변동성": f"{vol:.1%}",
+        "Sharpe":   f"{sharpe:.2f}",
+        "Sortino":  f"{sortino:.2f}",
+        "Max DD":   f"{mdd:.1%}",
+        "Calmar":   f"{calmar:.2f}",
+        "월승률":   f"{win_rate:.1%}",
+    }
+
+
+def calc_metrics_matrix(values: np.ndarray, dates: pd.DatetimeIndex,
+                        rf: float = 0.03) -> pd.DataFrame:
+    """calc_metrics의 벡터화 버전 (월승률 제외, 포맷 없는 숫자 반환).
+    values: (조합 × 날짜) 가치 행렬 → 행마다 시작점 1.0 재정규화 후 지표 계산.
+    """
+    V = np.asarray(values, dtype=np.float64)
+    if V.shape[1] < 2:
+        return pd.DataFrame(index=range(V.shape[0]))
+    V = V / V[:, :1]
+    r  = V[:, 1:] / V[:, :-1] - 1
+    days = (dates[-1] - dates[0]).days
+    yr = days / 365.25
+    total = V[:, -1] - 1
+    cagr  = V[:, -1] ** (1 / max(yr, 0.01)) - 1
+
+    # 데이터 빈도 자동 감지 (calc_metrics와 동일 기준)
+    n_r = r.shape[1]
+    if n_r >= 2:
+        avg_gap = days / n_r
+        ann_factor = 12 if avg_gap > 15 else (52 if avg_gap > 3 else 252)
+    else:
+        ann_factor = 252
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        vol = r.std(axis=1, ddof=1) * np.sqrt(ann_factor)
+        excess = r - rf / ann_factor
+        ex_std = excess.std(axis=1, ddof=1)
+        sharpe = np.where(ex_std > 0, excess.mean(axis=1) / ex_std * np.sqrt(ann_factor), 0.0)
+        neg = np.where(excess < 0, excess, np.nan)
+        neg_std = np.nanstd(neg, axis=1, ddof=1)
+        sortino = np.where((excess < 0).sum(axis=1) > 1,
+                           excess.mean(axis=1) / neg_std * np.sqrt(ann_factor), 0.0)
+        mdd = (V / np.maximum.accumulate(V, axis=1) - 1).min(axis=1)
+        calmar = np.where(mdd != 0, cagr / np.abs(mdd), 0.0)
+    return pd.DataFrame({
+        "총수익률": total,
+        "CAGR":     cagr,
+        "연변동성": vol,
+        "Sharpe":   sharpe,
+        "Sortino":  sortino,
+        "Max DD":   mdd,
+        "Calmar":   calmar,
+    })
+
+
+def norm_series(s: pd.Series, ref: pd.Timestamp) -> pd.Series:
+    s = s.dropna()
+    idx = s.index[s.index >= ref]
+    if not len(idx):
+        return s
+    return s[idx] / s[idx[0]]
+
+
+# ═══════════════════════════════════════════════════════════
+# PIPELINE CACHE (단계 DAG · 지문 · 메모리 + 디스크)
+# ═══════════════════════════════════════════════════════════
+# 단계마다 입력(설정 키 + 상위 단계)을 선언하고, 지문 = 설정값 + 상위 단계 지문의 해시.
+# 설정 변경 시 바뀐 키를 입력으로 갖는 단계와 그 하위 단계만 재계산.
+# 종목별 단계(가격·펀더멘털·PIT·기술지표)는 종목 단위 지문 → 새로 필요한 종목만 계산.
+# 메모리 캐시: 호출 측 dict (Streamlit은 session_state), 디스크: PIPELINE_CACHE_DIR pickle (LRU)
+
+PIPELINE_CACHE_DIR = os.environ.get(
+    "AQL_PIPELINE_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pipeline_cache"),
+)
+PIPELINE_CACHE_MAX_MB = float(os.environ.get("AQL_PIPELINE_CACHE_MB", 4096))
+PIPELINE_VERSION = 1
+BACKTEST_STATE_FILE = os.path.join(PIPELINE_CACHE_DIR, "last_backtest.pkl")   # 확장 모드 기준 결과 (지문)
+CHECKPOINT_DIR      = os.path.join(PIPELINE_CACHE_DIR, "checkpoint")          # 중단된 실행 이어서 계산
+
+# 단계: (설정 입력 키, 상위 단계)
+PIPELINE_DAG = {
+    "universe":     (("universe", "sectors", "use_surv_fix", "start"), ()),
+    "prices":       (("start", "end"), ("universe",)),               # 종목별 (디스크 = 가격 저장소)
+    "fundamentals": ((), ("prices",)),                               # 종목별 .info (일 단위 갱신)
+    "pit":          ((), ("prices",)),                               # 종목별 분기 재무제표 (일 단위 갱신)
+    "pit_table":    ((), ("pit",)),
+    "market":       (("start", "end"), ()),                          # SPY·VIX
+    "technicals":   ((), ("prices", "market")),                      # 종목별
+    "panel":        ((), ("prices",)),
+    "backtest":     (("rebal_m", "rolling_w", "start", "end", "min_test", "min_dollar_vol",
+                      "use_next_open", "use_ensemble", "retrain_every", "retune_every",
+                      "warm_rounds"),
+                     ("universe", "prices", "fundamentals", "pit_table", "market", "technicals")),
+    "portfolio":    (PORTFOLIO_KEYS, ("backtest",)),                 # 재시뮬레이션만 (항상 실행)
+}
+
+
+def fingerprint(*parts) -> str:
+    """값 목록의 지문 (JSON 직렬화 후 SHA-1, dict 키 순서 무관)."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def frame_fingerprint(obj) -> str:
+    """DataFrame/Series 내용 해시 (인덱스·컬럼 포함). None → 빈 문자열."""
+    if obj is None:
+        return ""
+    h = pd.util.hash_pandas_object(obj, index=True).to_numpy()
+    cols = list(obj.columns) if isinstance(obj, pd.DataFrame) else [obj.name]
+    return fingerprint(hashlib.sha1(h.tobytes()).hexdigest(), cols)
+
+
+def stage_fingerprint(name: str, cfg: dict, fps: dict) -> str:
+    """단계 지문: 선언된 설정 키 값 + 상위 단계 지문."""
+    keys, deps = PIPELINE_DAG[name]
+    return fingerprint(PIPELINE_VERSION, name, {k: cfg.get(k) for k in keys}, [fps[d] for d in deps])
+
+
+def _stage_file(name: str, fp: str) -> str:
+    return os.path.join(PIPELINE_CACHE_DIR, f"{name}-{fp}.pkl")
+
+
+def _is_stage_file(fname: str) -> bool:
+    """단계 항목 파일({단계}-{지문}.pkl) 여부 — LRU 정리 대상."""
+    return fname.split("-", 1)[0] in PIPELINE_DAG
+
+
+def cached_stage(cache: dict, name: str, fp: str, fn, disk: bool = True) -> tuple:
+    """단계 실행: 메모리(지문 일치) → 디스크 → fn() 순 조회. 반환 (출력, 재계산 여부).
+    메모리는 단계마다 최신 1개만 유지."""
+    ent = cache.get(name)
+    if ent is not None and ent["fp"] == fp:
+        return ent["out"], False
+    out = _load_pickle(_stage_file(name, fp)) if disk else None
+    ran = out is None
+    if ran:
+        out = fn()
+        if disk:
+            _save_pickle(_stage_file(name, fp), out)
+    cache[name] = {"fp": fp, "out": out}
+    return out, ran
+
+
+def cached_ticker_stage(cache: dict, name: str, ticker_fps: dict, fn, disk: bool = True) -> tuple:
+    """종목별 단계: 지문이 없거나 바뀐 종목만 fn(종목 목록) → {ticker: 출력}으로 계산.
+    반환 ({ticker: 출력}, 새로 계산된 종목 수, 단계 지문).
+    fn 결과에 없는 종목(데이터 없음·실패)은 결과에서 제외하고 다음 실행 때 다시 시도."""
+    mem = cache.setdefault(name, {})
+    out, missing = {}, []
+    for t, fp in ticker_fps.items():
+        ent = mem.get(t)
+        if ent is not None and ent[0] == fp:
+            out[t] = ent[1]
+            continue
+        val = _load_pickle(_stage_file(name, fp)) if disk else None
+        if val is None:
+            missing.append(t)
+        else:
+            out[t] = val
+            mem[t] = (fp, val)
+    n_new = 0
+    if missing:
+        new = fn(missing)
+        n_new = sum(1 for t in missing if t in new)
+        for t in missing:
+            if t in new:
+                out[t] = new[t]
+                mem[t] = (ticker_fps[t], new[t])
+                if disk:
+                    _save_pickle(_stage_file(name, ticker_fps[t]), new[t])
+    out = {t: out[t] for t in ticker_fps if t in out}
+    return out, n_new, fingerprint(PIPELINE_VERSION, name, sorted(
+        (t, fp) for t, fp in ticker_fps.items() if t in out))
+
+
+def save_backtest_state(fingerprint: str, path: str = None) -> None:
+    """확장 모드 기준 결과 기록: 결과 자체는 backtest 단계 항목에 한 번만 저장되므로
+    여기에는 그 단계 지문만 남김."""
+    _save_pickle(path or BACKTEST_STATE_FILE, {"stage": "backtest", "fp": fingerprint})
+
+
+def load_backtest_state(path: str = None) -> dict | None:
+    """기록된 backtest 단계 항목의 결과 (wf_state 포함). 없거나 손상·정리됐으면 None."""
+    ref = _load_pickle(path or BACKTEST_STATE_FILE)
+    if not isinstance(ref, dict) or "fp" not in ref:
+        return None
+    return _load_pickle(_stage_file(ref["stage"], ref["fp"]))
+
+
+def prune_pipeline_cache(max_mb: float = None) -> int:
+    """파이프라인 디스크 캐시 용량 상한 적용 → 삭제 파일 수.
+    단계 항목 파일만 정리하고, 확장 모드가 가리키는 backtest 항목은 보존."""
+    ref = _load_pickle(BACKTEST_STATE_FILE)
+    keep = (os.path.basename(_stage_file(ref["stage"], ref["fp"]))
+            if isinstance(ref, dict) and "fp" in ref else None)
+    return _prune_lru_dir(PIPELINE_CACHE_DIR,
+                          PIPELINE_CACHE_MAX_MB if max_mb is None else max_mb,
+                          match=lambda f: f != keep and _is_stage_file(f))
+
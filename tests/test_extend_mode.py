@@ -0,0 +1,107 @@
+"""
+확장 모드(extend_from) ↔ 전체 재실행 동등성 테스트.
+이전 종료일까지의 입력 데이터(수정주가·PIT)가 바뀌면 이전 결과를 재사용하지 않아야 함.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+
+START, END_OLD, END_NEW = "2020-01-02", "2020-10-01", "2021-02-01"
+
+
+def _synth(n_tick: int = 12, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2018-06-01", END_NEW)
+    price_data, pit_map = {}, {}
+    qdates = pd.date_range("2018-03-31", "2020-12-31", freq="QE")
+    rows = ["Total Revenue", "Gross Profit", "Operating Income", "Net Income"]
+    for k in range(n_tick):
+        t = f"T{k:02d}"
+        c = 50 * np.exp(np.cumsum(rng.normal(0.0004, 0.02, len(idx))))
+        o = c * (1 + rng.normal(0, 0.005, len(idx)))
+        price_data[t] = pd.DataFrame({
+            "Open": o, "High": np.maximum(o, c) * 1.01, "Low": np.minimum(o, c) * 0.99,
+            "Close": c, "Volume": rng.integers(1e5, 1e6, len(idx)).astype(float),
+        }, index=idx)
+        inc = pd.DataFrame(rng.normal(1, 0.3, (len(rows), len(qdates))) * 1e8,
+                           index=rows, columns=qdates)
+        pit_map[t] = {"income": inc, "balance": pd.DataFrame(), "cashflow": pd.DataFrame(),
+                      "annual_income": pd.DataFrame(), "annual_balance": pd.DataFrame(),
+                      "annual_cashflow": pd.DataFrame()}
+    spy = pd.Series(300 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(idx)))), index=idx)
+    vix = pd.Series(15 + np.abs(rng.normal(0, 3, len(idx))), index=idx)
+    fund_map = {t: {"shares": 1e7 * (1 + k)} for k, t in enumerate(price_data)}
+    sector_map = {t: "ABC"[k % 3] for k, t in enumerate(price_data)}
+    return price_data, pit_map, spy, vix, fund_map, sector_map
+
+
+def _run(data, end, extend_from=None):
+    price_data, pit_map, spy, vix, fund_map, sector_map = data
+    prices = {t: df.loc[:end] for t, df in price_data.items()}
+    spy, vix = spy.loc[:end], vix.loc[:end]
+    rebal = qe.generate_rebalance_dates(pd.Timestamp(START).to_pydatetime(),
+                                        pd.Timestamp(end).to_pydatetime(), 1)
+    return qe.run_backtest(
+        prices, fund_map, qe.calc_panel_technical(prices, spy_close=spy), rebal,
+        n_stocks=4, tc_pct=0.3, rolling_win=3, progress=lambda *a: None, pit_map=pit_map,
+        use_ensemble=False, use_next_open=True, spy_close=spy, vix_close=vix,
+        sector_map=sector_map, extend_from=extend_from)
+
+
+def _assert_same(a: dict, b: dict):
+    np.testing.assert_array_equal(a["port_values"], b["port_values"])
+    pd.testing.assert_frame_equal(a["ic_df"], b["ic_df"])
+    assert [h["selected"] for h in a["rebal_hist"]] == [h["selected"] for h in b["rebal_hist"]]
+    for x, y in zip(a["preds"]["rows"], b["preds"]["rows"]):
+        pd.testing.assert_series_equal(x["pred"], y["pred"])
+
+
+def _readjust(data):
+    """이전 종료일 전 구간 OHLC를 절반 종목만 ×0.97 (배당 수정주가 재조정)."""
+    price_data = {}
+    for k, (t, df) in enumerate(data[0].items()):
+        if k % 2:
+            df = df.copy()
+            early = df.index < "2020-06-15"
+            df.loc[early, ["Open", "High", "Low", "Close"]] *= 0.97
+        price_data[t] = df
+    return (price_data, *data[1:])
+
+
+def _restate_pit(data):
+    """이전 종료일 전에 반영된 분기 실적 정정."""
+    pit_map = copy.deepcopy(data[1])
+    for stmts in pit_map.values():
+        inc = stmts["income"]
+        early = [c for c in inc.columns if c < pd.Timestamp("2020-03-31")]
+        inc[early] = inc[early] * 1.5
+    return (data[0], pit_map, *data[2:])
+
+
+@pytest.fixture(scope="module")
+def data():
+    return _synth()
+
+
+@pytest.fixture(scope="module")
+def prev(data):
+    return _run(data, END_OLD)
+
+
+def test_extend_unchanged_data_reuses_windows(data, prev):
+    ext = _run(data, END_NEW, extend_from=prev)
+    assert ext["train_stats"]["n_extended"] > 0
+    _assert_same(ext, _run(data, END_NEW))
+
+
+@pytest.mark.parametrize("change", [_readjust, _restate_pit])
+def test_extend_changed_data_matches_full_run(data, prev, change):
+    new = change(data)
+    ext = _run(new, END_NEW, extend_from=prev)
+    assert ext["train_stats"]["n_extended"] == 0
+    _assert_same(ext, _run(new, END_NEW))
@@ -0,0 +1,91 @@
+"""
+가격 저장소 증분 조회 테스트 — yfinance 대신 가짜 배치 다운로더 사용.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+
+START, END = "2021-01-04", "2021-07-01"
+
+
+def _ohlcv(idx, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    c = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(idx)))) * scale
+    return pd.DataFrame({"Open": c, "High": c * 1.01, "Low": c * 0.99,
+                         "Close": c, "Volume": 1e6}, index=idx)
+
+
+class FakeYF:
+    """종목별 전체 이력에서 요청 구간만 잘라 반환. drop: 다음 배치 응답에서 한 번 누락할 종목."""
+
+    def __init__(self, history: dict):
+        self.history = history
+        self.drop = set()
+        self.calls = []
+
+    def __call__(self, tickers, start, end):
+        self.calls.append((list(tickers), start, end))
+        out = {}
+        for t in tickers:
+            if len(tickers) > 1 and t in self.drop:
+                self.drop.discard(t)
+                continue
+            df = self.history.get(t)
+            if df is None:
+                continue
+            sub = df.loc[(df.index >= start) & (df.index < end)]
+            if len(sub):
+                out[t] = sub
+        return out
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(qe, "PRICE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(qe, "CLOUD_DELAY", 0)
+    idx = pd.bdate_range("2020-01-01", "2021-12-31")
+    fake = FakeYF({t: _ohlcv(idx, seed=k) for k, t in enumerate(["AAA", "BBB", "CCC"])})
+    monkeypatch.setattr(qe, "_yf_download_batch", fake)
+    return fake
+
+
+def _planned(tickers):
+    return {t for _, _, chunk in qe.plan_price_fetches(tickers, START, END) for t in chunk}
+
+
+def test_batch_omission_leaves_no_hole(store):
+    """배치에서 한 종목이 빠져도(일시 오류) 조회 완료로 기록되지 않고 단독 재요청으로 채워짐."""
+    tickers = ["AAA", "BBB", "CCC"]
+    store.drop = {"BBB"}
+    qe.update_price_store(tickers, START, END)
+    assert (["BBB"], START, END) in store.calls
+    df = qe.load_stored_prices("BBB")
+    ref = store.history["BBB"]
+    assert df.index.equals(ref.loc[(ref.index >= START) & (ref.index < END)].index)
+    assert _planned(tickers) == set()
+
+
+def test_delisted_ticker_recorded_once(store):
+    """데이터가 없는 종목은 단독 재요청 확인 후 _empty에 기록 → 다음 실행에서 재요청 없음."""
+    tickers = ["AAA", "DEAD"]
+    qe.update_price_store(tickers, START, END)
+    assert qe.load_stored_prices("DEAD") is None
+    assert "DEAD" in qe._load_coverage()["_empty"]
+    assert _planned(tickers) == set()
+
+
+def test_refetch_range_is_union_of_batches(store):
+    """한 번의 갱신에서 앞·뒤 두 배치 모두 수정주가 변경을 감지하면 재다운로드 구간은 합집합."""
+    qe.update_price_store(["AAA"], "2021-03-01", "2021-04-01")
+    store.history["AAA"] = store.history["AAA"] * 0.9
+    plan = qe.plan_price_fetches(["AAA"], "2021-01-04", "2021-06-01")
+    assert len(plan) == 2   # 앞 구멍·뒤 구멍 별도 요청
+    qe.update_price_store(["AAA"], "2021-01-04", "2021-06-01")
+    df = qe.load_stored_prices("AAA")
+    ref = store.history["AAA"]
+    assert df.index[0] == pd.Timestamp("2021-01-04") and df.index[-1] < pd.Timestamp("2021-06-01")
+    np.testing.assert_allclose(df["Close"], ref.loc[df.index, "Close"])
+    assert not qe.plan_price_fetches(["AAA"], "2021-01-04", "2021-06-01")
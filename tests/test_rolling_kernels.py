@@ -0,0 +1,127 @@
+"""
+ROLLING KERNELS ↔ pandas rolling(n) / ewm(adjust=False) 동등성 테스트.
+결측 구간(앞·중간·뒤), 동일값 구간, 시계열보다 긴 창, min_periods=n 규칙을 함께 확인.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+
+WINDOWS = (1, 2, 5, 14, 60)
+RTOL, ATOL = 1e-7, 1e-8   # 분산 ≈ 0 창은 pandas 쪽도 상쇄 오차 (값 규모 ~50)
+
+
+def _panel(n_rows: int = 300, seed: int = 0) -> pd.DataFrame:
+    """열마다 다른 결측·동일값 패턴을 가진 가격형 패널."""
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2020-01-01", periods=n_rows)
+    cols = {}
+    for k in range(8):
+        cols[f"c{k}"] = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n_rows)))
+    df = pd.DataFrame(cols, index=idx)
+    df.iloc[:40, 1] = np.nan                    # 늦은 상장
+    df.iloc[-25:, 2] = np.nan                   # 상장폐지
+    df.iloc[100:103, 3] = np.nan                # 중간 결측 (짧은 구간)
+    df.iloc[150:220, 4] = np.nan                # 중간 결측 (창보다 긴 구간)
+    df.iloc[rng.choice(n_rows, n_rows // 10, replace=False), 5] = np.nan   # 흩어진 결측
+    df.iloc[60:140, 6] = 42.0                   # 동일값 구간 (분산 0)
+    df.iloc[:, 7] = np.nan                      # 전부 결측
+    return df
+
+
+def _check(got, want):
+    got = np.asarray(got, dtype=np.float64)
+    want = np.asarray(want, dtype=np.float64)
+    np.testing.assert_array_equal(np.isnan(got), np.isnan(want))
+    np.testing.assert_allclose(got, want, rtol=RTOL, atol=ATOL, equal_nan=True)
+
+
+@pytest.fixture(scope="module")
+def panel():
+    return _panel()
+
+
+@pytest.mark.parametrize("n", WINDOWS)
+@pytest.mark.parametrize("name", ["sum", "mean", "max", "min"])
+def test_rolling_basic(panel, name, n):
+    got = getattr(qe, f"rolling_{name}")(panel, n)
+    want = getattr(panel.rolling(n, min_periods=n), name)()
+    assert isinstance(got, pd.DataFrame)
+    _check(got, want)
+
+
+@pytest.mark.parametrize("n", WINDOWS[1:])
+@pytest.mark.parametrize("ddof", [0, 1])
+def test_rolling_var_std(panel, n, ddof):
+    _check(qe.rolling_var(panel, n, ddof), panel.rolling(n).var(ddof=ddof))
+    _check(qe.rolling_std(panel, n, ddof), panel.rolling(n).std(ddof=ddof))
+
+
+@pytest.mark.parametrize("n", WINDOWS[1:])
+def test_rolling_cov(panel, n):
+    other = panel.pct_change(fill_method=None)
+    bench = panel["c0"].pct_change()
+    got = qe.rolling_cov(other, bench.to_numpy()[:, None], n)
+    want = other.rolling(n).cov(bench)
+    _check(got, want)
+
+
+@pytest.mark.parametrize("n", (1, 5, 20))
+def test_rolling_mad(panel, n):
+    want = panel.rolling(n).apply(lambda x: np.abs(x - x.mean()).mean(), raw=True)
+    _check(qe.rolling_mad(panel, n), want)
+
+
+@pytest.mark.parametrize("alpha", (1 / 14, 2 / 13, 0.5, 1.0))
+def test_ewm_mean(panel, alpha):
+    _check(qe.ewm_mean(panel, alpha), panel.ewm(alpha=alpha, adjust=False).mean())
+
+
+def test_wilder_and_span(panel):
+    _check(qe.wilder_ema(panel, 14), panel.ewm(alpha=1 / 14, adjust=False).mean())
+    _check(qe.ema_span(panel, 12), panel.ewm(span=12, adjust=False).mean())
+
+
+def test_flat_window_exact(panel):
+    """동일값 창: 평균은 그 값 그대로, 분산·표준편차·MAD는 정확히 0."""
+    n = 20
+    flat = slice(60 + n - 1, 140)
+    col = panel["c6"]
+    assert (qe.rolling_mean(col, n).iloc[flat] == 42.0).all()
+    assert (qe.rolling_var(col, n).iloc[flat] == 0.0).all()
+    assert (qe.rolling_std(col, n).iloc[flat] == 0.0).all()
+    assert (qe.rolling_mad(col, n).iloc[flat] == 0.0).all()
+
+
+@pytest.mark.parametrize("name", ["sum", "mean", "var", "std", "max", "min", "mad"])
+def test_window_longer_than_series(name):
+    s = _panel(n_rows=10)["c0"]
+    got = getattr(qe, f"rolling_{name}")(s, 30)
+    assert isinstance(got, pd.Series) and got.index.equals(s.index)
+    assert got.isna().all()
+
+
+def test_min_periods_is_window(panel):
+    """창 안 결측이 하나라도 있으면 NaN (pandas min_periods=n), 완전한 창부터 값."""
+    n = 5
+    s = panel["c3"]
+    got = qe.rolling_mean(s, n)
+    assert got.iloc[:n - 1].isna().all() and got.iloc[n - 1:100].notna().all()
+    assert got.iloc[100:103 + n - 1].isna().all()
+    assert got.iloc[103 + n - 1:].notna().all()
+    partial = s.rolling(n, min_periods=1).mean()
+    assert not np.allclose(got.iloc[100:103 + n - 1].fillna(0), partial.iloc[100:103 + n - 1])
+
+
+def test_input_types(panel):
+    """Series → Series, ndarray → ndarray (같은 값)."""
+    s = panel["c0"]
+    arr = s.to_numpy()
+    by_series = qe.rolling_std(s, 14)
+    by_array = qe.rolling_std(arr, 14)
+    assert isinstance(by_series, pd.Series) and by_series.name == "c0"
+    assert isinstance(by_array, np.ndarray) and by_array.shape == arr.shape
+    _check(by_series, by_array)
+    _check(qe.ewm_mean(arr, 0.1), qe.ewm_mean(s, 0.1))
@@ -0,0 +1,79 @@
+"""
+sweep_portfolio (조합 × 종목 벡터화) ↔ simulate_portfolio + calc_metrics_matrix 동등성 테스트.
+두 경로의 종목 선정·버퍼·가중치·턴오버 규칙이 어긋나면 실패.
+"""
+
+import copy
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+from test_extend_mode import END_OLD, _run, _synth
+
+GRID = {
+    "n_stocks":            [2, 4],
+    "tc_pct":              [0.1, 0.5],
+    "use_turnover_buffer": [False, True],
+    "turnover_buffer_pct": [0.05, 0.3],
+    "use_inv_vol_weight":  [False, True],
+    "use_mom_filter":      [False, True],
+}
+METRICS = ["총수익률", "CAGR", "연변동성", "Sharpe", "Sortino", "Max DD", "Calmar"]
+
+
+@pytest.fixture(scope="module")
+def preds():
+    return _run(_synth(), END_OLD)["preds"]
+
+
+def _reference(preds: dict) -> pd.DataFrame:
+    """조합별 simulate_portfolio 실행 → sweep_portfolio와 같은 열 구성."""
+    rows = []
+    start = preds["rows"][0]["date"]
+    for combo in itertools.product(*GRID.values()):
+        cfg = dict(zip(GRID, combo))
+        sim = qe.simulate_portfolio(preds, **cfg)
+        idx = pd.DatetimeIndex(sim["port_dates"])
+        act = idx >= start
+        met = qe.calc_metrics_matrix(np.asarray(sim["port_values"])[None, act], idx[act])
+        hist = sim["rebal_hist"]
+        rows.append({**cfg, **met.iloc[0].to_dict(),
+                     "평균턴오버": np.mean([h["turnover"] for h in hist]),
+                     "적중률": np.nanmean([h["precision"] for h in hist])})
+    return pd.DataFrame(rows)
+
+
+def _assert_sweep_matches(preds: dict):
+    got = qe.sweep_portfolio(preds, GRID)
+    want = _reference(preds)
+    assert len(got) == len(want)
+    keys = list(GRID)
+    pd.testing.assert_frame_equal(got[keys].reset_index(drop=True), want[keys],
+                                  check_dtype=False)
+    for col in METRICS + ["평균턴오버", "적중률"]:
+        np.testing.assert_allclose(got[col].to_numpy(np.float64), want[col].to_numpy(np.float64),
+                                   rtol=1e-10, atol=1e-12, equal_nan=True, err_msg=col)
+
+
+def test_sweep_matches_simulate(preds):
+    _assert_sweep_matches(preds)
+
+
+def test_sweep_matches_simulate_with_nan_scores(preds):
+    """결측 예측 점수: nlargest처럼 점수 있는 후보 뒤 순위 (후보 밖 종목보다는 앞),
+    후보 부족 판단은 결측 포함 개수."""
+    rng = np.random.default_rng(1)
+    p = copy.copy(preds)
+    p["rows"] = []
+    for k, row in enumerate(preds["rows"]):
+        pred = row["pred"].copy()
+        if k % 3 == 1:
+            pred[rng.random(len(pred)) < 0.3] = np.nan
+        elif k % 3 == 2:
+            pred.iloc[:len(pred) // 2] = np.nan   # 점수 상위 후보가 결측
+        p["rows"].append({**row, "pred": pred})
+    p["rows"][-1]["pred"] = p["rows"][-1]["pred"] * np.nan   # 전 종목 결측 → 앞 종목부터 선정
+    _assert_sweep_matches(p)
@@ -0,0 +1,68 @@
+"""
+스트리밍 지표 상태: init_tech_state + update_tech_state k봉 ↔ calc_all_technical 전체 재계산.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+
+RTOL, ATOL = 1e-7, 1e-9   # 창 누적합·EMA 증분 갱신의 부동소수 오차
+
+
+def _ohlcv(n: int = 700, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2019-01-01", periods=n)
+    c = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+    o = c * (1 + rng.normal(0, 0.005, n))
+    df = pd.DataFrame({
+        "Open": o, "High": np.maximum(o, c) * (1 + np.abs(rng.normal(0, 0.01, n))),
+        "Low": np.minimum(o, c) * (1 - np.abs(rng.normal(0, 0.01, n))),
+        "Close": c, "Volume": rng.integers(1e5, 1e6, n).astype(float),
+    }, index=idx)
+    spy = pd.Series(300 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, n))), index=idx)
+    return df, spy
+
+
+@pytest.mark.parametrize("k", [1, 5, 40])
+@pytest.mark.parametrize("with_spy", [True, False])
+@pytest.mark.parametrize("nan_run", [False, True])
+def test_roll_forward_matches_full_recompute(k, with_spy, nan_run):
+    df, spy = _ohlcv()
+    if nan_run:
+        df.iloc[-30:-27, :4] = np.nan   # 갱신 구간(k=40) 안의 가격 결측 봉
+    spy = spy if with_spy else None
+    state = qe.init_tech_state(df.iloc[:-k], spy_close=spy)
+    state = json.loads(json.dumps(state))   # 디스크 저장·복원 경로와 동일하게
+    rows = [qe.update_tech_state(state, d, bar, spy.asof(d) if spy is not None else np.nan)
+            for d, bar in df.iloc[-k:].iterrows()]
+    got = pd.DataFrame(rows, index=df.index[-k:])
+    want = qe.calc_all_technical(df, spy_close=spy).iloc[-k:]
+    assert list(got.columns) == list(want.columns)
+    for col in want.columns:
+        a, b = got[col].to_numpy(np.float64), want[col].to_numpy(np.float64)
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=col)
+        np.testing.assert_allclose(a, b, rtol=RTOL, atol=ATOL, equal_nan=True, err_msg=col)
+
+
+def test_source_fingerprint_tracks_history():
+    """마지막 날짜가 같아도 수정주가 재조정·SPY 이력 변경 시 구성 이력 지문이 달라짐."""
+    df, spy = _ohlcv()
+    state = qe.init_tech_state(df, spy_close=spy)
+    assert state["source"] == qe.tech_state_source(df, spy)
+    # 종목 마지막 날짜 이후 SPY 봉 추가는 무관
+    spy_ext = pd.concat([spy, pd.Series([400.0], index=[df.index[-1] + pd.offsets.BDay()])])
+    assert state["source"] == qe.tech_state_source(df, spy_ext)
+
+    adj = df.copy()
+    adj.iloc[:100, :4] *= 0.98   # 배당 수정주가 재조정 (마지막 날짜 동일)
+    assert state["source"] != qe.tech_state_source(adj, spy)
+    spy_adj = spy.copy()
+    spy_adj.iloc[:50] *= 0.99
+    assert state["source"] != qe.tech_state_source(df, spy_adj)
+
+    qe.update_tech_state(state, df.index[-1] + pd.offsets.BDay(), df.iloc[-1], spy.iloc[-1])
+    assert state["source"] is None
@@ -0,0 +1,74 @@
+"""
+calc_panel_technical (종목 패널 일괄 계산) ↔ calc_all_technical (종목별 계산) 동등성 테스트.
+늦은 상장(SPY보다 짧은 이력)·상장폐지·거래일 누락·가격 결측 구간·거래량 0 구간을 포함.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+
+RTOL, ATOL = 1e-9, 1e-12
+GROUPS = {"기술지표", "모멘텀", "리스크"}
+
+
+def _prices(seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range("2019-01-01", "2021-12-31")
+    out = {}
+    for k in range(7):
+        c = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(idx))))
+        o = c * (1 + rng.normal(0, 0.005, len(idx)))
+        df = pd.DataFrame({
+            "Open": o, "High": np.maximum(o, c) * (1 + np.abs(rng.normal(0, 0.01, len(idx)))),
+            "Low": np.minimum(o, c) * (1 - np.abs(rng.normal(0, 0.01, len(idx)))),
+            "Close": c, "Volume": rng.integers(1e5, 1e6, len(idx)).astype(float),
+        }, index=idx)
+        out[f"T{k}"] = df
+    out["T1"] = out["T1"].loc["2020-03-02":]                  # 늦은 상장 (SPY보다 짧은 이력)
+    out["T2"] = out["T2"].loc[:"2021-04-30"]                  # 상장폐지
+    out["T3"] = out["T3"].drop(out["T3"].index[200:215])      # 거래일 누락 (행 없음)
+    out["T4"].iloc[300:330, :4] = np.nan                      # 가격 결측 구간 (행은 있음)
+    out["T5"].iloc[400:460, :4] = 42.0                        # 동일가 구간 (분산 0)
+    out["T5"].iloc[400:460, 4] = 0.0                          # 거래량 0 구간
+    out["T6"] = out["T6"].iloc[:150]                          # 200일 미만 이력
+    spy = pd.Series(300 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(idx)))), index=idx)
+    return out, spy
+
+
+@pytest.fixture(scope="module")
+def prices():
+    return _prices()
+
+
+@pytest.mark.parametrize("chunk", [3, qe.TECH_PANEL_CHUNK])
+@pytest.mark.parametrize("with_spy", [True, False])
+def test_panel_matches_per_ticker(prices, chunk, with_spy):
+    price_data, spy = prices
+    spy = spy if with_spy else None
+    panel = qe.calc_panel_technical(price_data, spy_close=spy, chunk=chunk)
+    assert set(panel) == set(price_data)
+
+    want_cols = [c for c, m in qe.FEATURE_META.items() if m["group"] in GROUPS]
+    for t, df in price_data.items():
+        ref = qe.calc_all_technical(df, spy_close=spy)
+        got = panel[t]
+        assert got.index.equals(ref.index)
+        assert list(got.columns) == list(ref.columns)
+        assert set(want_cols) <= set(got.columns)
+        for col in want_cols:
+            a, b = got[col].to_numpy(np.float64), ref[col].to_numpy(np.float64)
+            np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=f"{t} {col}")
+            np.testing.assert_allclose(a, b, rtol=RTOL, atol=ATOL, equal_nan=True,
+                                       err_msg=f"{t} {col}")
+
+
+def test_short_history_uses_own_spy_window(prices):
+    """늦게 상장한 종목의 상대강도·베타는 자기 거래일에 맞춘 SPY로 계산."""
+    price_data, spy = prices
+    panel = qe.calc_panel_technical(price_data, spy_close=spy)
+    t1 = panel["T1"]
+    assert t1.index[0] == price_data["T1"].index[0]
+    assert t1["RS_Market_1m"].iloc[:21].isna().all() and t1["RS_Market_1m"].iloc[21:].notna().any()
+    assert t1["Beta_60d"].iloc[:60].isna().all() and t1["Beta_60d"].iloc[60:].notna().all()
@@ -0,0 +1,92 @@
+"""
+run_backtest 워크포워드 학습 경계 조건 테스트.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import quant_engine as qe
+from test_extend_mode import _assert_same, _synth
+
+END = "2021-02-01"
+
+
+@pytest.fixture(scope="module")
+def data():
+    return _synth()
+
+
+def _run(data, start, end=END, **kw):
+    price_data, pit_map, spy, vix, fund_map, sector_map = data
+    rebal = qe.generate_rebalance_dates(pd.Timestamp(start).to_pydatetime(),
+                                        pd.Timestamp(end).to_pydatetime(), 1)
+    opts = dict(n_stocks=4, tc_pct=0.3, rolling_win=3, progress=lambda *a: None,
+                pit_map=pit_map, use_ensemble=False, use_next_open=True, spy_close=spy,
+                vix_close=vix, sector_map=sector_map)
+    opts.update(kw)
+    return qe.run_backtest(price_data, fund_map, qe.calc_panel_technical(price_data, spy_close=spy),
+                           rebal, **opts)
+
+
+def test_start_before_price_history(data):
+    """첫 리밸런싱 날짜들이 가격 이력 시작 전(빈 스냅샷)이어도 학습 열을 정상 구성."""
+    res = _run(data, "2018-02-01", end="2019-06-01")
+    assert len(res["ic_df"]) > 0
+    assert np.isfinite(res["port_values"]).all()
+
+
+def _lgbm_fit(n_jobs: int) -> int:
+    from lightgbm import LGBMRegressor
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 20))
+    y = X[:, 0] + rng.normal(size=2000)
+    LGBMRegressor(n_estimators=30, n_jobs=n_jobs, verbose=-1).fit(X, y)
+    return n_jobs
+
+
+class _Interrupt(Exception):
+    pass
+
+
+def _stop_after(k: int):
+    """학습 윈도우 k개 완료 보고 후 예외 → 세션 중단 재현."""
+    seen = []
+
+    def progress(frac, msg=""):
+        if "윈도우" in msg:
+            seen.append(msg)
+            if len(seen) >= k:
+                raise _Interrupt(msg)
+    return progress
+
+
+@pytest.mark.parametrize("opts", [
+    {},
+    {"use_ensemble": True, "warm_rounds": 20},
+], ids=["rf", "warm"])
+def test_checkpoint_resume_matches_uninterrupted(data, tmp_path, opts):
+    """k개 윈도우 후 중단 → 같은 체크포인트로 재실행한 결과가 중단 없는 실행과 동일."""
+    start, end = "2019-06-03", "2020-06-01"
+    full = _run(data, start, end, **opts)
+    ckpt = str(tmp_path / "ckpt")
+    with pytest.raises(_Interrupt):
+        _run(data, start, end, checkpoint=ckpt, checkpoint_every=1,
+             progress=_stop_after(3), **opts)
+    resumed = _run(data, start, end, checkpoint=ckpt, checkpoint_every=1, **opts)
+    assert resumed["train_stats"]["n_resumed"] >= 2
+    _assert_same(resumed, full)
+    assert not qe.load_checkpoint(ckpt, None)
+
+
+def test_worker_pool_after_parent_openmp_fit():
+    """부모가 n_jobs > 1로 LightGBM을 학습한 뒤에도 워커의 다중 스레드 학습이 교착되지 않음."""
+    pytest.importorskip("lightgbm")
+    _lgbm_fit(2)
+    ex = qe._wf_executor(2)
+    try:
+        assert ex.submit(_lgbm_fit, 2).result(timeout=60) == 2
+    finally:
+        for p in list(getattr(ex, "_processes", {}).values()):
+            p.kill()   # 교착 시 테스트 프로세스가 종료 대기에 묶이지 않도록
+        ex.shutdown(wait=False, cancel_futures=True)